@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
+from supabase import AClient
 from app.db.supabase import get_supabase
+from app.services.profile_cache import profile_cache
 
 router = APIRouter()
 
@@ -17,12 +19,10 @@ class SignUpRequest(BaseModel):
 
 
 @router.post("/login")
-async def login(request: LoginRequest):
+async def login(request: LoginRequest, supabase: AClient = Depends(get_supabase)):
     """Authenticate user with email and password."""
-    supabase = get_supabase()
-    
     try:
-        response = supabase.auth.sign_in_with_password({
+        response = await supabase.auth.sign_in_with_password({
             "email": request.email,
             "password": request.password
         })
@@ -36,13 +36,11 @@ async def login(request: LoginRequest):
 
 
 @router.post("/signup")
-async def signup(request: SignUpRequest):
+async def signup(request: SignUpRequest, supabase: AClient = Depends(get_supabase)):
     """Register a new user."""
-    supabase = get_supabase()
-    
     try:
         # Create auth user
-        auth_response = supabase.auth.sign_up({
+        auth_response = await supabase.auth.sign_up({
             "email": request.email,
             "password": request.password
         })
@@ -52,10 +50,12 @@ async def signup(request: SignUpRequest):
             # The RLS policy expects auth.uid() which is only available in user context
             # Using service key, we need to insert directly
             try:
-                supabase.table("user_profiles").insert({
+                await supabase.table("user_profiles").insert({
                     "user_id": auth_response.user.id,
                     "phone_number": request.phone_number
                 }).execute()
+                # Drop any cached "no profile" entry for this user
+                profile_cache.invalidate(auth_response.user.id)
             except Exception as profile_error:
                 # If profile creation fails, we still return success
                 # Profile can be created on first login
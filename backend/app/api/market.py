@@ -1,15 +1,17 @@
 """
 Market data API endpoints
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Header
 from typing import List, Optional
 from app.services.yahoo_finance_service import YahooFinanceService
+from app.services.etag import etag_matches, make_etag, not_modified, tagged_json
 
 router = APIRouter()
 
 @router.get("/prices")
 async def get_crypto_prices(
-    symbols: str = Query(..., description="Comma-separated list of crypto symbols (e.g., ETH,BTC,USDC)")
+    symbols: str = Query(..., description="Comma-separated list of crypto symbols (e.g., ETH,BTC,USDC)"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Get real-time prices for multiple cryptocurrencies from Yahoo Finance
@@ -21,17 +23,21 @@ async def get_crypto_prices(
         if not prices:
             raise HTTPException(status_code=404, detail="No price data found")
         
-        return {
+        etag = make_etag("prices", list(prices), YahooFinanceService.price_versions(list(prices)))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        return tagged_json({
             "success": True,
             "data": prices,
             "count": len(prices)
-        }
+        }, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching prices: {str(e)}")
 
 
 @router.get("/price/{symbol}")
-async def get_crypto_price(symbol: str):
+async def get_crypto_price(symbol: str, if_none_match: Optional[str] = Header(None)):
     """
     Get real-time price for a single cryptocurrency
     """
@@ -41,10 +47,14 @@ async def get_crypto_price(symbol: str):
         if not price_data:
             raise HTTPException(status_code=404, detail=f"Price data not found for {symbol}")
         
-        return {
+        etag = make_etag("price", symbol.upper(), YahooFinanceService.price_versions([symbol]))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        return tagged_json({
             "success": True,
             "data": price_data
-        }
+        }, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching price: {str(e)}")
 
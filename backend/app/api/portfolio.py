@@ -1,207 +1,341 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 from pydantic import BaseModel
-from typing import List, Optional
-from app.services.yahoo_finance_service import YahooFinanceService
+from typing import Dict, List, Optional
+from datetime import datetime
+from supabase import AClient
 from app.db.supabase import get_supabase
-from services.token_service import token_service
+from app.services.profile_cache import profile_cache
+from app.services.portfolio_history import portfolio_history
+from app.services.portfolio_context import INPUTS, PortfolioContext
+from app.services.portfolio_deltas import portfolio_deltas
+from app.services.etag import etag_matches, make_etag, not_modified, tagged_json
 
 router = APIRouter()
 
+# Sections of /overview and the context inputs each one is built from
+OVERVIEW_SECTIONS = {
+    "summary": ("profile", "holdings", "stats"),
+    "tokens": ("prices", "holdings"),
+    "market": ("prices",),
+    "stats": ("stats",),
+    "transactions": ("recent_transactions",)
+}
+
+
+def _summary_section(user_id: str, profile: dict, holdings: tuple, stats: Optional[dict]) -> dict:
+    _, portfolio_data, balance_source = holdings
+    stats = stats or {}
+    portfolio_value = portfolio_data.get('total_value', 0)
+    total_deposits_usd = float(stats.get("total_deposits", 0))
+    total_withdrawals_usd = float(stats.get("total_withdrawals", 0))
+    net_deposits_usd = total_deposits_usd - total_withdrawals_usd
+    pnl_usd = portfolio_value - net_deposits_usd
+    
+    return {
+        "user_id": user_id,
+        "wallet_address": profile.get("starknet_address") or "Not connected",
+        
+        # Portfolio Value (from on-chain balances or the backend token service)
+        "total_value_usd": portfolio_value,
+        "balance_source": balance_source,
+        
+        # Deposits/Withdrawals
+        "total_deposits_usd": total_deposits_usd,
+        "total_withdrawals_usd": total_withdrawals_usd,
+        "net_deposits_usd": net_deposits_usd,
+        
+        # P&L Metrics
+        "pnl_usd": pnl_usd,
+        "pnl_percentage": (pnl_usd / net_deposits_usd * 100) if net_deposits_usd > 0 else 0,
+        
+        # Additional Data
+        "risk_score": profile.get("risk_tolerance", 5),
+        "last_sync": profile.get("last_balance_sync")
+    }
+
+
+def _token_section(holdings: tuple, market_prices: Dict[str, dict]) -> List[dict]:
+    """Token holdings with the values computed by the valuation."""
+    tokens, portfolio_data, _ = holdings
+    return [
+        {
+            **token,
+            'price': holding['price'],
+            'value': holding['value'],
+            'change24h': market_prices.get(token['symbol'], {}).get('change24h', 0)
+        }
+        for token, holding in zip(tokens, portfolio_data['holdings'])
+    ]
+
+
+def _market_section(market_prices: Dict[str, dict]) -> dict:
+    eth = market_prices.get('ETH') or {}
+    return {
+        "market_prices": market_prices,
+        "eth_price_usd": eth.get('price', 0),
+        "eth_price_change_24h": eth.get('change24h', 0)
+    }
+
+
+def _stats_section(stats: Optional[dict]) -> dict:
+    if not stats or not stats["total_transactions"]:
+        return {"total_transactions": 0, "total_trades": 0, "successful_trades": 0, "success_rate": 0}
+    total_trades = stats["total_trades"]
+    successful_trades = stats["successful_trades"]
+    return {
+        "total_transactions": stats["total_transactions"],
+        "total_trades": total_trades,
+        "successful_trades": successful_trades,
+        "success_rate": (successful_trades / total_trades * 100) if total_trades else 0
+    }
+
+
+def _record_snapshot(user_id: str, holdings: tuple):
+    """Record a snapshot for the value history (throttled, written in the background)."""
+    tokens, portfolio_data, _ = holdings
+    portfolio_history.record(
+        user_id,
+        portfolio_data.get('total_value', 0),
+        {token['symbol']: token['balance'] for token in tokens}
+    )
+
 
 @router.get("/")
-async def get_portfolio(user_id: str = None):
+async def get_portfolio(
+    user_id: str = None,
+    if_none_match: Optional[str] = Header(None),
+    supabase: AClient = Depends(get_supabase)
+):
     """
     Get user's complete portfolio data from backend token service and real-time market prices.
     Combines:
-    - Token balances from backend service
+    - Token balances (on-chain when a wallet is connected, else the backend service)
     - Transaction history from Supabase
     - Real-time crypto prices from Yahoo Finance
+    
+    Responds 304 when If-None-Match carries the current ETag, which is
+    derived from the versions of those inputs.
     """
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     
-    supabase = get_supabase()
-    
     try:
-        # 1. Get user's profile
-        try:
-            profile = supabase.table("user_profiles").select("*").eq(
-                "user_id", user_id
-            ).single().execute()
-            
-            if not profile.data:
-                # User not found, create default response
-                profile_data = {"risk_tolerance": 5, "starknet_address": None}
-            else:
-                profile_data = profile.data
-        except Exception as profile_error:
-            # Profile doesn't exist, use defaults
-            print(f"Profile not found for user {user_id}: {profile_error}")
-            profile_data = {"risk_tolerance": 5, "starknet_address": None}
-        
-        wallet_address = profile_data.get("starknet_address")
-        
-        # 2. Get real-time market prices from Yahoo Finance
-        market_prices = YahooFinanceService.get_multiple_prices(['ETH', 'BTC', 'USDC', 'USDT', 'ADA', 'SOL', 'BNB', 'DOT', 'DOGE', 'MATIC'])
-        eth_price = market_prices.get('ETH', {}).get('price', 0)
+        context = PortfolioContext(supabase, user_id)
+        etag = make_etag("portfolio", user_id, await context.version())
+        if etag_matches(if_none_match, etag):
+            # Nothing changed: skip the balance reads, transaction query and serialization
+            return not_modified(etag)
         
-        # 3. Get tokens from backend service
-        tokens = token_service.get_all_tokens()
-        
-        # Create price dict for portfolio calculation
-        price_dict = {symbol: data.get('price', 0) for symbol, data in market_prices.items()}
-        portfolio_data = token_service.get_portfolio_value(price_dict)
-        portfolio_value = portfolio_data.get('total_value', 0)
-        
-        # 4. Get recent transactions from Supabase
-        transactions = supabase.table("transaction_log").select("*").eq(
-            "user_id", user_id
-        ).order("timestamp", desc=True).limit(10).execute()
-        
-        # 5. Calculate portfolio metrics
-        total_deposits_usd = 0
-        total_withdrawals_usd = 0
-        
-        if transactions.data:
-            for tx in transactions.data:
-                if tx.get("action") == "deposit":
-                    total_deposits_usd += float(tx.get("amount", 0))
-                elif tx.get("action") == "withdraw":
-                    total_withdrawals_usd += float(tx.get("amount", 0))
-        
-        net_deposits_usd = total_deposits_usd - total_withdrawals_usd
-        
-        # 6. Calculate P&L
-        pnl_usd = portfolio_value - net_deposits_usd
-        pnl_percentage = (pnl_usd / net_deposits_usd * 100) if net_deposits_usd > 0 else 0
-        
-        # 7. Prepare token list with prices
-        token_list = []
-        for token in tokens:
-            price = market_prices.get(token['symbol'], {}).get('price', 0)
-            value = token['balance'] * price
-            token_list.append({
-                **token,
-                'price': price,
-                'value': value,
-                'change24h': market_prices.get(token['symbol'], {}).get('change24h', 0)
-            })
+        profile, market_prices, holdings, stats, recent_transactions = (
+            await context.profile(), await context.prices(), await context.holdings(),
+            await context.stats(), await context.recent_transactions()
+        )
+        _record_snapshot(user_id, holdings)
+        market = _market_section(market_prices)
         
-        return {
-            "user_id": user_id,
-            "wallet_address": wallet_address or "Not connected",
-            
-            # Portfolio Value (from backend token service)
-            "total_value_usd": portfolio_value,
+        return tagged_json({
+            **_summary_section(user_id, profile, holdings, stats),
             
             # Token Holdings
-            "tokens": token_list,
-            
-            # Deposits/Withdrawals
-            "total_deposits_usd": total_deposits_usd,
-            "total_withdrawals_usd": total_withdrawals_usd,
-            "net_deposits_usd": net_deposits_usd,
-            
-            # P&L Metrics
-            "pnl_usd": pnl_usd,
-            "pnl_percentage": pnl_percentage,
+            "tokens": _token_section(holdings, market_prices),
             
             # Real-time Market Prices
             "market_prices": market_prices,
-            "eth_price_usd": eth_price,
+            "eth_price_usd": market["eth_price_usd"],
             
-            # Additional Data
-            "risk_score": profile_data.get("risk_tolerance", 5),
-            "recent_transactions": transactions.data[:5] if transactions.data else [],
-            "last_sync": profile_data.get("last_balance_sync")
-        }
+            "recent_transactions": recent_transactions
+        }, etag)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/stats")
-async def get_portfolio_stats(user_id: str):
-    """Get aggregated portfolio statistics from backend token service and real-time market data."""
-    supabase = get_supabase()
-    
+async def get_portfolio_stats(
+    user_id: str,
+    if_none_match: Optional[str] = Header(None),
+    supabase: AClient = Depends(get_supabase)
+):
+    """Get aggregated portfolio statistics from the user's holdings and real-time market data."""
     try:
-        # Get user's profile
-        try:
-            profile = supabase.table("user_profiles").select("*").eq(
-                "user_id", user_id
-            ).single().execute()
-            
-            if not profile.data:
-                profile_data = {}
-            else:
-                profile_data = profile.data
-        except Exception:
-            # Profile doesn't exist, use empty dict
-            profile_data = {}
+        context = PortfolioContext(supabase, user_id)
+        etag = make_etag("stats", user_id, await context.version(("prices", "holdings", "stats")))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
-        # Get real-time market prices
-        market_prices = YahooFinanceService.get_multiple_prices(['ETH', 'BTC', 'USDC', 'USDT', 'ADA', 'SOL', 'BNB', 'DOT', 'DOGE', 'MATIC'])
-        
-        # Get portfolio value from backend token service
-        price_dict = {symbol: data.get('price', 0) for symbol, data in market_prices.items()}
-        portfolio_data = token_service.get_portfolio_value(price_dict)
+        _, portfolio_data, _ = await context.holdings()
         portfolio_value = portfolio_data.get('total_value', 0)
+        market = _market_section(await context.prices())
+        stats = await context.stats()
         
-        # Get ETH price
-        eth_price_data = YahooFinanceService.get_crypto_price('ETH')
-        eth_price = eth_price_data.get('price', 0) if eth_price_data else 0
-        
-        # Get transaction statistics
-        transactions = supabase.table("transaction_log").select("*").eq(
-            "user_id", user_id
-        ).execute()
-        
-        if not transactions.data:
-            return {
+        if not stats or not stats["total_transactions"]:
+            return tagged_json({
                 "total_transactions": 0,
                 "total_deposits_usd": 0,
                 "total_withdrawals_usd": 0,
                 "total_trades": 0,
                 "portfolio_value_usd": portfolio_value,
-                "eth_price_usd": eth_price
-            }
-        
-        # Calculate deposits/withdrawals in USD
-        total_deposits_usd = sum(
-            float(tx.get("amount", 0))
-            for tx in transactions.data 
-            if tx.get("action") == "deposit"
-        )
+                "eth_price_usd": market["eth_price_usd"]
+            }, etag)
         
-        total_withdrawals_usd = sum(
-            float(tx.get("amount", 0))
-            for tx in transactions.data 
-            if tx.get("action") == "withdraw"
-        )
-        
-        trades = [tx for tx in transactions.data if tx.get("action") == "trade"]
-        successful_trades = [tx for tx in trades if tx.get("status") == "confirmed"]
-        
-        return {
-            "total_transactions": len(transactions.data),
+        return tagged_json({
+            **_stats_section(stats),
             
-            # Portfolio value from backend token service
+            # Portfolio value from the user's holdings
             "portfolio_value_usd": portfolio_value,
             
             # Deposits/Withdrawals
-            "total_deposits_usd": total_deposits_usd,
-            "total_withdrawals_usd": total_withdrawals_usd,
-            
-            # Trading stats
-            "total_trades": len(trades),
-            "successful_trades": len(successful_trades),
-            "success_rate": (len(successful_trades) / len(trades) * 100) if trades else 0,
+            "total_deposits_usd": float(stats["total_deposits"]),
+            "total_withdrawals_usd": float(stats["total_withdrawals"]),
             
             # Market data
-            "eth_price_usd": eth_price,
-            "eth_price_change_24h": eth_price_data.get('change24h', 0) if eth_price_data else 0
-        }
+            "eth_price_usd": market["eth_price_usd"],
+            "eth_price_change_24h": market["eth_price_change_24h"]
+        }, etag)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/overview")
+async def get_portfolio_overview(
+    user_id: str,
+    sections: Optional[str] = Query(
+        None,
+        description=f"Comma-separated sections to return ({', '.join(OVERVIEW_SECTIONS)}); all by default"
+    ),
+    if_none_match: Optional[str] = Header(None),
+    supabase: AClient = Depends(get_supabase)
+):
+    """
+    Everything the dashboard shows, in one response.
+    
+    Each input (profile, prices, balances, stats, transactions) is loaded
+    once and concurrently, and only for the requested sections. Supports
+    If-None-Match like the other portfolio endpoints.
+    """
+    requested = [s.strip() for s in sections.split(",") if s.strip()] if sections else list(OVERVIEW_SECTIONS)
+    unknown = [s for s in requested if s not in OVERVIEW_SECTIONS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown sections: {', '.join(unknown)}" if unknown else "No sections requested"
+        )
+    requested = list(dict.fromkeys(requested))
+    inputs = list(dict.fromkeys(name for section in requested for name in OVERVIEW_SECTIONS[section]))
+    
+    try:
+        context = PortfolioContext(supabase, user_id)
+        etag = make_etag("overview", user_id, sorted(requested), await context.version(inputs))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        await context.load(*inputs)
+        if "holdings" in inputs:
+            _record_snapshot(user_id, await context.holdings())
+        overview = {"user_id": user_id}
+        if "summary" in requested:
+            overview["summary"] = _summary_section(
+                user_id, await context.profile(), await context.holdings(), await context.stats()
+            )
+        if "tokens" in requested:
+            overview["tokens"] = _token_section(await context.holdings(), await context.prices())
+        if "market" in requested:
+            overview["market"] = _market_section(await context.prices())
+        if "stats" in requested:
+            overview["stats"] = _stats_section(await context.stats())
+        if "transactions" in requested:
+            overview["recent_transactions"] = await context.recent_transactions()
         
+        return tagged_json(overview, etag)
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _delta_document(context: PortfolioContext, user_id: str) -> dict:
+    """
+    All overview sections, with tokens keyed by symbol and recent
+    transactions by id so a changed entry patches only that entry.
+    """
+    await context.load(*INPUTS)
+    market_prices, holdings = await context.prices(), await context.holdings()
+    return {
+        "summary": _summary_section(user_id, await context.profile(), holdings, await context.stats()),
+        "tokens": {token["symbol"]: token for token in _token_section(holdings, market_prices)},
+        "market": _market_section(market_prices),
+        "stats": _stats_section(await context.stats()),
+        "recent_transactions": {tx["id"]: tx for tx in await context.recent_transactions()}
+    }
+
+
+@router.get("/delta")
+async def get_portfolio_delta(
+    user_id: str,
+    since: Optional[str] = Query(None, description="The version from the client's last response"),
+    supabase: AClient = Depends(get_supabase)
+):
+    """
+    Changes to the dashboard data since the version the client last saw.
+    
+    Returns {"version", "full": true, "snapshot"} on the first poll, or when
+    since is older than the server keeps (or from before a restart), and
+    otherwise {"version", "base", "full": false, "patch"}: the changed price
+    ticks, balances and transactions as "unset" and "set" JSON Pointer paths,
+    applied in that order. Apply the patch to the stored snapshot and send
+    the new version next time. An unchanged portfolio gets an empty patch
+    without the snapshot being rebuilt.
+    """
+    try:
+        context = PortfolioContext(supabase, user_id)
+        version = make_etag("delta", user_id, await context.version()).strip('"')
+        
+        latest = portfolio_deltas.latest(user_id)
+        if since is None or latest is None or latest[0] != version:
+            latest = portfolio_deltas.update(user_id, version, await _delta_document(context, user_id))
+            _record_snapshot(user_id, await context.holdings())
+        
+        # Patches lead to the tracked document, which a concurrent poll may
+        # have recorded, so its version is the one reported
+        version, document = latest
+        patch = portfolio_deltas.patch_since(user_id, since) if since else None
+        if patch is None:
+            return {"version": version, "full": True, "snapshot": document}
+        return {"version": version, "base": since, "full": False, "patch": patch.to_json()}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/history")
+async def get_portfolio_history(
+    user_id: str,
+    resolution: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_holdings: bool = False,
+    supabase: AClient = Depends(get_supabase)
+):
+    """
+    Get portfolio value over time as OHLC points from the 1m/1h/1d rollups.
+    Without a resolution, the finest one that fits the range is used.
+    """
+    try:
+        return await portfolio_history.query(
+            supabase,
+            user_id,
+            resolution=resolution,
+            start=start,
+            end=end,
+            include_holdings=include_holdings
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/profile-cache/stats")
+async def get_profile_cache_stats():
+    """Report profile cache hit ratio."""
+    return profile_cache.stats()
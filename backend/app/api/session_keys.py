@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response, Header, Depends
 from pydantic import BaseModel
+from typing import Optional
 from datetime import datetime, timedelta
+from supabase import AClient
 from app.db.supabase import get_supabase
+from app.services.idempotency import run_idempotent, IDEMPOTENCY_HEADER
+from app.services.session_key_registry import session_key_registry
 import secrets
 
 router = APIRouter()
@@ -14,15 +18,30 @@ class CreateSessionKeyRequest(BaseModel):
 
 
 @router.post("/create")
-async def create_session_key(request: CreateSessionKeyRequest):
+async def create_session_key(
+    request: CreateSessionKeyRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    supabase: AClient = Depends(get_supabase)
+):
     """
     Create a new session key for automated trading.
     
     Note: In production, this should involve signing a transaction on-chain
     to authorize the session key with specific permissions.
+    Retries carrying the same Idempotency-Key header do not create a second key.
     """
-    supabase = get_supabase()
-    
+    return await run_idempotent(
+        idempotency_key,
+        "session-key-create",
+        request.user_id,
+        request.model_dump(),
+        response,
+        lambda: _create_session_key(supabase, request)
+    )
+
+
+async def _create_session_key(supabase: AClient, request: CreateSessionKeyRequest) -> dict:
     try:
         # Generate a new private key (simplified)
         session_key_private = secrets.token_hex(32)
@@ -31,13 +50,15 @@ async def create_session_key(request: CreateSessionKeyRequest):
         expiry = datetime.utcnow() + timedelta(days=request.expiry_days)
         
         # Store in database
-        response = supabase.table("session_keys").insert({
+        response = await supabase.table("session_keys").insert({
             "user_id": request.user_id,
             "session_key_private": session_key_private,
             "expiry_timestamp": expiry.isoformat(),
             "permission_hash": "default_permissions",  # Define actual permissions
             "status": "active"
         }).execute()
+        if response.data:
+            session_key_registry.add(response.data[0])
         
         return {
             "message": "Session key created successfully",
@@ -49,12 +70,10 @@ async def create_session_key(request: CreateSessionKeyRequest):
 
 
 @router.get("/list")
-async def list_session_keys(user_id: str):
+async def list_session_keys(user_id: str, supabase: AClient = Depends(get_supabase)):
     """List all session keys for a user."""
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("session_keys").select(
+        response = await supabase.table("session_keys").select(
             "id, created_at, expiry_timestamp, status"
         ).eq("user_id", user_id).execute()
         
@@ -65,14 +84,13 @@ async def list_session_keys(user_id: str):
 
 
 @router.delete("/{key_id}")
-async def revoke_session_key(key_id: str):
+async def revoke_session_key(key_id: str, supabase: AClient = Depends(get_supabase)):
     """Revoke a session key."""
-    supabase = get_supabase()
-    
     try:
-        supabase.table("session_keys").update({
+        await supabase.table("session_keys").update({
             "status": "revoked"
         }).eq("id", key_id).execute()
+        session_key_registry.remove(key_id)
         
         return {"message": "Session key revoked successfully"}
         
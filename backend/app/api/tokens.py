@@ -1,15 +1,16 @@
 """
 Token API routes
 """
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Header
+from typing import List, Dict, Optional
 from pydantic import BaseModel
 
 # Use relative import path
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
-from services.token_service import token_service
+from services.token_service import JournalBusy, token_service
+from app.services.etag import etag_matches, make_etag, not_modified, tagged_body
 
 router = APIRouter()
 
@@ -25,22 +26,29 @@ class PortfolioResponse(BaseModel):
     total_value: float
     holdings: List[Dict]
 
+# Both reads return the service's pre-encoded bodies directly; response_model
+# only documents the shape. ETags follow the registry version.
 @router.get("/", response_model=List[TokenResponse])
-async def get_all_tokens():
+async def get_all_tokens(if_none_match: Optional[str] = Header(None)):
     """Get all available tokens"""
     try:
-        tokens = token_service.get_all_tokens()
-        return tokens
+        etag = make_etag("tokens", token_service.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return tagged_body(token_service.get_all_tokens_json(), etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{symbol}", response_model=TokenResponse)
-async def get_token(symbol: str):
+async def get_token(symbol: str, if_none_match: Optional[str] = Header(None)):
     """Get specific token by symbol"""
-    token = token_service.get_token_by_symbol(symbol)
-    if not token:
+    etag = make_etag("token", symbol.upper(), token_service.version)
+    body = token_service.get_token_json(symbol)
+    if body is None:
         raise HTTPException(status_code=404, detail=f"Token {symbol} not found")
-    return token
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return tagged_body(body, etag)
 
 @router.get("/{symbol}/balance")
 async def get_token_balance(symbol: str):
@@ -51,7 +59,10 @@ async def get_token_balance(symbol: str):
 @router.post("/{symbol}/update-balance")
 async def update_balance(symbol: str, new_balance: float):
     """Update token balance (for testing)"""
-    success = token_service.update_token_balance(symbol, new_balance)
+    try:
+        success = token_service.update_token_balance(symbol, new_balance)
+    except JournalBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not success:
         raise HTTPException(status_code=404, detail=f"Token {symbol} not found")
     return {"success": True, "symbol": symbol, "new_balance": new_balance}
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response, Header, Depends, Query
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from supabase import AClient
 from app.db.supabase import get_supabase
 from app.services.contract_service import vault_service
+from app.services.idempotency import run_idempotent, IDEMPOTENCY_HEADER
+from app.services.profile_cache import profile_cache
+from app.services.write_behind import write_behind
+from app.services.transaction_history import (
+    InvalidCursor,
+    MAX_PAGE_SIZE,
+    fetch_transactions_page,
+    select_columns
+)
 import httpx
 
 router = APIRouter()
@@ -23,32 +33,72 @@ class WithdrawRequest(BaseModel):
 
 
 @router.get("/")
-async def get_transactions(user_id: str = None):
-    """Get user's transaction history from Supabase."""
+async def get_transactions(
+    user_id: str = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    action: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+    supabase: AClient = Depends(get_supabase)
+):
+    """
+    Get one page of the user's transaction history, newest first.
+    Pass the returned next_cursor as cursor to get the following page;
+    fields is an optional comma-separated column list.
+    """
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     
-    supabase = get_supabase()
+    try:
+        columns = select_columns(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        response = supabase.table("transaction_log").select("*").eq(
-            "user_id", user_id
-        ).order("timestamp", desc=True).limit(50).execute()
+        transactions, next_cursor = await fetch_transactions_page(
+            supabase,
+            user_id,
+            limit=limit,
+            cursor=cursor,
+            action=action,
+            status=status,
+            columns=columns
+        )
         
-        return response.data or []
+        return {
+            "transactions": transactions,
+            "next_cursor": next_cursor
+        }
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/deposit")
-async def record_deposit(request: DepositRequest):
+async def record_deposit(
+    request: DepositRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
     """
     Record a deposit transaction in Supabase.
     This is called after user deposits ETH to the vault contract.
+    Retries carrying the same Idempotency-Key header are not recorded twice.
     """
-    supabase = get_supabase()
-    
+    return await run_idempotent(
+        idempotency_key,
+        "deposit",
+        request.user_id,
+        request.model_dump(),
+        response,
+        lambda: _record_deposit(request)
+    )
+
+
+async def _record_deposit(request: DepositRequest) -> dict:
     try:
         # 1. Verify the transaction on Starknet (if tx_hash provided)
         if request.tx_hash:
@@ -74,16 +124,18 @@ async def record_deposit(request: DepositRequest):
             "reasoning_log": f"User deposit of {request.amount} wei"
         }
         
-        response = supabase.table("transaction_log").insert(tx_data).execute()
+        # Both writes are buffered and reach Supabase in the next batch flush
+        transaction = write_behind.insert("transaction_log", tx_data)
         
         # 4. Update user's vault balance in user_profiles
-        supabase.table("user_profiles").update({
+        write_behind.update("user_profiles", {"user_id": request.user_id}, {
             "vault_balance": str(vault_balance) if vault_balance else request.amount
-        }).eq("user_id", request.user_id).execute()
+        })
+        profile_cache.invalidate(request.user_id)
         
         return {
             "success": True,
-            "transaction": response.data[0] if response.data else None,
+            "transaction": transaction,
             "vault_balance": vault_balance
         }
         
@@ -96,8 +148,6 @@ async def record_withdrawal(request: WithdrawRequest):
     """
     Record a withdrawal transaction in Supabase.
     """
-    supabase = get_supabase()
-    
     try:
         # 1. Check vault balance
         vault_balance = await vault_service.get_balance(request.wallet_address)
@@ -120,11 +170,11 @@ async def record_withdrawal(request: WithdrawRequest):
             "reasoning_log": f"User withdrawal of {request.amount} wei"
         }
         
-        response = supabase.table("transaction_log").insert(tx_data).execute()
+        transaction = write_behind.insert("transaction_log", tx_data)
         
         return {
             "success": True,
-            "transaction": response.data[0] if response.data else None
+            "transaction": transaction
         }
         
     except Exception as e:
@@ -155,17 +205,16 @@ async def sync_vault_balance(user_id: str, wallet_address: str):
     Sync vault balance from contract to Supabase.
     Should be called periodically or after transactions.
     """
-    supabase = get_supabase()
-    
     try:
         # Get balance from contract
         vault_balance = await vault_service.get_balance(wallet_address)
         
-        # Update in Supabase
-        supabase.table("user_profiles").update({
+        # Update in Supabase (buffered)
+        write_behind.update("user_profiles", {"user_id": user_id}, {
             "vault_balance": str(vault_balance) if vault_balance else "0",
             "last_balance_sync": datetime.utcnow().isoformat()
-        }).eq("user_id", user_id).execute()
+        })
+        profile_cache.invalidate(user_id)
         
         return {
             "success": True,
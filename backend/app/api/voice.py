@@ -1,163 +1,303 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 from app.services.gemini_service import gemini_service
-from app.services.starknet_service import starknet_service
-from app.db.supabase import get_supabase
-import tempfile
-import os
+from app.services.transcription_service import get_transcriber, AudioBufferFull
+from app.services.intent_parser import intent_matcher, refresh_intent_matcher
+from app.services.job_queue import get_job_queue, JOB_QUEUED, TERMINAL_EVENTS
+from app.services.strategy_executor import EXECUTE_STRATEGY_JOB, fetch_market_data
+from app.services.idempotency import run_idempotent, IDEMPOTENCY_HEADER
+from app.config import settings
+import asyncio
+import json
+
+# Prefetch tasks that outlive the WebSocket which started them
+_background_tasks = set()
 
 router = APIRouter()
 
 
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client goes away while work is still pending."""
+
+
 class VoiceCommand(BaseModel):
     user_id: str
     transcript: str
 
 
+class BatchPredictionRequest(BaseModel):
+    pairs: List[str]
+
+
+class PredictionRequest(BaseModel):
+    pair: str = "ETH/USDC"
+
+
 @router.post("/transcribe")
 async def transcribe_audio(audio: UploadFile = File(...)):
     """
-    Transcribe audio to text and extract intent.
-    Note: This is a placeholder. Integrate with your actual voice API service.
+    Transcribe an uploaded audio clip and extract intent.
+    The backend is selected with VOICE_TRANSCRIBER; prefer the /stream
+    WebSocket for live audio.
     """
-    try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_file:
-            content = await audio.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
-        
-        # TODO: Integrate with actual voice transcription service (e.g., Google Speech-to-Text, Whisper)
+    transcriber = get_transcriber()
+    if transcriber is None:
         raise HTTPException(
             status_code=501,
-            detail="Voice transcription service not yet implemented. Please integrate a speech-to-text API."
+            detail="Voice transcription service not configured. Set VOICE_TRANSCRIBER."
         )
-        
-        # Clean up temp file
-        os.unlink(temp_path)
-        
-        return {
-            "transcript": transcript,
-            "action": action,
-            "confidence": 0.95
-        }
-        
+    
+    session = transcriber.start_session()
+    try:
+        # Read in chunks into the session's bounded buffer - no temp files
+        while chunk := await audio.read(64 * 1024):
+            await session.feed(chunk)
+        transcript = await session.finish()
+    except AudioBufferFull as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
+    
+    intent = parse_intent(transcript)
+    return {
+        "transcript": transcript,
+        "action": intent["action"],
+        "pair": intent["pair"],
+        "confidence": 0.95
+    }
 
 
-@router.post("/execute-command")
-async def execute_voice_command(command: VoiceCommand):
+@router.websocket("/stream")
+async def stream_voice(websocket: WebSocket):
     """
-    Execute a voice command after transcription.
-    This triggers the MCP flow: prediction -> ZK proof -> execution.
+    Streaming voice ingestion.
+    
+    Binary frames carry audio chunks; a text frame "end" finishes the
+    utterance. The server replies with JSON messages:
+    - {"type": "partial", "transcript", "intent"} as words are recognized
+    - {"type": "final", "transcript", "intent", "prefetched"} at the end
+    - {"type": "error", "detail"} before closing on failure
+    
+    Once a partial transcript asks to execute a strategy, market data and the
+    prediction for its pair are fetched in the background so the following
+    execute-command call is served from the prediction cache.
     """
-    supabase = get_supabase()
+    await websocket.accept()
+    
+    transcriber = get_transcriber()
+    if transcriber is None:
+        await websocket.send_json({"type": "error", "detail": "Voice transcription service not configured"})
+        await websocket.close(code=1011)
+        return
+    
+    session = transcriber.start_session()
+    prefetches = {}
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            
+            if message.get("bytes"):
+                partial = await session.feed(message["bytes"])
+                if partial:
+                    intent = parse_intent(partial)
+                    if intent["action"] == "EXECUTE_STRATEGY" and intent["pair"] not in prefetches:
+                        prefetches[intent["pair"]] = start_background_task(prefetch_prediction(intent["pair"]))
+                    await websocket.send_json({"type": "partial", "transcript": partial, "intent": intent})
+            elif message.get("text") == "end":
+                transcript = await session.finish()
+                intent = parse_intent(transcript)
+                await websocket.send_json({
+                    "type": "final",
+                    "transcript": transcript,
+                    "intent": intent,
+                    "prefetched": intent["pair"] in prefetches
+                })
+                await websocket.close()
+                return
     
+    except AudioBufferFull as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1009)
+    except WebSocketDisconnect:
+        pass
+
+
+def start_background_task(coro) -> asyncio.Task:
+    """
+    Run a coroutine beyond the lifetime of the current request.
+    The event loop only keeps weak references to tasks, so hold one here.
+    """
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def prefetch_prediction(pair: str):
+    """Warm the prediction cache for a pair while the user is still speaking."""
+    try:
+        market_data = await fetch_market_data(pair)
+        await gemini_service.predict_market_sentiment(pair=pair, market_data=market_data)
+    except Exception as e:
+        print(f"Prediction prefetch failed for {pair}: {e}")
+
+
+@router.post("/execute-command", status_code=202)
+async def execute_voice_command(
+    command: VoiceCommand,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """
+    Execute a voice command after transcription.
+    Strategy execution (prediction -> ZK proof -> execution) is queued as a
+    background job; poll /jobs/{job_id} or follow /jobs/{job_id}/events.
+    Retries carrying the same Idempotency-Key header return the original job.
+    """
+    return await run_idempotent(
+        idempotency_key,
+        "execute-command",
+        command.user_id,
+        command.model_dump(),
+        response,
+        lambda: _queue_voice_command(command)
+    )
+
+
+async def _queue_voice_command(command: VoiceCommand) -> Optional[dict]:
     try:
         # Parse intent from transcript
         intent = parse_intent(command.transcript)
         
         if intent["action"] == "EXECUTE_STRATEGY":
-            # Get user's wallet and session key
-            profile = supabase.table("user_profiles").select("*").eq(
-                "user_id", command.user_id
-            ).single().execute()
-            
-            session_key = supabase.table("session_keys").select("*").eq(
-                "user_id", command.user_id
-            ).order("created_at", desc=True).limit(1).single().execute()
-            
-            if not session_key.data:
-                raise HTTPException(status_code=400, detail="No active session key")
-            
-            # Get market data
-            market_data = await fetch_market_data(intent["pair"])
-            
-            # Get Gemini prediction
-            prediction = await gemini_service.predict_market_sentiment(
-                pair=intent["pair"],
-                market_data=market_data
-            )
+            job_id = await get_job_queue().enqueue(EXECUTE_STRATEGY_JOB, {
+                "user_id": command.user_id,
+                "pair": intent["pair"],
+                "transcript": command.transcript
+            })
             
-            # Execute if confidence is high enough
-            if prediction["confidence"] > 0.7 and prediction["action"] != "HOLD":
-                # Generate ZK proof hash (simplified - integrate with Giza in production)
-                proof_hash = generate_proof_hash(market_data, prediction)
-                
-                # Extract range if rebalancing
-                new_range = None
-                if prediction["range"]:
-                    bounds = prediction["range"].split("-")
-                    new_range = (float(bounds[0]), float(bounds[1]))
-                
-                # Execute on Starknet
-                result = await starknet_service.execute_rebalance(
-                    session_key_private=session_key.data["session_key_private"],
-                    account_address=profile.data["starknet_address"],
-                    new_range=new_range or (1800, 2200),
-                    proof_hash=proof_hash,
-                    reasoning_log=prediction["reasoning"]
-                )
-                
-                # Log transaction
-                supabase.table("transaction_log").insert({
-                    "tx_hash": result["tx_hash"],
-                    "user_id": command.user_id,
-                    "action": prediction["action"],
-                    "ai_reasoning_log": prediction["reasoning"],
-                    "status": result["status"]
-                }).execute()
-                
-                return {
-                    "success": True,
-                    "action": prediction["action"],
-                    "reasoning": prediction["reasoning"],
-                    "tx_hash": result["tx_hash"]
-                }
-            else:
-                return {
-                    "success": False,
-                    "action": "HOLD",
-                    "reasoning": prediction["reasoning"]
-                }
+            return {
+                "job_id": job_id,
+                "status": JOB_QUEUED,
+                "pair": intent["pair"],
+                "status_url": f"/api/voice/jobs/{job_id}",
+                "events_url": f"/api/voice/jobs/{job_id}/events"
+            }
                 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def parse_intent(transcript: str) -> dict:
-    """Parse user intent from transcript."""
-    transcript_lower = transcript.lower()
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get the status, attempts and result of a queued strategy job."""
+    job = await get_job_queue().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream a job's progress as Server-Sent Events.
+    Earlier events are replayed first; the stream ends with a "succeeded" or
+    "dead" event.
+    """
+    queue = get_job_queue()
+    if not await queue.get_job(job_id):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    async def event_stream():
+        cursor = 0
+        while not await request.is_disconnected():
+            events = await queue.get_events(job_id, cursor)
+            cursor += len(events)
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+            await asyncio.sleep(settings.JOB_EVENTS_POLL_SECONDS)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.post("/predict-stream")
+async def stream_prediction(request: PredictionRequest):
+    """
+    Stream a prediction as Server-Sent Events.
+    The "decision" event (action, range, confidence) arrives first, followed by
+    "reasoning" events and a final "done" event with the full prediction.
+    """
+    market_data = await fetch_market_data(request.pair)
     
-    if "execute" in transcript_lower or "trade" in transcript_lower:
-        action = "EXECUTE_STRATEGY"
-    elif "check" in transcript_lower or "status" in transcript_lower:
-        action = "CHECK_STATUS"
-    else:
-        action = "UNKNOWN"
+    async def event_stream():
+        async for event, payload in gemini_service.stream_prediction(
+            pair=request.pair,
+            market_data=market_data
+        ):
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
     
-    # Extract pair (simplified)
-    pair = "ETH/USDC"
-    if "btc" in transcript_lower:
-        pair = "BTC/USDC"
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.post("/predict-batch")
+async def predict_batch(request: BatchPredictionRequest, http_request: Request):
+    """
+    Predict strategies for every tracked pair in one LLM round trip.
+    Intended for periodic strategy sweeps. The LLM call is abandoned if the
+    client disconnects first.
+    """
+    if not request.pairs:
+        raise HTTPException(status_code=400, detail="pairs must not be empty")
     
-    return {"action": action, "pair": pair}
+    try:
+        pairs = list(dict.fromkeys(pair.upper() for pair in request.pairs))
+        market_data = await asyncio.gather(*(fetch_market_data(pair) for pair in pairs))
+        predictions = await run_until_disconnected(
+            http_request,
+            gemini_service.predict_batch(dict(zip(pairs, market_data)))
+        )
+        
+        return {
+            "predictions": predictions,
+            "count": len(predictions)
+        }
+        
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-async def fetch_market_data(pair: str) -> dict:
-    """Fetch current market data for a trading pair."""
-    # Simplified - integrate with actual price feeds
-    return {
-        "price": 2000.0,
-        "volume": 1000000,
-        "volatility": 5.2,
-        "trend": "bullish"
-    }
+async def run_until_disconnected(request: Request, awaitable, poll_interval: float = 0.25):
+    """Await a coroutine, cancelling it as soon as the client disconnects."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+@router.get("/prediction-cache/stats")
+async def get_prediction_cache_stats():
+    """Report prediction cache hit ratio and saved LLM latency."""
+    return gemini_service.cache.stats()
 
 
-def generate_proof_hash(market_data: dict, prediction: dict) -> str:
-    """Generate ZK proof hash (simplified)."""
-    from hashlib import sha256
-    data_str = f"{market_data}{prediction}"
-    return sha256(data_str.encode()).hexdigest()
+def parse_intent(transcript: str) -> dict:
+    """Parse user intent from transcript."""
+    if not intent_matcher.is_built:
+        refresh_intent_matcher()
+    return intent_matcher.parse(transcript)
@@ -5,10 +5,16 @@ from typing import List
 class Settings(BaseSettings):
     # Environment
     ENVIRONMENT: str = "development"
+    DEBUG_TIMINGS: bool = False  # Return per-stage timings_ms in strategy results
     
     # Supabase
     SUPABASE_URL: str
     SUPABASE_SERVICE_KEY: str
+    SUPABASE_QUERY_TIMEOUT_SECONDS: float = 10.0
+    SUPABASE_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    SUPABASE_POOL_MAX_CONNECTIONS: int = 50
+    SUPABASE_POOL_MAX_KEEPALIVE: int = 20
+    SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
     
     # Starknet
     STARKNET_RPC_URL: str
@@ -24,13 +30,59 @@ class Settings(BaseSettings):
     STARKNET_POSITION_CONTRACT: str = ""
     STARKNET_REBALANCE_CONTRACT: str = ""
     
+    # On-chain token balances (batched balance_of reads, cached per block)
+    ONCHAIN_RPC_TIMEOUT_SECONDS: float = 10.0
+    ONCHAIN_BLOCK_POLL_SECONDS: float = 2.0
+    ONCHAIN_BALANCE_CACHE_MAX_ENTRIES: int = 10000
+    
     # Gemini AI
     GEMINI_API_KEY: str
     GEMINI_MODEL: str = "gemini-2.5-flash"
+    GEMINI_TIMEOUT_SECONDS: float = 10.0
+    GEMINI_MAX_CONCURRENCY: int = 4
+    GEMINI_BATCH_MAX_RETRIES: int = 1
+    
+    # Market price quotes (Yahoo Finance) are reused for this long
+    PRICE_CACHE_TTL_SECONDS: float = 15.0
+    
+    # Prediction cache
+    PREDICTION_CACHE_TTL_SECONDS: float = 30.0
+    PREDICTION_CACHE_MAX_ENTRIES: int = 1024
+    PREDICTION_CACHE_PRICE_BUCKET_PCT: float = 0.5
+    PREDICTION_CACHE_VOLATILITY_BUCKET: float = 0.5
+    PREDICTION_CACHE_VOLUME_BUCKET_PCT: float = 10.0
+    
+    # Rule engine (local fast path before the LLM)
+    RULES_ENABLED: bool = True
+    RULES_MIN_VOLATILITY: float = 2.0
+    RULES_MAX_VOLATILITY: float = 20.0
+    RULES_RANGE_EDGE_PCT: float = 10.0
+    RULES_OUT_OF_RANGE_PCT: float = 5.0
+    RULES_REBALANCE_COOLDOWN_SECONDS: float = 3600.0
+    
+    # Profile cache
+    PROFILE_CACHE_TTL_SECONDS: float = 60.0
+    PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Session key registry
+    SESSION_KEY_SWEEP_INTERVAL_SECONDS: float = 60.0
+    SESSION_KEY_REFRESH_INTERVAL_SECONDS: float = 300.0
+    
+    # Portfolio value history (minimum seconds between snapshots per user)
+    PORTFOLIO_HISTORY_MIN_INTERVAL_SECONDS: float = 15.0
+    
+    # Portfolio deltas (versions a polling client can diff against, users tracked)
+    PORTFOLIO_DELTA_HISTORY: int = 30
+    PORTFOLIO_DELTA_MAX_USERS: int = 10000
     
     # Voice API
     VOICE_API_KEY: str = ""
     VOICE_API_ENDPOINT: str = ""
+    VOICE_TRANSCRIBER: str = ""  # "stub" for local development and tests
+    VOICE_STREAM_MAX_BYTES: int = 5 * 1024 * 1024
+    VOICE_FETCH_TIMEOUT_SECONDS: float = 5.0
+    VOICE_EXECUTION_TIMEOUT_SECONDS: float = 60.0
+    VOICE_COMMAND_DEADLINE_SECONDS: float = 90.0
     
     # Security
     SECRET_KEY: str
@@ -42,6 +94,43 @@ class Settings(BaseSettings):
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
+    
+    # Job queue ("memory" keeps jobs in this process; "redis" is durable and shared with worker.py)
+    JOB_QUEUE_BACKEND: str = "memory"
+    JOB_WORKERS_IN_PROCESS: bool = True
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 2.0
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 60.0
+    JOB_CLAIM_TIMEOUT_SECONDS: float = 1.0
+    JOB_MAINTENANCE_INTERVAL_SECONDS: float = 5.0
+    JOB_WORKER_HEARTBEAT_TTL_SECONDS: int = 30
+    JOB_RESULT_TTL_SECONDS: int = 86400
+    JOB_EVENTS_POLL_SECONDS: float = 0.5
+    
+    # Write-behind buffer for audit inserts and profile updates
+    # (each process needs its own spool file)
+    WRITE_BEHIND_SPOOL_PATH: str = "data/write_behind.jsonl"
+    WRITE_BEHIND_WORKER_SPOOL_PATH: str = "data/write_behind_worker.jsonl"
+    WRITE_BEHIND_MAX_BATCH: int = 100
+    WRITE_BEHIND_FLUSH_INTERVAL_SECONDS: float = 1.0
+    WRITE_BEHIND_FSYNC: bool = True
+    WRITE_BEHIND_FSYNC_INTERVAL_SECONDS: float = 0.2
+    
+    # Token balance journal (deployed_tokens/tokens.json.journal)
+    TOKEN_JOURNAL_FSYNC_BATCH: int = 16
+    TOKEN_JOURNAL_FSYNC_INTERVAL_SECONDS: float = 1.0
+    TOKEN_JOURNAL_COMPACT_ENTRIES: int = 1000
+    # How often deployed_tokens/tokens.json is checked for redeployed tokens
+    TOKEN_REGISTRY_POLL_INTERVAL_SECONDS: float = 2.0
+    
+    # Idempotency keys ("memory" is per process; "redis" catches duplicates across workers)
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS: int = 120
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0
+    IDEMPOTENCY_POLL_SECONDS: float = 0.1
 
     class Config:
         env_file = ".env"
@@ -1,9 +1,105 @@
-from supabase import create_client, Client
+"""
+Supabase - async client sharing one pooled HTTP connection pool per process
+"""
+import asyncio
+from typing import Optional
+
+import httpx
+from gotrue import AsyncMemoryStorage
+from postgrest import AsyncPostgrestClient
+from supabase import AClient, AClientOptions
+
 from app.config import settings
 
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
 
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def _query_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.SUPABASE_QUERY_TIMEOUT_SECONDS,
+        connect=settings.SUPABASE_CONNECT_TIMEOUT_SECONDS
+    )
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client whose HTTP session keeps a bounded keep-alive pool."""
+
+    def create_session(self, base_url, headers, timeout, verify=True) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            follow_redirects=True,
+            http2=True,
+            limits=_pool_limits()
+        )
+
+
+class PooledAsyncClient(AClient):
+    """
+    Service-role client shared by every request in the process.
+
+    Auth events are ignored: the default client swaps its PostgREST session
+    (and with it the pool) and starts sending the signed-in user's token
+    after any sign-in, which would downgrade every later query.
+    """
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None, verify=True) -> AsyncPostgrestClient:
+        return PooledPostgrestClient(
+            rest_url,
+            headers=headers,
+            schema=schema,
+            timeout=timeout or _query_timeout(),
+            verify=verify
+        )
+
+    def _listen_to_auth_events(self, event, session):
+        pass
+
+
+_client: Optional[PooledAsyncClient] = None
+_init_lock = asyncio.Lock()
+
+
+async def init_supabase() -> PooledAsyncClient:
+    """Create the shared client. Called from the app lifespan."""
+    global _client
+    async with _init_lock:
+        if _client is None:
+            _client = await PooledAsyncClient.create(
+                settings.SUPABASE_URL,
+                settings.SUPABASE_SERVICE_KEY,
+                AClientOptions(
+                    storage=AsyncMemoryStorage(),
+                    auto_refresh_token=False,
+                    persist_session=False,
+                    postgrest_client_timeout=_query_timeout()
+                )
+            )
+    return _client
+
+
+async def close_supabase():
+    """Close the pooled connections. Called on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.postgrest.aclose()
+        _client = None
+
+
+async def get_supabase() -> AClient:
+    """
+    Get the shared async Supabase client.
 
-def get_supabase() -> Client:
-    """Get Supabase client instance."""
-    return supabase
+    Use as a FastAPI dependency (Depends(get_supabase)); code running outside
+    a request, such as job handlers, can await it directly.
+    """
+    return _client or await init_supabase()
@@ -0,0 +1,61 @@
+"""
+ETags - version tags for polled GET endpoints and If-None-Match handling
+"""
+import hashlib
+import json
+import uuid
+from typing import Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+# Clients may cache but must revalidate on every poll
+CACHE_CONTROL = "private, no-cache"
+
+# In-memory versions restart at zero, so tags from before a restart must not match
+_BOOT_ID = uuid.uuid4().hex
+
+
+def make_etag(*versions) -> str:
+    """
+    Strong ETag for a response built from inputs with the given versions.
+
+    The versions must identify the inputs (snapshot versions, ids, small
+    tuples of values), not the response itself, so the tag can be checked
+    before the response is built. Tags are specific to this process.
+    """
+    raw = json.dumps([_BOOT_ID, versions], separators=(",", ":"), sort_keys=True, default=str)
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if the If-None-Match header lists etag (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def tagged_json(content, etag: str) -> JSONResponse:
+    """JSON response carrying its ETag."""
+    return JSONResponse(content=content, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def tagged_body(body: bytes, etag: str) -> Response:
+    """Pre-encoded JSON body carrying its ETag."""
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
@@ -1,40 +1,362 @@
+import asyncio
+import json
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
 import google.generativeai as genai
 from app.config import settings
+from app.services.prediction_cache import prediction_cache
 
 # Configure Gemini API
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+VALID_ACTIONS = {"REBALANCE", "ADD_LIQUIDITY", "REMOVE_LIQUIDITY", "HOLD"}
+
+
+class StreamingDecisionParser:
+    """
+    Incrementally parse the ACTION/RANGE/CONFIDENCE/REASONING response format.
+    
+    Text is fed in arbitrary chunks. A "decision" event is emitted as soon as
+    action, range and confidence are known (or reasoning starts), and each
+    completed reasoning line is emitted as a "reasoning" event.
+    """
+    
+    DECISION_FIELDS = ("action", "range", "confidence")
+    
+    def __init__(self):
+        self.result = {
+            "action": "HOLD",
+            "reasoning": "",
+            "range": None,
+            "confidence": 0.5,
+            "source": "llm"
+        }
+        self.decision_ready = False
+        self._seen = set()
+        self._buffer = ""
+        self._in_reasoning = False
+    
+    def feed(self, text: str) -> List[Tuple[str, dict]]:
+        """Consume a chunk of text and return any events it completes."""
+        self._buffer += text
+        events = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            events.extend(self._consume_line(line))
+        return events
+    
+    def close(self) -> List[Tuple[str, dict]]:
+        """Flush the trailing partial line and emit the decision if still pending."""
+        events = []
+        if self._buffer:
+            events.extend(self._consume_line(self._buffer))
+            self._buffer = ""
+        events.extend(self._emit_decision())
+        return events
+    
+    def decision(self) -> dict:
+        """The decision fields parsed so far."""
+        return {field: self.result[field] for field in self.DECISION_FIELDS}
+    
+    def _consume_line(self, line: str) -> List[Tuple[str, dict]]:
+        line = line.strip()
+        events = []
+        
+        if line.startswith("ACTION:"):
+            self.result["action"] = line.split("ACTION:")[1].strip()
+            self._seen.add("action")
+        elif line.startswith("RANGE:"):
+            self.result["range"] = line.split("RANGE:")[1].strip() or None
+            self._seen.add("range")
+        elif line.startswith("CONFIDENCE:"):
+            try:
+                self.result["confidence"] = float(line.split("CONFIDENCE:")[1].strip())
+            except ValueError:
+                self.result["confidence"] = 0.5
+            self._seen.add("confidence")
+        elif line.startswith("REASONING:"):
+            self._in_reasoning = True
+            events.extend(self._emit_decision())
+            events.extend(self._append_reasoning(line.split("REASONING:")[1].strip()))
+            return events
+        elif self._in_reasoning and line:
+            return self._append_reasoning(line)
+        
+        if self._seen.issuperset(self.DECISION_FIELDS):
+            events.extend(self._emit_decision())
+        return events
+    
+    def _append_reasoning(self, text: str) -> List[Tuple[str, dict]]:
+        if not text:
+            return []
+        if self.result["reasoning"]:
+            text = " " + text
+        self.result["reasoning"] += text
+        return [("reasoning", {"text": text})]
+    
+    def _emit_decision(self) -> List[Tuple[str, dict]]:
+        if self.decision_ready:
+            return []
+        self.decision_ready = True
+        return [("decision", self.decision())]
+
 
 class GeminiService:
     """Service for interacting with Gemini AI for market predictions."""
     
     def __init__(self):
         self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
+        # Caps in-flight LLM calls per worker to protect the API quota
+        self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        self.cache = prediction_cache
     
-    async def predict_market_sentiment(self, pair: str, market_data: dict) -> dict:
+    async def predict_market_sentiment(
+        self,
+        pair: str,
+        market_data: dict,
+        timeout: Optional[float] = None
+    ) -> dict:
         """
         Analyze market data and predict trading strategy.
         
         Args:
             pair: Trading pair (e.g., "ETH/USDC")
             market_data: Dictionary containing current market data
+            timeout: Deadline in seconds, including time spent waiting for a
+                concurrency slot (defaults to GEMINI_TIMEOUT_SECONDS)
             
         Returns:
-            Dictionary with action, reasoning, and parameters
+            Dictionary with action, reasoning, and parameters. When the model
+            could not be used, "fallback_reason" explains why HOLD was returned.
         """
+        return await self.cache.get_or_compute(
+            pair,
+            market_data,
+            lambda: self._predict_uncached(pair, market_data, timeout)
+        )
+    
+    async def _predict_uncached(
+        self,
+        pair: str,
+        market_data: dict,
+        timeout: Optional[float] = None
+    ) -> dict:
+        """Call Gemini for a prediction, bypassing the cache."""
         prompt = self._build_prediction_prompt(pair, market_data)
+        deadline = timeout if timeout is not None else settings.GEMINI_TIMEOUT_SECONDS
         
         try:
-            response = self.model.generate_content(prompt)
-            result = self._parse_response(response.text)
-            return result
+            async for event, payload in self._stream_decision(prompt, deadline):
+                if event == "done":
+                    return payload
+        except asyncio.TimeoutError:
+            print(f"Gemini prediction timed out after {deadline}s for {pair}")
+            return self._hold_fallback(
+                "timeout",
+                f"Prediction timed out after {deadline}s, defaulting to HOLD"
+            )
         except Exception as e:
             print(f"Gemini prediction error: {e}")
-            return {
-                "action": "HOLD",
-                "reasoning": "Unable to get prediction, defaulting to HOLD",
-                "confidence": 0.0
-            }
+        
+        return self._hold_fallback(
+            "error",
+            "Unable to get prediction, defaulting to HOLD"
+        )
+    
+    async def stream_prediction(
+        self,
+        pair: str,
+        market_data: dict,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Stream a prediction as it is generated.
+        
+        Yields ("decision", {action, range, confidence}) as soon as those lines
+        arrive, then ("reasoning", {text}) events, and finally ("done", prediction).
+        A HOLD decision ends generation early.
+        
+        Args:
+            pair: Trading pair (e.g., "ETH/USDC")
+            market_data: Dictionary containing current market data
+            timeout: Deadline in seconds for the whole stream
+        """
+        cached = self.cache.get(pair, market_data)
+        if cached is not None:
+            yield "decision", {field: cached.get(field) for field in StreamingDecisionParser.DECISION_FIELDS}
+            if cached.get("reasoning"):
+                yield "reasoning", {"text": cached["reasoning"]}
+            yield "done", cached
+            return
+        
+        prompt = self._build_prediction_prompt(pair, market_data)
+        deadline = timeout if timeout is not None else settings.GEMINI_TIMEOUT_SECONDS
+        started = time.monotonic()
+        decided = False
+        
+        try:
+            async for event, payload in self._stream_decision(prompt, deadline):
+                if event == "done":
+                    self.cache.put(pair, market_data, payload, time.monotonic() - started)
+                    yield event, dict(payload)
+                    return
+                decided = decided or event == "decision"
+                yield event, payload
+        except asyncio.TimeoutError:
+            fallback = self._hold_fallback(
+                "timeout",
+                f"Prediction timed out after {deadline}s, defaulting to HOLD"
+            )
+        except Exception as e:
+            print(f"Gemini streaming prediction error: {e}")
+            fallback = self._hold_fallback(
+                "error",
+                "Unable to get prediction, defaulting to HOLD"
+            )
+        
+        if not decided:
+            yield "decision", {field: fallback[field] for field in StreamingDecisionParser.DECISION_FIELDS}
+        yield "done", fallback
+    
+    async def _stream_decision(
+        self,
+        prompt: str,
+        deadline: float
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Stream one generation under the concurrency limit and a total deadline,
+        yielding parser events followed by ("done", prediction).
+        """
+        loop = asyncio.get_running_loop()
+        expires_at = loop.time() + deadline
+        
+        def remaining() -> float:
+            left = expires_at - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+        
+        parser = StreamingDecisionParser()
+        stopped_early = False
+        await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining())
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(prompt, stream=True),
+                timeout=remaining()
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining())
+                except StopAsyncIteration:
+                    break
+                
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. safety metadata only)
+                    continue
+                
+                for event in parser.feed(text):
+                    yield event
+                
+                # Nothing to execute on HOLD, so skip generating the reasoning
+                if parser.decision_ready and parser.result["action"] == "HOLD":
+                    stopped_early = True
+                    break
+        finally:
+            self._semaphore.release()
+        
+        for event in parser.close():
+            yield event
+        if stopped_early and not parser.result["reasoning"]:
+            parser.result["reasoning"] = "Model decided HOLD; generation stopped early"
+        yield "done", parser.result
+    
+    async def _generate(self, prompt: str) -> str:
+        """Run one non-blocking generation call under the concurrency limit."""
+        async with self._semaphore:
+            response = await self.model.generate_content_async(prompt)
+            return response.text
+    
+    def _hold_fallback(self, fallback_reason: str, reasoning: str) -> dict:
+        """Default HOLD decision used when no model output is available."""
+        return {
+            "action": "HOLD",
+            "reasoning": reasoning,
+            "range": None,
+            "confidence": 0.0,
+            "source": "llm",
+            "fallback_reason": fallback_reason
+        }
+    
+    async def predict_batch(
+        self,
+        market_data_by_pair: Dict[str, dict],
+        timeout: Optional[float] = None
+    ) -> Dict[str, dict]:
+        """
+        Predict strategies for several pairs with a single LLM call.
+        
+        Cached pairs are answered locally. The remaining pairs are sent in one
+        JSON-structured prompt; only pairs whose result is missing or invalid
+        are retried, up to GEMINI_BATCH_MAX_RETRIES times.
+        
+        Args:
+            market_data_by_pair: Mapping of trading pair to its market data
+            timeout: Deadline in seconds for each upstream call
+            
+        Returns:
+            Mapping of trading pair to prediction dictionary
+        """
+        results: Dict[str, dict] = {}
+        pending: List[str] = []
+        for pair, market_data in market_data_by_pair.items():
+            cached = self.cache.get(pair, market_data)
+            if cached is not None:
+                results[pair] = cached
+            else:
+                pending.append(pair)
+        
+        deadline = timeout if timeout is not None else settings.GEMINI_TIMEOUT_SECONDS
+        fallback_reason = "invalid_response"
+        
+        for _ in range(settings.GEMINI_BATCH_MAX_RETRIES + 1):
+            if not pending:
+                break
+            
+            prompt = self._build_batch_prompt(
+                {pair: market_data_by_pair[pair] for pair in pending}
+            )
+            started = time.monotonic()
+            try:
+                response_text = await asyncio.wait_for(self._generate(prompt), timeout=deadline)
+            except asyncio.TimeoutError:
+                print(f"Gemini batch prediction timed out after {deadline}s for {pending}")
+                fallback_reason = "timeout"
+                continue
+            except Exception as e:
+                print(f"Gemini batch prediction error: {e}")
+                fallback_reason = "error"
+                continue
+            latency = time.monotonic() - started
+            
+            parsed = self._parse_batch_response(response_text, pending)
+            for pair, prediction in parsed.items():
+                self.cache.put(pair, market_data_by_pair[pair], prediction, latency)
+                results[pair] = prediction
+            pending = [pair for pair in pending if pair not in parsed]
+            fallback_reason = "invalid_response"
+        
+        for pair in pending:
+            results[pair] = self._hold_fallback(
+                fallback_reason,
+                "Unable to get prediction, defaulting to HOLD"
+            )
+        
+        return results
     
     def _build_prediction_prompt(self, pair: str, market_data: dict) -> str:
         """Build the prompt for Gemini."""
@@ -59,38 +381,131 @@ Consider:
 2. Is the current price range still optimal?
 3. What are the risk factors?
 
-Respond in this exact format:
+Respond in this exact format, keeping REASONING as the last field:
 ACTION: [REBALANCE/ADD_LIQUIDITY/REMOVE_LIQUIDITY/HOLD]
-REASONING: [Your detailed explanation]
 RANGE: [Lower]-[Upper] (if ACTION is REBALANCE or ADD_LIQUIDITY)
 CONFIDENCE: [0.0-1.0]
+REASONING: [Your detailed explanation]
 """
         return prompt
     
-    def _parse_response(self, response_text: str) -> dict:
-        """Parse Gemini's response into structured data."""
-        lines = response_text.strip().split('\n')
-        result = {
-            "action": "HOLD",
-            "reasoning": "",
-            "range": None,
-            "confidence": 0.5
-        }
+    def _build_batch_prompt(self, market_data_by_pair: Dict[str, dict]) -> str:
+        """Build one prompt covering several pairs, requesting JSON output."""
+        markets = [
+            {
+                "pair": pair,
+                "price": market_data.get("price", 0),
+                "volume_24h": market_data.get("volume", 0),
+                "volatility_pct": market_data.get("volatility", 0),
+                "trend": market_data.get("trend", "neutral")
+            }
+            for pair, market_data in market_data_by_pair.items()
+        ]
         
-        for line in lines:
-            if line.startswith("ACTION:"):
-                result["action"] = line.split("ACTION:")[1].strip()
-            elif line.startswith("REASONING:"):
-                result["reasoning"] = line.split("REASONING:")[1].strip()
-            elif line.startswith("RANGE:"):
-                result["range"] = line.split("RANGE:")[1].strip()
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    result["confidence"] = float(line.split("CONFIDENCE:")[1].strip())
-                except:
-                    result["confidence"] = 0.5
+        prompt = f"""
+You are a DeFi liquidity management AI analyzing several markets at once.
+
+Current Market Data (JSON):
+{json.dumps(markets, indent=2)}
+
+For EACH pair, determine if we should REBALANCE, ADD_LIQUIDITY, REMOVE_LIQUIDITY, or HOLD.
+
+Consider:
+1. Is volatility high enough to warrant rebalancing?
+2. Is the current price range still optimal?
+3. What are the risk factors?
+
+Respond with ONLY a JSON array, one object per pair, in this exact shape:
+[
+  {{
+    "pair": "<pair exactly as given>",
+    "action": "REBALANCE" | "ADD_LIQUIDITY" | "REMOVE_LIQUIDITY" | "HOLD",
+    "reasoning": "<your explanation>",
+    "range": "<lower>-<upper>" or null,
+    "confidence": <number between 0.0 and 1.0>
+  }}
+]
+"""
+        return prompt
+    
+    def _parse_batch_response(self, response_text: str, pairs: List[str]) -> Dict[str, dict]:
+        """
+        Parse a batched JSON response, keeping only valid per-pair results.
+        
+        Pairs that are absent or fail validation are left out so the caller
+        can retry just those.
+        """
+        text = response_text.strip()
+        # Models often wrap JSON in a markdown code fence
+        fence = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+        if fence:
+            text = fence.group(1)
         
-        return result
+        try:
+            items = json.loads(text)
+        except (ValueError, TypeError):
+            return {}
+        if isinstance(items, dict):
+            items = items.get("predictions", [])
+        if not isinstance(items, list):
+            return {}
+        
+        wanted = {pair.upper(): pair for pair in pairs}
+        results = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            pair = wanted.get(str(item.get("pair", "")).upper())
+            prediction = self._validate_prediction(item)
+            if pair and prediction:
+                results[pair] = prediction
+        return results
+    
+    def _validate_prediction(self, item: dict) -> Optional[dict]:
+        """Normalize one prediction object, or return None if it is invalid."""
+        action = str(item.get("action", "")).strip().upper()
+        if action not in VALID_ACTIONS:
+            return None
+        
+        try:
+            confidence = float(item.get("confidence"))
+        except (TypeError, ValueError):
+            return None
+        if not 0.0 <= confidence <= 1.0:
+            return None
+        
+        price_range = item.get("range")
+        if price_range in (None, "", "null"):
+            price_range = None
+        else:
+            bounds = str(price_range).replace(" ", "").split("-")
+            if len(bounds) != 2:
+                return None
+            try:
+                lower, upper = float(bounds[0]), float(bounds[1])
+            except ValueError:
+                return None
+            if lower >= upper:
+                return None
+            price_range = f"{bounds[0]}-{bounds[1]}"
+        
+        if action in ("REBALANCE", "ADD_LIQUIDITY") and price_range is None:
+            return None
+        
+        return {
+            "action": action,
+            "reasoning": str(item.get("reasoning", "")),
+            "range": price_range,
+            "confidence": confidence,
+            "source": "llm"
+        }
+    
+    def _parse_response(self, response_text: str) -> dict:
+        """Parse Gemini's response into structured data."""
+        parser = StreamingDecisionParser()
+        parser.feed(response_text.strip())
+        parser.close()
+        return parser.result
 
 
 gemini_service = GeminiService()
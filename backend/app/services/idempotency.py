@@ -0,0 +1,205 @@
+"""
+Idempotency - replay or join duplicate requests identified by a client-supplied key
+"""
+import asyncio
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException, Response
+
+from app.config import settings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body."""
+
+
+class IdempotencyInProgress(Exception):
+    """The original request is still running and did not finish in time."""
+
+
+class IdempotencyStore(ABC):
+    """
+    Interface shared by the store backends.
+
+    run() executes compute once per key. Duplicates that arrive while it is
+    running wait for it; duplicates that arrive after it completed get the
+    stored response. Failed requests are not stored, so a retry runs again.
+    """
+
+    @abstractmethod
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        compute: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, bool]:
+        """Return (response, replayed)."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "expires_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.expires_at: Optional[float] = None  # set once completed
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Bounded per-process store; the oldest completed entries are evicted first."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    async def run(self, key, fingerprint, compute):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            entry = None
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was reused with a different request")
+            return await asyncio.shield(entry.future), True
+
+        entry = _Entry(fingerprint, asyncio.get_running_loop().create_future())
+        self._entries[key] = entry
+        self._evict()
+
+        try:
+            result = await compute()
+        except BaseException as e:
+            self._entries.pop(key, None)
+            entry.future.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning
+            entry.future.exception()
+            raise
+
+        entry.future.set_result(result)
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        return result, False
+
+    def _evict(self):
+        if len(self._entries) <= self.max_entries:
+            return
+        # In-flight entries are kept so their duplicates can still join them
+        for key in [k for k, e in self._entries.items() if e.expires_at is not None]:
+            if len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Store shared by every API process, so duplicates are caught across workers."""
+
+    def __init__(self, redis_url: str, ttl_seconds: int, prefix: str = "trustek:idempotency"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def run(self, key, fingerprint, compute):
+        redis_key = f"{self.prefix}:{key}"
+        waited_until = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+        while True:
+            claimed = await self.redis.set(
+                redis_key,
+                json.dumps({"state": "in_flight", "fingerprint": fingerprint}),
+                nx=True,
+                ex=settings.IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS
+            )
+            if claimed:
+                break
+
+            raw = await self.redis.get(redis_key)
+            if raw is None:
+                # The original failed or expired between SET and GET - try to claim again
+                continue
+
+            stored = json.loads(raw)
+            if stored["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was reused with a different request")
+            if stored["state"] == "done":
+                return stored["response"], True
+
+            if time.monotonic() >= waited_until:
+                raise IdempotencyInProgress("The original request is still in progress")
+            await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+
+        try:
+            result = await compute()
+        except BaseException:
+            await self.redis.delete(redis_key)
+            raise
+
+        await self.redis.set(
+            redis_key,
+            json.dumps({"state": "done", "fingerprint": fingerprint, "response": result}),
+            ex=self.ttl_seconds
+        )
+        return result, False
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get the configured idempotency store (IDEMPOTENCY_BACKEND)."""
+    global _store
+    if _store is None:
+        if settings.IDEMPOTENCY_BACKEND == "memory":
+            _store = InMemoryIdempotencyStore(
+                settings.IDEMPOTENCY_MAX_ENTRIES,
+                settings.IDEMPOTENCY_TTL_SECONDS
+            )
+        else:
+            _store = RedisIdempotencyStore(settings.REDIS_URL, settings.IDEMPOTENCY_TTL_SECONDS)
+    return _store
+
+
+async def run_idempotent(
+    idempotency_key: Optional[str],
+    scope: str,
+    user_id: str,
+    request_body: dict,
+    response: Response,
+    handler: Callable[[], Awaitable[dict]]
+) -> dict:
+    """
+    Run an endpoint handler at most once per user and Idempotency-Key.
+
+    Keys are scoped to the user, so two users picking the same key never
+    share a result. Requests without a key run normally. Replayed responses carry an
+    Idempotent-Replayed: true header.
+    """
+    if not idempotency_key:
+        return await handler()
+
+    fingerprint = hashlib.sha256(
+        json.dumps(request_body, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    try:
+        result, replayed = await get_idempotency_store().run(
+            f"{scope}:{user_id}:{idempotency_key}", fingerprint, handler
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
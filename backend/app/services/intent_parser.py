@@ -0,0 +1,231 @@
+"""
+Intent parser - single-pass matcher for voice command actions, assets, amounts and ranges
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.yahoo_finance_service import YahooFinanceService
+from services.token_service import token_service
+
+
+# Word sequences that map to an action, in priority order
+ACTION_PHRASES = {
+    "EXECUTE_STRATEGY": [
+        "execute", "executes", "executing", "trade", "trades", "trading",
+        "rebalance", "run strategy"
+    ],
+    "CHECK_STATUS": ["check", "status"],
+}
+
+# Common spoken names, independent of what the token registry lists
+EXTRA_ALIASES = {
+    "ether": "ETH",
+    "bitcoin": "BTC",
+    "ethereum": "ETH",
+    "solana": "SOL",
+    "cardano": "ADA",
+    "polkadot": "DOT",
+    "dogecoin": "DOGE",
+    "polygon": "MATIC",
+    "tether": "USDT",
+    "usd coin": "USDC",
+}
+
+# Aliases that are also everyday words ("send me the link"). They count as
+# assets only when written as a ticker (uppercase or in a pair like
+# "link/usdc") or within TRADE_CONTEXT_WORDS words of a trade verb.
+AMBIGUOUS_ALIASES = frozenset({
+    "link", "dot", "one", "near", "atom", "gas", "sand", "uni", "comp", "flow", "op"
+})
+TRADE_VERBS = frozenset(
+    [phrase for phrase in ACTION_PHRASES["EXECUTE_STRATEGY"] if " " not in phrase]
+    + ["buy", "sell", "swap"]
+)
+TRADE_CONTEXT_WORDS = 3
+
+_ACTION_RANK = {action: rank for rank, action in enumerate(ACTION_PHRASES)}
+
+DEFAULT_BASE = "ETH"
+DEFAULT_QUOTE = "USDC"
+
+_NUMBER = r"\$?(\d+(?:,\d{3})*(?:\.\d+)?)"
+
+# One tokenizer pass: ranges first, then amounts, then words. A range needs
+# "between X and Y", "range X to Y" or "X-Y", so "buy 2 and sell 3" is two numbers.
+_TOKEN_RE = re.compile(
+    rf"between\s+{_NUMBER}\s*(?:and|-)\s*{_NUMBER}"
+    rf"|range\s+(?:of\s+|from\s+)?{_NUMBER}\s*(?:to|-)\s*{_NUMBER}"
+    rf"|{_NUMBER}\s*-\s*{_NUMBER}"
+    rf"|(?P<number>{_NUMBER})"
+    r"|(?P<word>[a-z][a-z0-9]*)",
+    re.IGNORECASE
+)
+_RANGE_GROUPS = ((1, 2), (3, 4), (5, 6))
+
+
+class IntentMatcher:
+    """
+    Compiled matcher for voice transcripts.
+
+    Phrases (actions and asset aliases) are stored in a word-level trie, so a
+    transcript is scanned once and each token costs a dictionary walk bounded
+    by the longest phrase - independent of how many assets are known. The trie
+    is rebuilt only when the asset vocabulary changes.
+    """
+
+    def __init__(self):
+        # (trie, longest phrase in words), replaced as one object on rebuild
+        self._compiled: Tuple[Dict, int] = ({}, 1)
+        self._fingerprint: Optional[frozenset] = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._fingerprint is not None
+
+    def refresh(self, aliases: Dict[str, str]) -> bool:
+        """
+        Rebuild the matcher if the alias -> symbol vocabulary changed.
+
+        Returns:
+            True if the matcher was rebuilt
+        """
+        fingerprint = frozenset(aliases.items())
+        if fingerprint == self._fingerprint:
+            return False
+
+        trie: Dict = {}
+        max_words = 1
+
+        def add(phrase: str, value: Tuple[str, str]):
+            nonlocal max_words
+            words = phrase.lower().split()
+            if not words:
+                return
+            max_words = max(max_words, len(words))
+            node = trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node.setdefault(None, value)
+
+        for action, phrases in ACTION_PHRASES.items():
+            for phrase in phrases:
+                add(phrase, ("action", action))
+        for alias, symbol in aliases.items():
+            add(alias, ("asset", symbol.upper()))
+
+        # Swap in one assignment so concurrent readers never see a partial trie
+        self._compiled = (trie, max_words)
+        self._fingerprint = fingerprint
+        return True
+
+    def parse(self, transcript: str) -> dict:
+        """
+        Extract action, trading pair, amount and price range from a transcript.
+
+        Returns:
+            Dictionary with action, pair, assets, amount and range
+        """
+        trie, max_phrase_words = self._compiled
+        action_rank = len(ACTION_PHRASES)
+        action = "UNKNOWN"
+        assets: List[str] = []
+        amount = None
+        price_range = None
+        words: List[str] = []
+        # Per word: written as a ticker (uppercase, or next to "/" as in a pair)
+        tickers: List[bool] = []
+
+        for match in _TOKEN_RE.finditer(transcript):
+            word = match.group("word")
+            if word:
+                words.append(word.lower())
+                tickers.append(
+                    word.isupper()
+                    or transcript[match.end():match.end() + 1] == "/"
+                    or (match.start() > 0 and transcript[match.start() - 1] == "/")
+                )
+            elif match.group("number"):
+                if amount is None:
+                    amount = _to_float(match.group("number"))
+            elif price_range is None:
+                low, high = next(
+                    (match.group(lo), match.group(hi)) for lo, hi in _RANGE_GROUPS if match.group(lo)
+                )
+                if _to_float(low) < _to_float(high):
+                    price_range = f"{low.replace(',', '')}-{high.replace(',', '')}"
+                elif amount is None:
+                    amount = _to_float(low)
+
+        trade_positions = [k for k, word in enumerate(words) if word in TRADE_VERBS]
+
+        i = 0
+        while i < len(words):
+            node = trie
+            matched, length = None, 0
+            for j in range(i, min(i + max_phrase_words, len(words))):
+                node = node.get(words[j])
+                if node is None:
+                    break
+                if None in node:
+                    matched, length = node[None], j - i + 1
+
+            if matched is None:
+                i += 1
+                continue
+
+            kind, value = matched
+            if length == 1 and words[i] in AMBIGUOUS_ALIASES and not (
+                tickers[i] or any(abs(k - i) <= TRADE_CONTEXT_WORDS for k in trade_positions)
+            ):
+                # Everyday word, not an asset here
+                i += 1
+                continue
+            if kind == "action":
+                rank = _ACTION_RANK[value]
+                if rank < action_rank:
+                    action, action_rank = value, rank
+            elif value not in assets:
+                assets.append(value)
+            i += length
+
+        return {
+            "action": action,
+            "pair": self._pair(assets),
+            "assets": assets,
+            "amount": amount,
+            "range": price_range
+        }
+
+    @staticmethod
+    def _pair(assets: List[str]) -> str:
+        bases = [symbol for symbol in assets if symbol != DEFAULT_QUOTE]
+        base = bases[0] if bases else DEFAULT_BASE
+        quotes = [symbol for symbol in assets if symbol != base]
+        quote = quotes[0] if quotes else DEFAULT_QUOTE
+        return f"{base}/{quote}"
+
+
+def _to_float(number: str) -> float:
+    return float(number.lstrip("$").replace(",", ""))
+
+
+def build_aliases(tokens: Iterable[dict]) -> Dict[str, str]:
+    """Collect spoken aliases for every listed asset and registry token."""
+    aliases = {alias: symbol for alias, symbol in EXTRA_ALIASES.items()}
+    for symbol in YahooFinanceService.CRYPTO_TICKERS:
+        aliases[symbol.lower()] = symbol
+    for token in tokens:
+        aliases[token["symbol"].lower()] = token["symbol"].upper()
+        aliases[token["name"].lower()] = token["symbol"].upper()
+    return aliases
+
+
+def refresh_intent_matcher() -> bool:
+    """Rebuild the shared matcher from the current asset listings if they changed."""
+    return intent_matcher.refresh(build_aliases(token_service.get_all_tokens()))
+
+
+intent_matcher = IntentMatcher()
+
+# Pick up tokens added by a redeploy
+token_service.on_reload(refresh_intent_matcher)
@@ -0,0 +1,380 @@
+"""
+Job queue - durable background jobs on Redis, with an in-process stand-in
+"""
+import asyncio
+import heapq
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_SUCCEEDED = "succeeded"
+JOB_DEAD = "dead"
+
+TERMINAL_EVENTS = {JOB_SUCCEEDED, JOB_DEAD}
+
+
+class JobQueue(ABC):
+    """
+    Interface shared by the queue backends.
+
+    Delivery is at-least-once: a claimed job stays in its worker's processing
+    list until it is acked, retried or buried, and jobs held by workers that
+    stop heartbeating are put back on the pending list.
+    """
+
+    @abstractmethod
+    async def enqueue(self, kind: str, payload: dict) -> str:
+        """Queue a job and return its id."""
+
+    @abstractmethod
+    async def claim(self, worker_id: str, timeout: float) -> Optional[dict]:
+        """Block up to timeout seconds for the next job and mark it running."""
+
+    @abstractmethod
+    async def ack(self, worker_id: str, job_id: str, result: dict):
+        """Mark a claimed job succeeded with its result."""
+
+    @abstractmethod
+    async def retry(self, worker_id: str, job_id: str, delay: float, error: str):
+        """Schedule a failed job to run again after delay seconds."""
+
+    @abstractmethod
+    async def bury(self, worker_id: str, job_id: str, error: str):
+        """Move a job that will not be retried to the dead-letter queue."""
+
+    @abstractmethod
+    async def promote_due(self) -> int:
+        """Move retries whose delay has elapsed back to the pending list."""
+
+    @abstractmethod
+    async def heartbeat(self, worker_id: str):
+        """Mark the worker alive for JOB_WORKER_HEARTBEAT_TTL_SECONDS."""
+
+    @abstractmethod
+    async def requeue_orphans(self) -> int:
+        """Return jobs held by workers that stopped heartbeating to the pending list."""
+
+    @abstractmethod
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        """The job's status, attempts and result, or None if unknown or expired."""
+
+    @abstractmethod
+    async def add_event(self, job_id: str, event_type: str, data: Optional[dict] = None):
+        """Append a progress event to the job's event log."""
+
+    @abstractmethod
+    async def get_events(self, job_id: str, start: int = 0) -> List[dict]:
+        """The job's events from index start on."""
+
+    @abstractmethod
+    async def dead_letters(self, limit: int = 100) -> List[str]:
+        """Ids of the most recently buried jobs."""
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _event(event_type: str, data: Optional[dict]) -> dict:
+        return {"type": event_type, "timestamp": time.time(), **(data or {})}
+
+
+# KEYS: delayed set, pending list; ARGV: current time
+_PROMOTE_DUE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('LPUSH', KEYS[2], job_id)
+end
+return #due
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """Queue backed by Redis lists, so any number of worker processes can share it."""
+
+    def __init__(self, redis_url: str, prefix: str = "trustek:jobs"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.prefix = prefix
+        self.pending_key = f"{prefix}:pending"
+        self.delayed_key = f"{prefix}:delayed"
+        self.dead_key = f"{prefix}:dead"
+        self.workers_key = f"{prefix}:workers"
+        self._promote_due_script = self.redis.register_script(_PROMOTE_DUE_LUA)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _events_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}:events"
+
+    def _processing_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:processing:{worker_id}"
+
+    def _heartbeat_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:worker:{worker_id}"
+
+    async def enqueue(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        job_key = self._job_key(job_id)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key, mapping={
+                "id": job_id,
+                "kind": kind,
+                "payload": json.dumps(payload),
+                "status": JOB_QUEUED,
+                "attempts": 0,
+                "created_at": time.time()
+            })
+            pipe.expire(job_key, settings.JOB_RESULT_TTL_SECONDS)
+            pipe.lpush(self.pending_key, job_id)
+            await pipe.execute()
+
+        await self.add_event(job_id, JOB_QUEUED)
+        return job_id
+
+    async def claim(self, worker_id: str, timeout: float) -> Optional[dict]:
+        job_id = await self.redis.blmove(
+            self.pending_key, self._processing_key(worker_id), timeout, "RIGHT", "LEFT"
+        )
+        if job_id is None:
+            return None
+
+        job_key = self._job_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(job_key, "attempts", 1)
+            pipe.hset(job_key, "status", JOB_RUNNING)
+            pipe.hgetall(job_key)
+            _, _, raw = await pipe.execute()
+
+        if not raw.get("kind"):
+            # Job hash expired while queued - drop it
+            await self.redis.lrem(self._processing_key(worker_id), 1, job_id)
+            return None
+        return self._decode(raw)
+
+    async def ack(self, worker_id: str, job_id: str, result: dict):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "status": JOB_SUCCEEDED,
+                "result": json.dumps(result),
+                "finished_at": time.time()
+            })
+            pipe.lrem(self._processing_key(worker_id), 1, job_id)
+            await pipe.execute()
+        await self.add_event(job_id, JOB_SUCCEEDED, {"result": result})
+
+    async def retry(self, worker_id: str, job_id: str, delay: float, error: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={"status": JOB_RETRYING, "error": error})
+            pipe.zadd(self.delayed_key, {job_id: time.time() + delay})
+            pipe.lrem(self._processing_key(worker_id), 1, job_id)
+            await pipe.execute()
+        await self.add_event(job_id, JOB_RETRYING, {"error": error, "delay": delay})
+
+    async def bury(self, worker_id: str, job_id: str, error: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "status": JOB_DEAD,
+                "error": error,
+                "finished_at": time.time()
+            })
+            pipe.lpush(self.dead_key, job_id)
+            pipe.lrem(self._processing_key(worker_id), 1, job_id)
+            await pipe.execute()
+        await self.add_event(job_id, JOB_DEAD, {"error": error})
+
+    async def promote_due(self) -> int:
+        # One script, so a job is never out of both the delayed set and the
+        # pending list, and concurrent promoters cannot move it twice
+        return await self._promote_due_script(
+            keys=[self.delayed_key, self.pending_key], args=[time.time()]
+        )
+
+    async def heartbeat(self, worker_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._heartbeat_key(worker_id), 1, ex=settings.JOB_WORKER_HEARTBEAT_TTL_SECONDS)
+            pipe.sadd(self.workers_key, worker_id)
+            await pipe.execute()
+
+    async def requeue_orphans(self) -> int:
+        requeued = 0
+        for worker_id in await self.redis.smembers(self.workers_key):
+            if await self.redis.exists(self._heartbeat_key(worker_id)):
+                continue
+            while await self.redis.lmove(
+                self._processing_key(worker_id), self.pending_key, "RIGHT", "LEFT"
+            ):
+                requeued += 1
+            await self.redis.srem(self.workers_key, worker_id)
+        return requeued
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        raw = await self.redis.hgetall(self._job_key(job_id))
+        return self._decode(raw) if raw else None
+
+    async def add_event(self, job_id: str, event_type: str, data: Optional[dict] = None):
+        events_key = self._events_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(events_key, json.dumps(self._event(event_type, data)))
+            pipe.expire(events_key, settings.JOB_RESULT_TTL_SECONDS)
+            await pipe.execute()
+
+    async def get_events(self, job_id: str, start: int = 0) -> List[dict]:
+        return [json.loads(event) for event in await self.redis.lrange(self._events_key(job_id), start, -1)]
+
+    async def dead_letters(self, limit: int = 100) -> List[str]:
+        return await self.redis.lrange(self.dead_key, 0, limit - 1)
+
+    async def close(self):
+        await self.redis.aclose()
+
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> dict:
+        job = dict(raw)
+        job["attempts"] = int(job.get("attempts", 0))
+        for field in ("payload", "result"):
+            if job.get(field):
+                job[field] = json.loads(job[field])
+        return job
+
+
+class InMemoryJobQueue(JobQueue):
+    """
+    In-process stand-in for tests and single-process development.
+
+    Finished and dead jobs are dropped with their events ttl_seconds after
+    they finish, as the Redis hashes expire.
+    """
+
+    def __init__(self, ttl_seconds: float = settings.JOB_RESULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, dict] = {}
+        self._events: Dict[str, List[dict]] = {}
+        # (expires_at, job_id) in finishing order
+        self._expiry: deque = deque()
+        self._pending: deque = deque()
+        self._delayed: List = []
+        self._dead: List[str] = []
+        self._processing: Dict[str, set] = {}
+        self._available = asyncio.Event()
+
+    async def enqueue(self, kind: str, payload: dict) -> str:
+        self._prune()
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "created_at": time.time()
+        }
+        self._push(job_id)
+        await self.add_event(job_id, JOB_QUEUED)
+        return job_id
+
+    async def claim(self, worker_id: str, timeout: float) -> Optional[dict]:
+        if not self._pending:
+            self._available.clear()
+            try:
+                await asyncio.wait_for(self._available.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        if not self._pending:
+            return None
+
+        job_id = self._pending.pop()
+        self._processing.setdefault(worker_id, set()).add(job_id)
+        job = self._jobs[job_id]
+        job["attempts"] += 1
+        job["status"] = JOB_RUNNING
+        return dict(job)
+
+    async def ack(self, worker_id: str, job_id: str, result: dict):
+        self._jobs[job_id].update(status=JOB_SUCCEEDED, result=result, finished_at=time.time())
+        self._processing.get(worker_id, set()).discard(job_id)
+        self._expiry.append((time.time() + self.ttl_seconds, job_id))
+        await self.add_event(job_id, JOB_SUCCEEDED, {"result": result})
+
+    async def retry(self, worker_id: str, job_id: str, delay: float, error: str):
+        self._jobs[job_id].update(status=JOB_RETRYING, error=error)
+        heapq.heappush(self._delayed, (time.time() + delay, job_id))
+        self._processing.get(worker_id, set()).discard(job_id)
+        await self.add_event(job_id, JOB_RETRYING, {"error": error, "delay": delay})
+
+    async def bury(self, worker_id: str, job_id: str, error: str):
+        self._jobs[job_id].update(status=JOB_DEAD, error=error, finished_at=time.time())
+        self._dead.insert(0, job_id)
+        self._processing.get(worker_id, set()).discard(job_id)
+        self._expiry.append((time.time() + self.ttl_seconds, job_id))
+        await self.add_event(job_id, JOB_DEAD, {"error": error})
+
+    async def promote_due(self) -> int:
+        self._prune()
+        promoted = 0
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, job_id = heapq.heappop(self._delayed)
+            self._push(job_id)
+            promoted += 1
+        return promoted
+
+    async def heartbeat(self, worker_id: str):
+        pass
+
+    async def requeue_orphans(self) -> int:
+        # Workers share this process, so none can disappear without it
+        return 0
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def add_event(self, job_id: str, event_type: str, data: Optional[dict] = None):
+        self._events.setdefault(job_id, []).append(self._event(event_type, data))
+
+    async def get_events(self, job_id: str, start: int = 0) -> List[dict]:
+        return self._events.get(job_id, [])[start:]
+
+    async def dead_letters(self, limit: int = 100) -> List[str]:
+        return self._dead[:limit]
+
+    def _push(self, job_id: str):
+        self._pending.appendleft(job_id)
+        self._available.set()
+
+    def _prune(self):
+        now = time.time()
+        expired = set()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, job_id = self._expiry.popleft()
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+            expired.add(job_id)
+        if expired:
+            self._dead = [job_id for job_id in self._dead if job_id not in expired]
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get the configured job queue instance (JOB_QUEUE_BACKEND)."""
+    global _job_queue
+    if _job_queue is None:
+        if settings.JOB_QUEUE_BACKEND == "memory":
+            _job_queue = InMemoryJobQueue()
+        else:
+            _job_queue = RedisJobQueue(settings.REDIS_URL)
+    return _job_queue
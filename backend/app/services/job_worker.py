@@ -0,0 +1,110 @@
+"""
+Job worker - drains the job queue with retries, backoff and a dead-letter queue
+"""
+import asyncio
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.services.job_queue import JobQueue
+
+# handler(payload, report) -> result; report(event_type, data) publishes progress
+JobHandler = Callable[[dict, Callable[[str, dict], Awaitable[None]]], Awaitable[dict]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix or must not repeat; the job goes straight to the dead-letter queue."""
+
+
+def register_handler(kind: str, handler: JobHandler):
+    """Register the coroutine that processes jobs of the given kind."""
+    _handlers[kind] = handler
+
+
+class JobWorker:
+    """
+    Pool of consumers for one process.
+
+    Run more processes (see worker.py) to scale horizontally; they coordinate
+    only through the queue.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        for slot in range(self.concurrency):
+            await self.queue.heartbeat(f"{self.worker_id}:{slot}")
+        self._tasks = [asyncio.create_task(self._maintain())]
+        for slot in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._consume(f"{self.worker_id}:{slot}")))
+        print(f"Job worker {self.worker_id} started with {self.concurrency} consumers")
+
+    async def stop(self):
+        """Let in-flight jobs finish, then stop consuming."""
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _consume(self, consumer_id: str):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(consumer_id, timeout=settings.JOB_CLAIM_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                await asyncio.sleep(settings.JOB_CLAIM_TIMEOUT_SECONDS)
+                continue
+            if job is not None:
+                await self._process(consumer_id, job)
+
+    async def _process(self, consumer_id: str, job: dict):
+        job_id = job["id"]
+        handler = _handlers.get(job["kind"])
+
+        async def report(event_type: str, data: Optional[dict] = None):
+            await self.queue.add_event(job_id, event_type, data)
+
+        if handler is None:
+            await self.queue.bury(consumer_id, job_id, f"No handler for job kind '{job['kind']}'")
+            return
+
+        await report("started", {"attempt": job["attempts"]})
+        try:
+            result = await handler(job["payload"], report)
+        except PermanentJobError as e:
+            await self.queue.bury(consumer_id, job_id, str(e))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= settings.JOB_MAX_ATTEMPTS:
+                await self.queue.bury(consumer_id, job_id, error)
+            else:
+                await self.queue.retry(consumer_id, job_id, self._backoff(job["attempts"]), error)
+        else:
+            await self.queue.ack(consumer_id, job_id, result)
+
+    async def _maintain(self):
+        """Heartbeat, promote due retries and recover jobs from dead workers."""
+        while not self._stopping.is_set():
+            try:
+                for slot in range(self.concurrency):
+                    await self.queue.heartbeat(f"{self.worker_id}:{slot}")
+                await self.queue.promote_due()
+                await self.queue.requeue_orphans()
+            except Exception as e:
+                print(f"Job queue maintenance failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_MAINTENANCE_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+        return min(delay, settings.JOB_RETRY_BACKOFF_MAX_SECONDS)
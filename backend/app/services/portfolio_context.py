@@ -0,0 +1,166 @@
+"""
+Portfolio context - loads the inputs of one portfolio request once, concurrently
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.services.profile_cache import profile_cache
+from app.services.token_ledger import RPCError, token_ledger
+from app.services.transaction_history import fetch_transactions_page
+from app.services.valuation_engine import value_holdings
+from app.services.yahoo_finance_service import YahooFinanceService
+from services.token_service import token_service
+
+MARKET_SYMBOLS = ['ETH', 'BTC', 'USDC', 'USDT', 'ADA', 'SOL', 'BNB', 'DOT', 'DOGE', 'MATIC']
+
+DEFAULT_PROFILE = {"risk_tolerance": 5, "starknet_address": None}
+
+STATS_COLUMNS = (
+    "total_transactions, total_deposits, total_withdrawals, total_trades, "
+    "successful_trades, version, updated_at"
+)
+
+RECENT_TRANSACTIONS = 5
+
+INPUTS = ("profile", "prices", "holdings", "stats", "recent_transactions")
+
+# Profile columns that appear in portfolio responses
+PROFILE_VERSION_COLUMNS = ("starknet_address", "risk_tolerance", "last_balance_sync")
+
+
+async def load_holdings(wallet_address: Optional[str], price_dict: dict) -> Tuple[List, dict, str]:
+    """
+    The user's tokens and their valuation.
+
+    Balances are read on-chain for a connected wallet. Without one, or if the
+    node cannot be reached, the shared development balances from the token
+    service are used.
+
+    Returns:
+        (tokens, valuation from value_holdings, "onchain" | "registry")
+    """
+    if wallet_address:
+        try:
+            tokens = await token_ledger.get_holdings(wallet_address, token_service.get_all_tokens())
+            return tokens, value_holdings(tokens, price_dict), "onchain"
+        except (RPCError, ValueError) as e:
+            print(f"On-chain balances unavailable for {wallet_address}: {e}")
+    return list(token_service.get_all_tokens()), token_service.get_portfolio_value(price_dict), "registry"
+
+
+def holdings_version(tokens, balance_source: str) -> tuple:
+    """Identifies the balances behind a valuation, for ETags."""
+    if balance_source == "registry":
+        return ("registry", token_service.version)
+    return ("onchain", tuple((t["address"], t["symbol"], t["raw_balance"]) for t in tokens))
+
+
+class PortfolioContext:
+    """
+    Request-scoped loader for everything a portfolio response is built from.
+
+    Each input (profile, market prices, holdings, transaction stats, recent
+    transactions) is loaded at most once per request, however many sections
+    use it, and independent inputs load concurrently. Price quotes come from
+    a blocking client, so they are fetched in a worker thread.
+    """
+
+    def __init__(self, supabase, user_id: str, symbols: Sequence[str] = MARKET_SYMBOLS):
+        self.supabase = supabase
+        self.user_id = user_id
+        self.symbols = list(symbols)
+        self._tasks: Dict[str, asyncio.Future] = {}
+
+    async def load(self, *inputs: str):
+        """Load the named inputs concurrently (e.g. "profile", "prices", "stats")."""
+        await asyncio.gather(*(getattr(self, name)() for name in inputs))
+
+    def profile(self) -> Awaitable[dict]:
+        return self._once("profile", self._load_profile)
+
+    def prices(self) -> Awaitable[Dict[str, dict]]:
+        return self._once(
+            "prices",
+            lambda: asyncio.to_thread(YahooFinanceService.get_multiple_prices, self.symbols)
+        )
+
+    def holdings(self) -> Awaitable[Tuple[List, dict, str]]:
+        """(tokens, valuation, balance_source); needs the profile and the prices."""
+        return self._once("holdings", self._load_holdings)
+
+    def stats(self) -> Awaitable[Optional[dict]]:
+        """The user's transaction_stats row, or None before their first transaction."""
+        return self._once("stats", self._load_stats)
+
+    def recent_transactions(self) -> Awaitable[List[dict]]:
+        return self._once("recent_transactions", self._load_recent_transactions)
+
+    async def version(self, inputs: Sequence[str] = INPUTS) -> dict:
+        """
+        Versions of the given inputs, for ETags, from cheap counters only.
+
+        Recent transactions are versioned by the stats row, whose version
+        changes with every transaction. Holdings are versioned by the wallet,
+        the chain head and the token registry version, since balances are
+        only re-read per block, so the balances are not loaded for this.
+        """
+        inputs = ["stats" if name == "recent_transactions" else name for name in inputs]
+        await self.load(*{"profile" if name == "holdings" else name for name in inputs})
+        versions = {}
+        for name in inputs:
+            if name == "profile":
+                profile = self.profile().result()
+                versions[name] = tuple(profile.get(column) for column in PROFILE_VERSION_COLUMNS)
+            elif name == "prices":
+                symbols = sorted(self.prices().result())
+                versions[name] = (symbols, YahooFinanceService.price_versions(symbols))
+            elif name == "holdings":
+                versions[name] = await self._holdings_version()
+            elif name == "stats":
+                stats = self.stats().result()
+                versions[name] = stats and (stats["version"], stats["updated_at"])
+        return versions
+
+    def _once(self, name: str, factory: Callable[[], Awaitable]) -> asyncio.Future:
+        task = self._tasks.get(name)
+        if task is None:
+            task = self._tasks[name] = asyncio.ensure_future(factory())
+        return task
+
+    async def _load_profile(self) -> dict:
+        try:
+            profile = await profile_cache.get(self.supabase, self.user_id)
+        except Exception as e:
+            # Profile doesn't exist, use defaults
+            print(f"Profile not found for user {self.user_id}: {e}")
+            profile = None
+        return profile or dict(DEFAULT_PROFILE)
+
+    async def _holdings_version(self) -> tuple:
+        wallet_address = self.profile().result().get("starknet_address")
+        if not wallet_address:
+            return ("registry", token_service.version)
+        try:
+            return (
+                "onchain", hex(int(wallet_address, 16)),
+                await token_ledger.current_block(), token_service.version
+            )
+        except (RPCError, ValueError):
+            # load_holdings falls back to the registry too; version what it returns
+            tokens, _, source = await self.holdings()
+            return holdings_version(tokens, source)
+
+    async def _load_holdings(self) -> Tuple[List, dict, str]:
+        profile, prices = await asyncio.gather(self.profile(), self.prices())
+        price_dict = {symbol: data.get('price', 0) for symbol, data in prices.items()}
+        return await load_holdings(profile.get("starknet_address"), price_dict)
+
+    async def _load_stats(self) -> Optional[dict]:
+        response = await self.supabase.table("transaction_stats").select(STATS_COLUMNS).eq(
+            "user_id", self.user_id
+        ).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    async def _load_recent_transactions(self) -> List[dict]:
+        rows, _ = await fetch_transactions_page(self.supabase, self.user_id, limit=RECENT_TRANSACTIONS)
+        return rows
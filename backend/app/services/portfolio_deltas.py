@@ -0,0 +1,184 @@
+"""
+Portfolio deltas - patches between the portfolio documents a client has seen
+"""
+import copy
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+Path = Tuple[str, ...]
+
+
+class Patch:
+    """
+    Set/unset operations on a JSON document, addressed by key paths.
+
+    Unsets are applied before sets. No set path lies under another set
+    path, so two patches compose exactly: applying compose(a, b) equals
+    applying a, then b.
+    """
+
+    def __init__(self):
+        self.sets: Dict[Path, Any] = {}
+        self.unsets: List[Path] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.sets or self.unsets)
+
+    def set(self, path: Path, value):
+        ancestor = self._set_ancestor(path)
+        if ancestor is not None:
+            # Edit the pending value instead of adding a nested set
+            _assign(self.sets[ancestor], path[len(ancestor):], copy.deepcopy(value))
+            return
+        self._drop_under(path)
+        self.sets[path] = copy.deepcopy(value)
+
+    def unset(self, path: Path):
+        ancestor = self._set_ancestor(path)
+        if ancestor is not None:
+            _remove(self.sets[ancestor], path[len(ancestor):])
+            return
+        self._drop_under(path)
+        self.unsets = [p for p in self.unsets if p[:len(path)] != path] + [path]
+
+    def then(self, other: "Patch") -> "Patch":
+        """This patch followed by other, as one patch."""
+        combined = Patch()
+        combined.sets = copy.deepcopy(self.sets)
+        combined.unsets = list(self.unsets)
+        for path in other.unsets:
+            combined.unset(path)
+        for path, value in other.sets.items():
+            combined.set(path, value)
+        return combined
+
+    def apply(self, document: dict) -> dict:
+        document = copy.deepcopy(document)
+        for path in self.unsets:
+            _remove(document, path)
+        for path, value in self.sets.items():
+            _assign(document, path, copy.deepcopy(value))
+        return document
+
+    def to_json(self) -> dict:
+        """Paths as JSON Pointers (RFC 6901)."""
+        return {
+            "unset": [_pointer(path) for path in self.unsets],
+            "set": {_pointer(path): value for path, value in self.sets.items()}
+        }
+
+    def _set_ancestor(self, path: Path) -> Optional[Path]:
+        for i in range(len(path) - 1, 0, -1):
+            if path[:i] in self.sets:
+                return path[:i]
+        return None
+
+    def _drop_under(self, path: Path):
+        for existing in [p for p in self.sets if p[:len(path)] == path]:
+            del self.sets[existing]
+
+
+def diff(old: dict, new: dict, prefix: Path = ()) -> Patch:
+    """Smallest patch turning old into new, descending into nested objects."""
+    patch = Patch()
+    _diff_into(patch, old, new, prefix)
+    return patch
+
+
+def _diff_into(patch: Patch, old: dict, new: dict, prefix: Path):
+    for key in old:
+        if key not in new:
+            patch.unset(prefix + (key,))
+    for key, value in new.items():
+        path = prefix + (key,)
+        if key not in old:
+            patch.set(path, value)
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            _diff_into(patch, old[key], value, path)
+        elif value != old[key] or type(value) is not type(old[key]):
+            patch.set(path, value)
+
+
+def _assign(document: dict, path: Path, value):
+    for key in path[:-1]:
+        if not isinstance(document.get(key), dict):
+            document[key] = {}
+        document = document[key]
+    document[path[-1]] = value
+
+
+def _remove(document: dict, path: Path):
+    for key in path[:-1]:
+        document = document.get(key)
+        if not isinstance(document, dict):
+            return
+    document.pop(path[-1], None)
+
+
+def _pointer(path: Path) -> str:
+    return "".join("/" + str(key).replace("~", "~0").replace("/", "~1") for key in path)
+
+
+class PortfolioDeltaTracker:
+    """
+    Per-user history of portfolio document versions.
+
+    Only the latest document is kept, together with one cumulative patch
+    from each of the previous history versions to it, so a client that
+    sends any recent version gets exactly the changes since then. Older or
+    unknown versions (including ones from another process) get None and
+    should be sent a full snapshot.
+    """
+
+    def __init__(self, history: int, max_users: int):
+        self.history = history
+        self.max_users = max_users
+        # user_id -> (version, document, {older version: patch to document})
+        self._users: "OrderedDict[str, Tuple[str, dict, OrderedDict]]" = OrderedDict()
+
+    def latest(self, user_id: str) -> Optional[Tuple[str, dict]]:
+        entry = self._users.get(user_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def update(self, user_id: str, version: str, document: dict) -> Tuple[str, dict]:
+        """
+        Record the user's current document.
+
+        Returns:
+            (version, document) now held as the latest; a document built for
+            a version that is already the latest does not replace it
+        """
+        entry = self._users.get(user_id)
+        if entry is None:
+            self._users[user_id] = (version, document, OrderedDict())
+        elif entry[0] != version:
+            old_version, old_document, patches = entry
+            step = diff(old_document, document)
+            for base in patches:
+                patches[base] = patches[base].then(step)
+            patches[old_version] = step
+            while len(patches) > self.history:
+                patches.popitem(last=False)
+            self._users[user_id] = (version, document, patches)
+
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return self.latest(user_id)
+
+    def patch_since(self, user_id: str, since: str) -> Optional[Patch]:
+        """Changes from version since to the latest document, or None if unknown."""
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] == since:
+            return Patch()
+        return entry[2].get(since)
+
+
+portfolio_deltas = PortfolioDeltaTracker(
+    history=settings.PORTFOLIO_DELTA_HISTORY,
+    max_users=settings.PORTFOLIO_DELTA_MAX_USERS
+)
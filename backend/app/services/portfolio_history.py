@@ -0,0 +1,159 @@
+"""
+Portfolio history - records portfolio value snapshots into 1m/1h/1d rollups and reads them back
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+from app.config import settings
+from app.db.supabase import get_supabase
+
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1)
+}
+
+# Range served when the caller gives no start
+DEFAULT_WINDOWS = {
+    "1m": timedelta(hours=6),
+    "1h": timedelta(days=7),
+    "1d": timedelta(days=365)
+}
+
+MAX_POINTS = 1000
+
+
+class PortfolioHistory:
+    """
+    Snapshot pipeline for portfolio value over time.
+
+    record() is cheap to call on every portfolio computation: snapshots are
+    throttled per user and written in the background with one RPC that
+    updates the 1m, 1h and 1d buckets together. Retention is applied by
+    prune_portfolio_value_history() in the database.
+    """
+
+    def __init__(self, min_interval_seconds: float, max_tracked_users: int = 100000):
+        self.min_interval_seconds = min_interval_seconds
+        self.max_tracked_users = max_tracked_users
+        self._last_recorded: "OrderedDict[str, float]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def record(self, user_id: str, value_usd: float, holdings: Optional[Dict[str, float]] = None) -> bool:
+        """
+        Schedule a snapshot of the user's portfolio value.
+
+        Returns:
+            False if the user was snapshotted less than min_interval_seconds ago
+        """
+        now = time.monotonic()
+        last = self._last_recorded.get(user_id)
+        if last is not None and now - last < self.min_interval_seconds:
+            return False
+
+        self._last_recorded[user_id] = now
+        self._last_recorded.move_to_end(user_id)
+        while len(self._last_recorded) > self.max_tracked_users:
+            self._last_recorded.popitem(last=False)
+
+        task = asyncio.create_task(self._write(user_id, value_usd, holdings, datetime.now(timezone.utc)))
+        # Keep a reference until done so the task is not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _write(self, user_id: str, value_usd: float, holdings: Optional[dict], at: datetime):
+        try:
+            supabase = await get_supabase()
+            await supabase.rpc("record_portfolio_snapshot", {
+                "p_user_id": user_id,
+                "p_value_usd": value_usd,
+                "p_holdings": holdings,
+                "p_at": at.isoformat()
+            }).execute()
+        except Exception as e:
+            print(f"Could not record portfolio snapshot for {user_id}: {e}")
+
+    async def query(
+        self,
+        supabase,
+        user_id: str,
+        resolution: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        include_holdings: bool = False
+    ) -> dict:
+        """
+        Read a chart-ready series from one rollup.
+
+        Args:
+            supabase: Async Supabase client
+            user_id: Owner of the history
+            resolution: "1m", "1h" or "1d"; picked from the range when omitted
+            start: Range start (defaults to the resolution's default window)
+            end: Range end (defaults to now)
+            include_holdings: Also return holdings per bucket
+
+        Returns:
+            Dictionary with resolution, start, end and points
+        """
+        end = self._as_utc(end) if end else datetime.now(timezone.utc)
+        if start:
+            start = self._as_utc(start)
+        if resolution is None:
+            resolution = self.pick_resolution(start, end) if start else "1h"
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+        if start is None:
+            start = end - DEFAULT_WINDOWS[resolution]
+        if start > end:
+            raise ValueError("start must be before end")
+
+        columns = "bucket_start, open_usd, high_usd, low_usd, close_usd"
+        if include_holdings:
+            columns += ", holdings"
+
+        response = await supabase.table("portfolio_value_history").select(columns).eq(
+            "user_id", user_id
+        ).eq("resolution", resolution).gte(
+            "bucket_start", start.isoformat()
+        ).lte("bucket_start", end.isoformat()).order("bucket_start").limit(MAX_POINTS).execute()
+
+        points: List[dict] = []
+        for row in response.data or []:
+            point = {
+                "t": row["bucket_start"],
+                "open": float(row["open_usd"]),
+                "high": float(row["high_usd"]),
+                "low": float(row["low_usd"]),
+                "close": float(row["close_usd"])
+            }
+            if include_holdings:
+                point["holdings"] = row.get("holdings")
+            points.append(point)
+
+        return {
+            "resolution": resolution,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "points": points
+        }
+
+    @staticmethod
+    def pick_resolution(start: datetime, end: datetime) -> str:
+        """Finest resolution that covers the range in at most MAX_POINTS buckets."""
+        span = end - start
+        for resolution, step in RESOLUTIONS.items():
+            if span / step <= MAX_POINTS:
+                return resolution
+        return "1d"
+
+    @staticmethod
+    def _as_utc(value: datetime) -> datetime:
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+portfolio_history = PortfolioHistory(settings.PORTFOLIO_HISTORY_MIN_INTERVAL_SECONDS)
@@ -0,0 +1,178 @@
+"""
+Prediction cache - memoizes Gemini decisions per quantized market state
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+
+
+class PredictionCache:
+    """
+    Bounded TTL cache for market predictions.
+
+    Market data is bucketed before it is used as a key, so requests for the
+    same pair under near-identical conditions share one LLM decision.
+    Concurrent misses on the same key are coalesced into a single upstream call.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        price_bucket_pct: float,
+        volatility_bucket: float,
+        volume_bucket_pct: float
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.price_bucket_pct = price_bucket_pct
+        self.volatility_bucket = volatility_bucket
+        self.volume_bucket_pct = volume_bucket_pct
+
+        # key -> (expires_at, prediction, upstream latency in seconds)
+        self._entries: "OrderedDict[Tuple, Tuple[float, dict, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_latency_seconds = 0.0
+        self.upstream_latency_seconds = 0.0
+
+    def make_key(self, pair: str, market_data: dict) -> Tuple:
+        """Quantize market data into a hashable cache key."""
+        price = float(market_data.get("price", 0) or 0)
+        volume = float(market_data.get("volume", 0) or 0)
+        volatility = float(market_data.get("volatility", 0) or 0)
+        trend = str(market_data.get("trend", "neutral")).lower()
+
+        return (
+            pair.upper(),
+            self._log_bucket(price, self.price_bucket_pct),
+            round(volatility / self.volatility_bucket) if self.volatility_bucket > 0 else volatility,
+            self._log_bucket(volume, self.volume_bucket_pct),
+            trend
+        )
+
+    async def get_or_compute(
+        self,
+        pair: str,
+        market_data: dict,
+        compute: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        """
+        Return a cached prediction or compute it once for all concurrent callers.
+
+        Args:
+            pair: Trading pair
+            market_data: Market data used for the prediction
+            compute: Zero-argument coroutine factory performing the upstream call
+
+        Returns:
+            A copy of the prediction dictionary
+        """
+        key = self.make_key(pair, market_data)
+
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+
+        # Shield so one caller going away does not cancel the shared call
+        return dict(await asyncio.shield(task))
+
+    async def _fill(self, key: Tuple, compute: Callable[[], Awaitable[dict]]) -> dict:
+        """Run the upstream call and store successful predictions."""
+        started = time.monotonic()
+        try:
+            prediction = await compute()
+        finally:
+            self._inflight.pop(key, None)
+
+        self._record(key, prediction, time.monotonic() - started)
+        return prediction
+
+    def get(self, pair: str, market_data: dict) -> Optional[dict]:
+        """Return a fresh cached prediction without computing on a miss."""
+        return self._lookup(self.make_key(pair, market_data))
+
+    def put(self, pair: str, market_data: dict, prediction: dict, latency: float):
+        """Record a prediction obtained outside get_or_compute (e.g. in a batch)."""
+        self.misses += 1
+        self._record(self.make_key(pair, market_data), prediction, latency)
+
+    def _lookup(self, key: Tuple) -> Optional[dict]:
+        """Return a copy of a fresh entry, counting the hit."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, prediction, latency = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_latency_seconds += latency
+        return dict(prediction)
+
+    def _record(self, key: Tuple, prediction: dict, latency: float):
+        """Account upstream latency and store successful predictions."""
+        self.upstream_latency_seconds += latency
+
+        # Fallback HOLDs (timeouts, errors) should be retried, not cached
+        if not prediction.get("fallback_reason") and self.ttl_seconds > 0:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, prediction, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hit ratio and latency saved since startup."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
+            "avg_upstream_latency_seconds": (
+                self.upstream_latency_seconds / self.misses if self.misses else 0.0
+            ),
+            "saved_latency_seconds": round(self.saved_latency_seconds, 3)
+        }
+
+    def clear(self):
+        """Drop all cached predictions."""
+        self._entries.clear()
+
+    @staticmethod
+    def _log_bucket(value: float, step_pct: float) -> int:
+        """Bucket a positive value on a logarithmic scale of step_pct percent."""
+        if value <= 0 or step_pct <= 0:
+            return 0
+        return int(round(math.log(value) / math.log1p(step_pct / 100)))
+
+
+prediction_cache = PredictionCache(
+    ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS,
+    max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+    price_bucket_pct=settings.PREDICTION_CACHE_PRICE_BUCKET_PCT,
+    volatility_bucket=settings.PREDICTION_CACHE_VOLATILITY_BUCKET,
+    volume_bucket_pct=settings.PREDICTION_CACHE_VOLUME_BUCKET_PCT
+)
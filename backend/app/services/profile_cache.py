@@ -0,0 +1,149 @@
+"""
+Profile cache - bounded TTL cache of user_profiles rows for hot read paths
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+
+# Only the columns the API actually reads
+PROFILE_COLUMNS = "user_id, starknet_address, risk_tolerance, vault_balance, last_balance_sync"
+
+
+class ProfileCache:
+    """
+    Per-user profile cache.
+
+    Missing profiles are cached too, so unknown users do not hit the database
+    on every poll. Local writes call invalidate(); writes from other processes
+    become visible within ttl_seconds. Concurrent misses for the same user share
+    one query.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # user_id -> (expires_at, profile or None)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._on_lookup: Optional[Callable[[str], None]] = None
+
+    def set_metrics_hook(self, hook: Optional[Callable[[str], None]]):
+        """Call hook("hit" | "miss" | "coalesced") on every lookup, e.g. to feed a metrics counter."""
+        self._on_lookup = hook
+
+    async def get(self, supabase, user_id: str) -> Optional[dict]:
+        """
+        Return the user's profile, loading it on a miss.
+
+        Args:
+            supabase: Async Supabase client
+            user_id: User to look up
+
+        Returns:
+            A copy of the profile row, or None if the user has no profile
+        """
+        return await self.get_or_load(user_id, lambda: self._load(supabase, user_id))
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        load: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        """Return a cached profile or run load once for all concurrent callers."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, profile = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self._count("hit")
+                return dict(profile) if profile is not None else None
+            del self._entries[user_id]
+
+        task = self._inflight.get(user_id)
+        if task is None:
+            self._count("miss")
+            task = asyncio.ensure_future(self._fill(user_id, load))
+            self._inflight[user_id] = task
+        else:
+            self._count("coalesced")
+
+        profile = await asyncio.shield(task)
+        return dict(profile) if profile is not None else None
+
+    def invalidate(self, user_id: str):
+        """Drop the user's cached profile after a local write."""
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+        # A load already running may have read the old row - do not let it store it
+        self._inflight.pop(user_id, None)
+
+    def clear(self):
+        """Drop all cached profiles."""
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        """Hit ratio since startup."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_ratio": ((self.hits + self.coalesced) / lookups) if lookups else 0.0
+        }
+
+    async def _fill(self, user_id: str, load: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        task = asyncio.current_task()
+        try:
+            profile = await load()
+        except BaseException:
+            if self._inflight.get(user_id) is task:
+                del self._inflight[user_id]
+            raise
+
+        # Skip storing if invalidate() ran while the query was in flight
+        if self._inflight.get(user_id) is task:
+            del self._inflight[user_id]
+            if self.ttl_seconds > 0:
+                self._entries[user_id] = (time.monotonic() + self.ttl_seconds, profile)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return profile
+
+    @staticmethod
+    async def _load(supabase, user_id: str) -> Optional[dict]:
+        response = await supabase.table("user_profiles").select(PROFILE_COLUMNS).eq(
+            "user_id", user_id
+        ).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def _count(self, outcome: str):
+        if outcome == "hit":
+            self.hits += 1
+        elif outcome == "miss":
+            self.misses += 1
+        else:
+            self.coalesced += 1
+        if self._on_lookup is not None:
+            self._on_lookup(outcome)
+
+
+profile_cache = ProfileCache(
+    ttl_seconds=settings.PROFILE_CACHE_TTL_SECONDS,
+    max_entries=settings.PROFILE_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,128 @@
+"""
+Rule engine - deterministic fast path for obvious strategy decisions
+"""
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from app.config import settings
+
+
+class RuleEngine:
+    """
+    Locally evaluated policy that settles clear-cut market states without an LLM call.
+
+    Decisions use the same schema as GeminiService predictions (action,
+    reasoning, range, confidence) plus "source" and "rule", so they can flow
+    through the same execution and audit path. States the rules cannot settle
+    return None and should be sent to the LLM.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        min_volatility: float,
+        max_volatility: float,
+        range_edge_pct: float,
+        out_of_range_pct: float,
+        cooldown_seconds: float
+    ):
+        self.enabled = enabled
+        self.min_volatility = min_volatility
+        self.max_volatility = max_volatility
+        self.range_edge_pct = range_edge_pct
+        self.out_of_range_pct = out_of_range_pct
+        self.cooldown_seconds = cooldown_seconds
+
+    def evaluate(
+        self,
+        pair: str,
+        market_data: dict,
+        position_range: Optional[Tuple[float, float]] = None,
+        last_rebalance_at: Optional[datetime] = None
+    ) -> Optional[dict]:
+        """
+        Decide a market state locally if it is unambiguous.
+
+        Args:
+            pair: Trading pair (e.g., "ETH/USDC")
+            market_data: Dictionary containing current market data
+            position_range: Current (lower, upper) position range, if known
+            last_rebalance_at: Time of the user's last rebalance, if any
+
+        Returns:
+            Decision dictionary, or None if the LLM should decide
+        """
+        if not self.enabled:
+            return None
+
+        price = float(market_data.get("price", 0) or 0)
+        volatility = float(market_data.get("volatility", 0) or 0)
+
+        # 1. Cooldown: never rebalance twice within the cooldown window
+        if last_rebalance_at is not None:
+            if last_rebalance_at.tzinfo is None:
+                last_rebalance_at = last_rebalance_at.replace(tzinfo=timezone.utc)
+            elapsed = (datetime.now(timezone.utc) - last_rebalance_at).total_seconds()
+            if elapsed < self.cooldown_seconds:
+                return self._decision(
+                    "cooldown", "HOLD", None, 1.0,
+                    f"Last rebalance was {int(elapsed)}s ago, inside the "
+                    f"{int(self.cooldown_seconds)}s cooldown"
+                )
+
+        if position_range is None or price <= 0:
+            return None
+
+        lower, upper = position_range
+        width = upper - lower
+        if width <= 0:
+            return None
+
+        # 2. Calm market, price comfortably inside the range
+        edge = width * self.range_edge_pct / 100
+        if volatility < self.min_volatility and lower + edge <= price <= upper - edge:
+            return self._decision(
+                "in_range_low_volatility", "HOLD", None, 0.95,
+                f"Price {price} is well inside {lower}-{upper} and volatility "
+                f"{volatility}% is below {self.min_volatility}%"
+            )
+
+        # 3. Price clearly out of range in an orderly market: recenter the range
+        overshoot = max(lower - price, price - upper, 0) / width * 100
+        if overshoot > self.out_of_range_pct and volatility <= self.max_volatility:
+            new_lower = round(price - width / 2, 2)
+            new_upper = round(price + width / 2, 2)
+            return self._decision(
+                "out_of_range", "REBALANCE", f"{new_lower}-{new_upper}", 0.9,
+                f"Price {price} is {overshoot:.1f}% of range width outside "
+                f"{lower}-{upper}; recentering with the same width"
+            )
+
+        return None
+
+    def _decision(
+        self,
+        rule: str,
+        action: str,
+        price_range: Optional[str],
+        confidence: float,
+        reasoning: str
+    ) -> dict:
+        return {
+            "action": action,
+            "reasoning": f"[rule:{rule}] {reasoning}",
+            "range": price_range,
+            "confidence": confidence,
+            "source": "rules",
+            "rule": rule
+        }
+
+
+rule_engine = RuleEngine(
+    enabled=settings.RULES_ENABLED,
+    min_volatility=settings.RULES_MIN_VOLATILITY,
+    max_volatility=settings.RULES_MAX_VOLATILITY,
+    range_edge_pct=settings.RULES_RANGE_EDGE_PCT,
+    out_of_range_pct=settings.RULES_OUT_OF_RANGE_PCT,
+    cooldown_seconds=settings.RULES_REBALANCE_COOLDOWN_SECONDS
+)
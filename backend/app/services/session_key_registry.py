@@ -0,0 +1,268 @@
+"""
+Session key registry - active session keys per user, with an expiry heap and sweeper
+"""
+import asyncio
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.db.supabase import get_supabase
+
+SESSION_KEY_COLUMNS = "id, user_id, session_key_private, expiry_timestamp, created_at, status"
+
+LOAD_PAGE_SIZE = 1000
+SWEEP_BATCH_SIZE = 200
+
+
+class SessionKeyRegistry:
+    """
+    In-memory index of active, unexpired session keys.
+
+    get_active() answers from memory; a user missing from the registry (for
+    example a key created by another process) is looked up once in the
+    database and then remembered. A min-heap ordered by expiry lets the
+    sweeper find expired keys without scanning, and it marks them expired in
+    one bulk update. The whole registry is reloaded every refresh_interval
+    seconds so revocations made by other processes are picked up; until
+    then, confirm_active() checks a key against the database before use.
+    """
+
+    def __init__(self, sweep_interval: float, refresh_interval: float):
+        self.sweep_interval = sweep_interval
+        self.refresh_interval = refresh_interval
+
+        self._keys: Dict[str, dict] = {}
+        self._by_user: Dict[str, Dict[str, dict]] = {}
+        # Newest active key per user, so lookups are O(1)
+        self._current: Dict[str, dict] = {}
+        # (expires_at epoch seconds, key id); entries for removed keys are skipped lazily
+        self._expiry_heap: List[Tuple[float, str]] = []
+        # Expired keys whose database update has not gone through yet
+        self._unswept: List[str] = []
+        # Keys added or removed while a reload is reading the table
+        self._added_during_reload: Dict[str, dict] = {}
+        self._removed_during_reload: set = set()
+        self._reloading = False
+
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_refresh = 0.0
+
+    async def start(self):
+        try:
+            await self.reload()
+        except Exception as e:
+            # Lookups fall back to the database until the sweeper reloads
+            print(f"Could not load session keys: {e}")
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self):
+        """Replace the registry with the active keys currently in the database."""
+        supabase = await get_supabase()
+        rows: List[dict] = []
+        offset = 0
+        self._reloading = True
+        self._added_during_reload.clear()
+        self._removed_during_reload.clear()
+        try:
+            while True:
+                response = await supabase.table("session_keys").select(SESSION_KEY_COLUMNS).eq(
+                    "status", "active"
+                ).gt(
+                    "expiry_timestamp", datetime.now(timezone.utc).isoformat()
+                ).order("id").range(offset, offset + LOAD_PAGE_SIZE - 1).execute()
+                page = response.data or []
+                rows.extend(page)
+                if len(page) < LOAD_PAGE_SIZE:
+                    break
+                offset += LOAD_PAGE_SIZE
+        finally:
+            self._reloading = False
+
+        # Keys added while reading stay; keys revoked meanwhile are not resurrected
+        added_meanwhile = list(self._added_during_reload.values())
+        self._keys.clear()
+        self._by_user.clear()
+        self._current.clear()
+        self._expiry_heap.clear()
+        for row in rows:
+            if row["id"] not in self._removed_during_reload:
+                self.add(row)
+        for row in added_meanwhile:
+            if row["id"] not in self._keys and row["id"] not in self._removed_during_reload:
+                self.add(row)
+        self._last_refresh = time.monotonic()
+
+    def add(self, row: dict):
+        """Register a newly created (or newly loaded) active key."""
+        key = {
+            **row,
+            "_expires_at": self._parse_time(row["expiry_timestamp"]),
+            "_created_at": self._parse_time(row.get("created_at")) if row.get("created_at") else time.time()
+        }
+        if key["_expires_at"] <= time.time():
+            return
+
+        if key["id"] in self._keys:
+            self.remove(key["id"])
+        if self._reloading:
+            self._added_during_reload[key["id"]] = row
+            self._removed_during_reload.discard(key["id"])
+        self._keys[key["id"]] = key
+        self._by_user.setdefault(key["user_id"], {})[key["id"]] = key
+        current = self._current.get(key["user_id"])
+        if current is None or key["_created_at"] >= current["_created_at"]:
+            self._current[key["user_id"]] = key
+
+        heapq.heappush(self._expiry_heap, (key["_expires_at"], key["id"]))
+        # The sweeper may be sleeping past this key's expiry
+        self._wakeup.set()
+
+    def remove(self, key_id: str):
+        """Forget a key (revoked or expired)."""
+        if self._reloading:
+            self._removed_during_reload.add(key_id)
+        key = self._keys.pop(key_id, None)
+        if key is None:
+            return
+        user_keys = self._by_user.get(key["user_id"], {})
+        user_keys.pop(key_id, None)
+        if not user_keys:
+            self._by_user.pop(key["user_id"], None)
+        if self._current.get(key["user_id"]) is key:
+            if user_keys:
+                self._current[key["user_id"]] = max(user_keys.values(), key=lambda k: k["_created_at"])
+            else:
+                del self._current[key["user_id"]]
+
+    async def get_active(self, supabase, user_id: str) -> Optional[dict]:
+        """
+        Return the user's newest active, unexpired key.
+
+        Args:
+            supabase: Async Supabase client, used only when the user is not registered
+            user_id: Key owner
+
+        Returns:
+            The session key row, or None if the user has no usable key
+        """
+        key = self._current.get(user_id)
+        if key is not None:
+            if key["_expires_at"] > time.time():
+                return self._public(key)
+            # Expired but not swept yet - never hand it out
+            self.remove(key["id"])
+            self._unswept.append(key["id"])
+            self._wakeup.set()
+            key = self._current.get(user_id)
+            if key is not None and key["_expires_at"] > time.time():
+                return self._public(key)
+
+        response = await supabase.table("session_keys").select(SESSION_KEY_COLUMNS).eq(
+            "user_id", user_id
+        ).eq("status", "active").gt(
+            "expiry_timestamp", datetime.now(timezone.utc).isoformat()
+        ).order("created_at", desc=True).limit(1).execute()
+        if not response.data:
+            return None
+
+        self.add(response.data[0])
+        return dict(response.data[0])
+
+    async def confirm_active(self, supabase, key_id: str) -> bool:
+        """
+        Check in the database that a key is still active and unexpired.
+
+        Revocations made by other processes reach this registry only on the
+        next reload, so callers about to sign with a key confirm it first.
+        A key that is no longer active is dropped from the registry.
+        """
+        response = await supabase.table("session_keys").select("id").eq("id", key_id).eq(
+            "status", "active"
+        ).gt(
+            "expiry_timestamp", datetime.now(timezone.utc).isoformat()
+        ).limit(1).execute()
+        if response.data:
+            return True
+        self.remove(key_id)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "active_keys": len(self._keys),
+            "users": len(self._current),
+            "heap_size": len(self._expiry_heap)
+        }
+
+    async def sweep(self) -> int:
+        """Mark every key whose expiry has passed as expired, in one update."""
+        now = time.time()
+        expired, self._unswept = self._unswept, []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, key_id = heapq.heappop(self._expiry_heap)
+            key = self._keys.get(key_id)
+            # Skip heap entries left behind by removed or re-added keys
+            if key is not None and key["_expires_at"] <= now:
+                self.remove(key_id)
+                expired.append(key_id)
+
+        # Chunked to keep the id list within URL limits
+        for start in range(0, len(expired), SWEEP_BATCH_SIZE):
+            batch = expired[start:start + SWEEP_BATCH_SIZE]
+            try:
+                supabase = await get_supabase()
+                await supabase.table("session_keys").update({"status": "expired"}).in_(
+                    "id", batch
+                ).eq("status", "active").execute()
+            except Exception:
+                self._unswept = expired[start:] + self._unswept
+                raise
+        return len(expired)
+
+    async def _sweep_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                swept = await self.sweep()
+                if swept:
+                    print(f"Expired {swept} session keys")
+                if time.monotonic() - self._last_refresh >= self.refresh_interval:
+                    await self.reload()
+            except Exception as e:
+                print(f"Session key sweep failed: {e}")
+
+            delay = self.sweep_interval
+            if self._expiry_heap:
+                delay = min(delay, max(0.0, self._expiry_heap[0][0] - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _parse_time(value: str) -> float:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    @staticmethod
+    def _public(key: dict) -> dict:
+        return {k: v for k, v in key.items() if not k.startswith("_")}
+
+
+session_key_registry = SessionKeyRegistry(
+    sweep_interval=settings.SESSION_KEY_SWEEP_INTERVAL_SECONDS,
+    refresh_interval=settings.SESSION_KEY_REFRESH_INTERVAL_SECONDS
+)
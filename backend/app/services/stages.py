@@ -0,0 +1,66 @@
+"""
+Stage runner - per-stage timeouts, a total deadline and timings for request pipelines
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class StageTimeout(Exception):
+    """Raised when a pipeline stage exceeds its timeout or the total deadline."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Stage '{stage}' timed out after {timeout:.2f}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class StageRunner:
+    """
+    Runs the awaitable stages of one request.
+
+    Each stage gets its own timeout, capped by whatever is left of the total
+    deadline. Wall-clock duration of every stage is recorded in milliseconds
+    and, if on_stage is given, reported as each stage completes.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: float,
+        on_stage: Optional[Callable[[str, float], Awaitable[None]]] = None
+    ):
+        self.deadline = time.monotonic() + deadline_seconds
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        self.on_stage = on_stage
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    async def run(self, name: str, awaitable: Awaitable, timeout: Optional[float] = None):
+        """Await one stage, raising StageTimeout if it runs too long."""
+        budget = self.remaining() if timeout is None else min(timeout, self.remaining())
+        if budget <= 0:
+            # Never awaited, so close it to avoid "coroutine was never awaited"
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise StageTimeout(name, 0.0)
+
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=budget)
+        except asyncio.TimeoutError:
+            raise StageTimeout(name, budget)
+        finally:
+            self.timings[name] = round((time.monotonic() - started) * 1000, 2)
+
+        if self.on_stage is not None:
+            await self.on_stage(name, self.timings[name])
+        return result
+
+    def report(self) -> Dict[str, float]:
+        """Stage timings plus the total elapsed time, in milliseconds."""
+        return {
+            **self.timings,
+            "total": round((time.monotonic() - self.started) * 1000, 2)
+        }
@@ -0,0 +1,210 @@
+"""
+Strategy executor - the prediction -> ZK proof -> on-chain execution pipeline
+"""
+import asyncio
+from datetime import datetime
+from hashlib import sha256
+from typing import Awaitable, Callable, Optional, Tuple
+
+from app.config import settings
+from app.db.supabase import get_supabase
+from app.services.gemini_service import gemini_service
+from app.services.job_worker import PermanentJobError, register_handler
+from app.services.profile_cache import profile_cache
+from app.services.rule_engine import rule_engine
+from app.services.session_key_registry import session_key_registry
+from app.services.stages import StageRunner
+from app.services.starknet_service import starknet_service
+from app.services.write_behind import write_behind
+
+EXECUTE_STRATEGY_JOB = "execute_strategy"
+
+
+async def execute_strategy(
+    user_id: str,
+    pair: str,
+    report: Optional[Callable[[str, dict], Awaitable[None]]] = None
+) -> dict:
+    """
+    Decide and, if warranted, execute a strategy for one user and pair.
+
+    Independent lookups (profile, session key, market data, last rebalance)
+    run concurrently. Every stage has its own timeout inside a total deadline.
+
+    Args:
+        user_id: User to act for
+        pair: Trading pair (e.g., "ETH/USDC")
+        report: Optional progress callback, called as report(event_type, data)
+
+    Returns:
+        Dictionary describing the decision and any transaction
+    """
+    supabase = await get_supabase()
+    fetch_timeout = settings.VOICE_FETCH_TIMEOUT_SECONDS
+
+    async def on_stage(name: str, elapsed_ms: float):
+        if report is not None:
+            await report("stage", {"stage": name, "elapsed_ms": elapsed_ms})
+
+    stages = StageRunner(settings.VOICE_COMMAND_DEADLINE_SECONDS, on_stage=on_stage)
+
+    # Get user's wallet, session key, market data and position together
+    profile, session_key, market_data, (position_range, last_rebalance_at) = await asyncio.gather(
+        stages.run("profile", profile_cache.get(supabase, user_id), fetch_timeout),
+        stages.run("session_key", session_key_registry.get_active(supabase, user_id), fetch_timeout),
+        stages.run("market_data", fetch_market_data(pair), fetch_timeout),
+        stages.run("last_rebalance", get_last_rebalance(supabase, user_id), fetch_timeout)
+    )
+
+    if profile is None:
+        raise PermanentJobError("No user profile")
+    if session_key is None:
+        raise PermanentJobError("No active session key")
+
+    # Settle obvious market states locally before asking the LLM
+    prediction = rule_engine.evaluate(
+        pair=pair,
+        market_data=market_data,
+        position_range=position_range,
+        last_rebalance_at=last_rebalance_at
+    )
+
+    if prediction is None:
+        prediction = await stages.run("prediction", gemini_service.predict_market_sentiment(
+            pair=pair,
+            market_data=market_data
+        ))
+
+    print(f"Strategy decision for {pair}: {prediction}")
+    if report is not None:
+        await report("decision", {
+            "action": prediction["action"],
+            "range": prediction["range"],
+            "confidence": prediction["confidence"],
+            "decision_source": prediction.get("source", "llm")
+        })
+
+    # Execute if confidence is high enough
+    if prediction["confidence"] > 0.7 and prediction["action"] != "HOLD":
+        # Extract range if rebalancing
+        new_range = None
+        if prediction["range"]:
+            bounds = prediction["range"].split("-")
+            new_range = (float(bounds[0]), float(bounds[1]))
+
+        # Generate ZK proof hash (simplified - integrate with Giza in production)
+        proof_hash = generate_proof_hash(market_data, prediction)
+
+        # The registry may not have seen a revocation made by another process yet
+        if not await stages.run(
+            "session_key_check",
+            session_key_registry.confirm_active(supabase, session_key["id"]),
+            fetch_timeout
+        ):
+            raise PermanentJobError("Session key is no longer active")
+
+        # Execute on Starknet. Once submission has started the transaction may
+        # be on its way, so a failure here must not be retried.
+        try:
+            result = await stages.run("execution", starknet_service.execute_rebalance(
+                session_key_private=session_key["session_key_private"],
+                account_address=profile["starknet_address"],
+                new_range=new_range or (1800, 2200),
+                proof_hash=proof_hash,
+                reasoning_log=prediction["reasoning"]
+            ), settings.VOICE_EXECUTION_TIMEOUT_SECONDS)
+        except Exception as e:
+            raise PermanentJobError(
+                f"Execution failed after submission started, not retried to avoid a duplicate rebalance: "
+                f"{type(e).__name__}: {e}"
+            ) from e
+
+        # Log transaction (buffered and flushed in batches)
+        write_behind.insert("transaction_log", {
+            "tx_hash": result["tx_hash"],
+            "user_id": user_id,
+            "action": prediction["action"],
+            "ai_reasoning_log": prediction["reasoning"],
+            "status": result["status"],
+            "metadata": {
+                "pair": pair,
+                "range": list(new_range or (1800, 2200)),
+                "confidence": prediction["confidence"],
+                "decision_source": prediction.get("source", "llm"),
+                "rule": prediction.get("rule")
+            }
+        })
+
+        response = {
+            "success": True,
+            "action": prediction["action"],
+            "reasoning": prediction["reasoning"],
+            "decision_source": prediction.get("source", "llm"),
+            "tx_hash": result["tx_hash"]
+        }
+    else:
+        response = {
+            "success": False,
+            "action": "HOLD",
+            "reasoning": prediction["reasoning"],
+            "decision_source": prediction.get("source", "llm")
+        }
+        if prediction.get("fallback_reason"):
+            response["fallback_reason"] = prediction["fallback_reason"]
+
+    if settings.DEBUG_TIMINGS:
+        response["timings_ms"] = stages.report()
+    return response
+
+
+async def _handle_execute_strategy(payload: dict, report) -> dict:
+    return await execute_strategy(payload["user_id"], payload["pair"], report)
+
+
+register_handler(EXECUTE_STRATEGY_JOB, _handle_execute_strategy)
+
+
+async def get_last_rebalance(supabase, user_id: str) -> Tuple[Optional[Tuple[float, float]], Optional[datetime]]:
+    """Return the user's current position range and the time of their last rebalance."""
+    try:
+        response = await supabase.table("transaction_log").select("timestamp, metadata").eq(
+            "user_id", user_id
+        ).eq("action", "REBALANCE").order("timestamp", desc=True).limit(1).execute()
+    except Exception as e:
+        print(f"Could not load last rebalance for {user_id}: {e}")
+        return None, None
+
+    if not response.data:
+        return None, None
+
+    row = response.data[0]
+    position_range = None
+    bounds = (row.get("metadata") or {}).get("range")
+    if bounds and len(bounds) == 2:
+        position_range = (float(bounds[0]), float(bounds[1]))
+
+    last_rebalance_at = None
+    if row.get("timestamp"):
+        try:
+            last_rebalance_at = datetime.fromisoformat(row["timestamp"])
+        except ValueError:
+            pass
+
+    return position_range, last_rebalance_at
+
+
+async def fetch_market_data(pair: str) -> dict:
+    """Fetch current market data for a trading pair."""
+    # Simplified - integrate with actual price feeds
+    return {
+        "price": 2000.0,
+        "volume": 1000000,
+        "volatility": 5.2,
+        "trend": "bullish"
+    }
+
+
+def generate_proof_hash(market_data: dict, prediction: dict) -> str:
+    """Generate ZK proof hash (simplified)."""
+    data_str = f"{market_data}{prediction}"
+    return sha256(data_str.encode()).hexdigest()
@@ -0,0 +1,291 @@
+"""
+Token ledger - per-user ERC20 balances read from the deployed token contracts
+"""
+import asyncio
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import httpx
+
+from app.config import settings
+
+# Keccak-f[1600] round constants and rotation offsets
+_ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008
+]
+_ROTATIONS = [
+    [0, 36, 3, 41, 18], [1, 44, 10, 45, 2], [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56], [27, 20, 39, 8, 14]
+]
+_MASK_64 = (1 << 64) - 1
+
+
+def _keccak_f(state: List[List[int]]):
+    for rc in _ROUND_CONSTANTS:
+        c = [state[x][0] ^ state[x][1] ^ state[x][2] ^ state[x][3] ^ state[x][4] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ (((c[(x + 1) % 5] << 1) | (c[(x + 1) % 5] >> 63)) & _MASK_64) for x in range(5)]
+        state = [[state[x][y] ^ d[x] for y in range(5)] for x in range(5)]
+        b = [[0] * 5 for _ in range(5)]
+        for x in range(5):
+            for y in range(5):
+                r = _ROTATIONS[x][y]
+                b[y][(2 * x + 3 * y) % 5] = ((state[x][y] << r) | (state[x][y] >> (64 - r))) & _MASK_64 if r else state[x][y]
+        state = [[b[x][y] ^ (~b[(x + 1) % 5][y] & b[(x + 2) % 5][y]) for y in range(5)] for x in range(5)]
+        state[0][0] ^= rc
+    return state
+
+
+def keccak256(data: bytes) -> bytes:
+    """Keccak-256 as used by Ethereum and Starknet (not NIST SHA3-256)."""
+    rate = 136
+    padded = bytearray(data) + b"\x01" + b"\x00" * (-(len(data) + 1) % rate)
+    padded[-1] |= 0x80
+    state = [[0] * 5 for _ in range(5)]
+    for offset in range(0, len(padded), rate):
+        block = padded[offset:offset + rate]
+        for i in range(rate // 8):
+            state[i % 5][i // 5] ^= int.from_bytes(block[i * 8:i * 8 + 8], "little")
+        state = _keccak_f(state)
+    return b"".join(state[i % 5][i // 5].to_bytes(8, "little") for i in range(4))
+
+
+def get_selector(function_name: str) -> str:
+    """Starknet entry point selector (sn_keccak of the function name)."""
+    return hex(int.from_bytes(keccak256(function_name.encode()), "big") & ((1 << 250) - 1))
+
+
+# How long a token whose metadata could not be read is left alone
+METADATA_RETRY_SECONDS = 60.0
+
+SELECTORS = {name: get_selector(name) for name in ("balance_of", "decimals", "symbol")}
+
+
+def decode_short_string(felt: int) -> str:
+    """Decode a Cairo short string (felt252) such as an ERC20 symbol."""
+    return felt.to_bytes((felt.bit_length() + 7) // 8, "big").decode("ascii", errors="replace")
+
+
+class RPCError(Exception):
+    """The node rejected a call or could not be reached."""
+
+
+class TokenLedger:
+    """
+    Reads each user's holdings from the deployed ERC20 contracts.
+
+    All balance_of calls for one user go out as a single JSON-RPC batch,
+    pinned to the current block. Balances are cached per (address, block),
+    so repeated polls within a block cost nothing and a new block refreshes
+    them. Token metadata (symbol, decimals) never changes once deployed and
+    is fetched once per contract, also in one batch. The current block
+    number is shared by all lookups and refreshed every block_poll_seconds.
+    """
+
+    def __init__(self, rpc_url: str, timeout: float, block_poll_seconds: float, max_entries: int):
+        self.rpc_url = rpc_url
+        self.timeout = timeout
+        self.block_poll_seconds = block_poll_seconds
+        self.max_entries = max_entries
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._metadata: Dict[str, dict] = {}
+        # token address -> loop time after which its metadata is retried
+        self._metadata_retry: Dict[str, float] = {}
+        self._metadata_lock = asyncio.Lock()
+        # address -> (block, {token address: raw balance})
+        self._balances: "OrderedDict[str, Tuple[int, Dict[str, int]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._block: Optional[Tuple[float, int]] = None
+        self._block_task: Optional[asyncio.Task] = None
+
+        self.rpc_round_trips = 0
+        self.cache_hits = 0
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_holdings(self, address: str, tokens: Sequence[Mapping]) -> List[dict]:
+        """
+        Return the user's balance of every token.
+
+        Args:
+            address: The user's Starknet account address
+            tokens: Token listings (from token_service) with address, symbol and decimals
+
+        Returns:
+            The listings with balance (float, whole tokens) and raw_balance
+            (decimal string, smallest unit) for this user, using on-chain
+            metadata where available
+        """
+        address = hex(int(address, 16))
+        await self._load_metadata([token["address"] for token in tokens])
+        balances = await self.get_raw_balances(address, [token["address"] for token in tokens])
+
+        holdings = []
+        for token in tokens:
+            metadata = self._metadata.get(self._key(token["address"]), {})
+            decimals = metadata.get("decimals", token["decimals"])
+            raw = balances.get(self._key(token["address"]), 0)
+            holdings.append({
+                **token,
+                "symbol": metadata.get("symbol") or token["symbol"],
+                "decimals": decimals,
+                "balance": float(Decimal(raw).scaleb(-decimals)),
+                # As a string so it survives JSON clients without 64-bit ints
+                "raw_balance": str(raw)
+            })
+        return holdings
+
+    async def get_raw_balances(self, address: str, token_addresses: Sequence[str]) -> Dict[str, int]:
+        """Raw balances at the current block, keyed by normalized token address."""
+        block = await self.current_block()
+        keys = [self._key(token_address) for token_address in token_addresses]
+
+        cached = self._balances.get(address)
+        if cached is not None and cached[0] == block and all(key in cached[1] for key in keys):
+            self._balances.move_to_end(address)
+            self.cache_hits += 1
+            return cached[1]
+
+        # Concurrent polls for the same user and block share one batch
+        task = self._inflight.get((address, block))
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_balances(address, keys, block))
+            self._inflight[(address, block)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((address, block), None))
+        return await asyncio.shield(task)
+
+    async def current_block(self) -> int:
+        now = asyncio.get_running_loop().time()
+        if self._block is not None and now - self._block[0] < self.block_poll_seconds:
+            return self._block[1]
+        if self._block_task is None or self._block_task.done():
+            self._block_task = asyncio.ensure_future(self._fetch_block())
+        return await asyncio.shield(self._block_task)
+
+    def stats(self) -> dict:
+        return {
+            "cached_users": len(self._balances),
+            "cached_tokens": len(self._metadata),
+            "block": self._block[1] if self._block else None,
+            "rpc_round_trips": self.rpc_round_trips,
+            "cache_hits": self.cache_hits
+        }
+
+    async def _fetch_block(self) -> int:
+        [result] = await self._batch([("starknet_blockNumber", {})])
+        if isinstance(result, RPCError):
+            raise result
+        block = int(result)
+        self._block = (asyncio.get_running_loop().time(), block)
+        return block
+
+    async def _fetch_balances(self, address: str, keys: List[str], block: int) -> Dict[str, int]:
+        results = await self._batch([
+            ("starknet_call", self._call(key, "balance_of", [address], {"block_number": block}))
+            for key in keys
+        ])
+        balances: Dict[str, int] = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, RPCError):
+                # e.g. a token missing from this network; shown as an empty balance
+                print(f"balance_of failed for token {key}: {result}")
+                balances[key] = 0
+            else:
+                # u256 is returned as (low, high)
+                balances[key] = int(result[0], 16) + (int(result[1], 16) << 128)
+
+        self._balances[address] = (block, balances)
+        self._balances.move_to_end(address)
+        while len(self._balances) > self.max_entries:
+            self._balances.popitem(last=False)
+        return balances
+
+    async def _load_metadata(self, token_addresses: Sequence[str]):
+        keys = list(dict.fromkeys(self._key(a) for a in token_addresses))
+        if all(key in self._metadata for key in keys):
+            return
+
+        # Concurrent first lookups wait for one batch instead of each sending their own
+        async with self._metadata_lock:
+            now = asyncio.get_running_loop().time()
+            missing = [
+                key for key in keys
+                if key not in self._metadata and self._metadata_retry.get(key, 0.0) <= now
+            ]
+            if missing:
+                await self._fetch_metadata(missing)
+
+    async def _fetch_metadata(self, missing: List[str]):
+        calls = []
+        for key in missing:
+            calls.append(("starknet_call", self._call(key, "symbol", [], "latest")))
+            calls.append(("starknet_call", self._call(key, "decimals", [], "latest")))
+        results = await self._batch(calls)
+
+        for i, key in enumerate(missing):
+            symbol, decimals = results[2 * i], results[2 * i + 1]
+            if isinstance(symbol, RPCError) or isinstance(decimals, RPCError):
+                # Falls back to the registry's metadata until the retry time
+                self._metadata_retry[key] = asyncio.get_running_loop().time() + METADATA_RETRY_SECONDS
+                continue
+            self._metadata[key] = {
+                "symbol": decode_short_string(int(symbol[0], 16)),
+                "decimals": int(decimals[0], 16)
+            }
+
+    async def _batch(self, calls: List[Tuple[str, dict]]) -> list:
+        """Send calls as one JSON-RPC batch; failed calls come back as RPCError."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        payload = [
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+            for i, (method, params) in enumerate(calls)
+        ]
+        try:
+            response = await self._client.post(self.rpc_url, json=payload)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise RPCError(f"Starknet RPC unavailable: {e}") from e
+        self.rpc_round_trips += 1
+
+        body = response.json()
+        if not isinstance(body, list):
+            raise RPCError(f"Unexpected batch response: {body}")
+        by_id = {item.get("id"): item for item in body}
+        results = []
+        for i in range(len(calls)):
+            item = by_id.get(i, {})
+            results.append(item["result"] if "result" in item else RPCError(item.get("error", "No response")))
+        return results
+
+    @staticmethod
+    def _call(contract_address: str, function_name: str, calldata: List[str], block_id) -> dict:
+        return {
+            "request": {
+                "contract_address": contract_address,
+                "entry_point_selector": SELECTORS[function_name],
+                "calldata": calldata
+            },
+            "block_id": block_id
+        }
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return hex(int(address, 16))
+
+
+token_ledger = TokenLedger(
+    rpc_url=settings.STARKNET_RPC_URL,
+    timeout=settings.ONCHAIN_RPC_TIMEOUT_SECONDS,
+    block_poll_seconds=settings.ONCHAIN_BLOCK_POLL_SECONDS,
+    max_entries=settings.ONCHAIN_BALANCE_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,102 @@
+"""
+Transaction history - keyset pagination over transaction_log
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# Columns callers may project; id and timestamp are always returned for the cursor
+TRANSACTION_COLUMNS = {
+    "id", "user_id", "tx_hash", "action", "status", "ai_reasoning_log",
+    "session_key_id", "from_token", "to_token", "amount", "gas_used",
+    "metadata", "error_message", "timestamp", "confirmed_at"
+}
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by encode_cursor."""
+
+
+def encode_cursor(row: dict) -> str:
+    """Opaque cursor pointing just past the given row."""
+    raw = json.dumps({"t": row["timestamp"], "id": row["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        # Both values end up inside a PostgREST filter, so accept only well-formed ones
+        datetime.fromisoformat(data["t"])
+        return data["t"], str(uuid.UUID(data["id"]))
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def select_columns(fields: Optional[str]) -> str:
+    """Validate a comma-separated field list and turn it into a PostgREST select."""
+    if not fields:
+        return "*"
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = ["id", "timestamp"] + [f for f in requested if f not in ("id", "timestamp")]
+    return ", ".join(columns)
+
+
+async def fetch_transactions_page(
+    supabase,
+    user_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    action: Optional[str] = None,
+    status: Optional[str] = None,
+    columns: str = "*"
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch one page of a user's transactions, newest first.
+
+    Pages are addressed by (timestamp, id) rather than by offset, so every
+    page is a bounded range scan on idx_transaction_log_user_timestamp_id
+    no matter how deep into the history it is.
+
+    Args:
+        supabase: Async Supabase client
+        user_id: Owner of the transactions
+        limit: Page size (1..MAX_PAGE_SIZE)
+        cursor: next_cursor from the previous page, or None for the first page
+        action: Only return rows with this action
+        status: Only return rows with this status
+        columns: PostgREST select list (see select_columns)
+
+    Returns:
+        (rows, next_cursor); next_cursor is None on the last page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = supabase.table("transaction_log").select(columns).eq("user_id", user_id)
+    if action:
+        query = query.eq("action", action)
+    if status:
+        query = query.eq("status", status)
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        # Quoted because timestamps contain PostgREST's reserved characters
+        query = query.or_(
+            f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt.{row_id})'
+        )
+
+    # One extra row tells us whether there is another page
+    response = await query.order("timestamp", desc=True).order(
+        "id", desc=True
+    ).limit(limit + 1).execute()
+
+    rows = response.data or []
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
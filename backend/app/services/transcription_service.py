@@ -0,0 +1,96 @@
+"""
+Transcription service - pluggable speech-to-text backends for streamed audio
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+from app.config import settings
+
+
+class AudioBufferFull(Exception):
+    """Raised when a session receives more audio than it may buffer."""
+
+
+class TranscriptionSession(ABC):
+    """
+    One utterance being transcribed.
+
+    Audio chunks are appended to a bounded in-memory buffer. Backends override
+    _partial() to return the transcript recognized so far and _final() for the
+    complete transcript once the client stops sending audio.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self._last_partial = ""
+
+    async def feed(self, chunk: bytes) -> Optional[str]:
+        """
+        Add an audio chunk.
+
+        Returns:
+            The new partial transcript, or None if it has not changed
+        """
+        if len(self.buffer) + len(chunk) > self.max_bytes:
+            raise AudioBufferFull(f"Audio exceeds {self.max_bytes} bytes")
+        self.buffer.extend(chunk)
+
+        partial = await self._partial()
+        if partial and partial != self._last_partial:
+            self._last_partial = partial
+            return partial
+        return None
+
+    async def finish(self) -> str:
+        """Return the final transcript and release the buffered audio."""
+        try:
+            return await self._final()
+        finally:
+            self.buffer = bytearray()
+
+    async def _partial(self) -> str:
+        return ""
+
+    @abstractmethod
+    async def _final(self) -> str:
+        """The complete transcript of the buffered audio."""
+
+
+class Transcriber:
+    """Base class for speech-to-text backends; subclasses set session_class."""
+
+    session_class: Type[TranscriptionSession]
+
+    def start_session(self) -> TranscriptionSession:
+        return self.session_class(settings.VOICE_STREAM_MAX_BYTES)
+
+
+class StubTranscriptionSession(TranscriptionSession):
+    """Treats the audio bytes as UTF-8 text; partials end at the last full word."""
+
+    async def _partial(self) -> str:
+        text = self.buffer.decode("utf-8", errors="ignore")
+        if text and not text[-1].isspace():
+            text = text.rsplit(None, 1)[0] if " " in text.strip() else ""
+        return text.strip()
+
+    async def _final(self) -> str:
+        return self.buffer.decode("utf-8", errors="ignore").strip()
+
+
+class StubTranscriber(Transcriber):
+    """Local backend for development and tests - no external service needed."""
+
+    session_class = StubTranscriptionSession
+
+
+TRANSCRIBERS: Dict[str, Type[Transcriber]] = {
+    "stub": StubTranscriber,
+}
+
+
+def get_transcriber() -> Optional[Transcriber]:
+    """Return the configured transcriber, or None if none is configured."""
+    backend = TRANSCRIBERS.get(settings.VOICE_TRANSCRIBER.lower())
+    return backend() if backend else None
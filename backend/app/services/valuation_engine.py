@@ -0,0 +1,247 @@
+"""
+Valuation engine - values many users' holdings at once with NumPy
+"""
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, Decimal
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Balances are stored as integers in units of 10**-scale, where scale is the
+# token's decimals capped at MAX_BALANCE_DECIMALS so 18-decimal tokens fit in int64
+MAX_BALANCE_DECIMALS = 8
+# Exact valuations are integers in units of 10**-VALUE_DECIMALS USD
+VALUE_DECIMALS = 8
+
+_MAX_UNITS = int(np.iinfo(np.int64).max)
+
+
+class BalanceOverflow(ValueError):
+    """A balance does not fit the int64 fixed-point matrix."""
+
+
+class DuplicateColumns(ValueError):
+    """Two columns were given the same key."""
+
+
+def to_fixed(amount, scale: int, rounding=ROUND_DOWN) -> int:
+    """Convert a decimal amount (str, int, float or Decimal) to integer units of 10**-scale."""
+    return int(Decimal(str(amount)).scaleb(scale).to_integral_value(rounding))
+
+
+class ValuationEngine:
+    """
+    Holdings of many users as a users x tokens fixed-point matrix.
+
+    value() computes per-token values, per-user totals and allocation
+    percentages for every user in one vectorized pass over the matrix.
+    value_exact() does the same in integer arithmetic for results that must
+    add up to the cent; it is slower as it works on Python ints.
+
+    Columns are addressed by keys, the symbols unless given (e.g. contract
+    addresses, when two tokens may share a symbol). Balances beyond int64 at
+    the column's scale raise BalanceOverflow rather than wrapping.
+    """
+
+    def __init__(
+        self,
+        symbols: Sequence[str],
+        decimals: Sequence[int],
+        capacity: int = 16,
+        keys: Optional[Sequence[str]] = None
+    ):
+        self.symbols = tuple(symbols)
+        self.keys = tuple(keys) if keys is not None else self.symbols
+        if len(self.keys) != len(self.symbols):
+            raise ValueError("keys and symbols must have the same length")
+        self._columns = {key: i for i, key in enumerate(self.keys)}
+        if len(self._columns) != len(self.keys):
+            raise DuplicateColumns("Duplicate column keys; pass distinct keys (e.g. contract addresses)")
+        self.scales = np.array([min(d, MAX_BALANCE_DECIMALS) for d in decimals], dtype=np.int64)
+        self._decimals = tuple(decimals)
+
+        self.user_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._balances = np.zeros((max(capacity, 1), len(self.symbols)), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def balances(self) -> np.ndarray:
+        """Fixed-point balance matrix (a view, one row per user)."""
+        return self._balances[:len(self.user_ids)]
+
+    def set_balance(self, user_id: str, key: str, amount):
+        """Set a balance given in whole tokens, e.g. "45.8" ETH."""
+        column = self._columns[key]
+        self._store(user_id, column, to_fixed(amount, int(self.scales[column])))
+
+    def set_raw_balance(self, user_id: str, key: str, raw: int):
+        """Set a balance given in the token's smallest on-chain unit."""
+        column = self._columns[key]
+        drop = self._decimals[column] - int(self.scales[column])
+        self._store(user_id, column, raw // (10 ** drop))
+
+    def load(self, user_ids: Sequence[str], balances: np.ndarray):
+        """Replace all holdings with a prepared fixed-point matrix (users x tokens)."""
+        if balances.shape != (len(user_ids), len(self.symbols)):
+            raise ValueError(f"balances must have shape ({len(user_ids)}, {len(self.symbols)})")
+        self.user_ids = list(user_ids)
+        self._rows = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self._balances = np.array(balances, dtype=np.int64)
+
+    def price_vector(self, prices: Mapping[str, float]) -> np.ndarray:
+        """USD prices in column order; symbols without a price are valued at 0."""
+        return np.array([prices.get(symbol, 0.0) or 0.0 for symbol in self.symbols], dtype=np.float64)
+
+    def value(self, prices: Mapping[str, float]) -> Dict[str, np.ndarray]:
+        """
+        Value every user's holdings.
+
+        Args:
+            prices: USD price per symbol
+
+        Returns:
+            Dictionary with values (users x tokens, USD), totals (per user, USD)
+            and allocations (users x tokens, percent of the user's total)
+        """
+        # Price of one fixed-point unit, so the matrix is never rescaled
+        unit_prices = self.price_vector(prices) / np.power(10.0, self.scales)
+        values = self.balances * unit_prices
+        totals = values.sum(axis=1)
+        allocations = np.divide(
+            values * 100.0,
+            totals[:, None],
+            out=np.zeros_like(values),
+            where=totals[:, None] > 0
+        )
+        return {"values": values, "totals": totals, "allocations": allocations}
+
+    def value_exact(self, prices: Mapping[str, object]) -> Dict[str, np.ndarray]:
+        """
+        Value every user's holdings in integer arithmetic.
+
+        Args:
+            prices: USD price per symbol, preferably as str or Decimal
+
+        Returns:
+            Dictionary with values and totals as integers in 10**-VALUE_DECIMALS
+            USD (rounded down), and allocations in basis points (rounded down)
+        """
+        price_units = np.array(
+            [to_fixed(prices.get(symbol, 0) or 0, VALUE_DECIMALS, ROUND_HALF_EVEN) for symbol in self.symbols],
+            dtype=object
+        )
+        divisors = np.array([10 ** int(scale) for scale in self.scales], dtype=object)
+        # Object arrays of Python ints: no int64 overflow for large balances
+        values = self.balances.astype(object) * price_units // divisors
+        totals = values.sum(axis=1)
+        allocations = np.zeros(values.shape, dtype=object)
+        nonzero = totals > 0
+        allocations[nonzero] = values[nonzero] * 10000 // totals[nonzero][:, None]
+        return {"values": values, "totals": totals, "allocations": allocations}
+
+    def row(self, user_id: str) -> Optional[int]:
+        return self._rows.get(user_id)
+
+    def _store(self, user_id: str, column: int, units: int):
+        if not -_MAX_UNITS <= units <= _MAX_UNITS:
+            raise BalanceOverflow(
+                f"{self.keys[column]} balance of {units} units exceeds the int64 fixed-point range"
+            )
+        self._balances[self._row(user_id), column] = units
+
+    def _row(self, user_id: str) -> int:
+        row = self._rows.get(user_id)
+        if row is None:
+            row = len(self.user_ids)
+            if row == self._balances.shape[0]:
+                # Amortized O(1) growth
+                grown = np.zeros((row * 2, len(self.symbols)), dtype=np.int64)
+                grown[:row] = self._balances
+                self._balances = grown
+            self._rows[user_id] = row
+            self.user_ids.append(user_id)
+        return row
+
+
+def engine_for_tokens(tokens: Iterable[Mapping], user_id: str = "default") -> ValuationEngine:
+    """
+    One-user engine holding the balances of the given token listings.
+
+    Columns are keyed by contract address, so listings that share a symbol
+    keep separate balances. Raises BalanceOverflow for balances too large
+    for the matrix.
+    """
+    tokens = list(tokens)
+    keys = [_column_key(t) for t in tokens]
+    engine = ValuationEngine(
+        [t["symbol"] for t in tokens], [t["decimals"] for t in tokens], capacity=1, keys=keys
+    )
+    for key, token in zip(keys, tokens):
+        if "raw_balance" in token:
+            engine.set_raw_balance(user_id, key, int(token["raw_balance"]))
+        else:
+            engine.set_balance(user_id, key, token["balance"])
+    return engine
+
+
+def _column_key(token: Mapping) -> str:
+    address = token.get("address")
+    return hex(int(address, 16)) if address else token["symbol"]
+
+
+def _value_decimal(tokens: Sequence[Mapping], prices: Mapping[str, float]) -> Tuple[List[float], float]:
+    """Per-token values and total in Decimal, for balances the matrix cannot hold."""
+    values = []
+    for token in tokens:
+        if "raw_balance" in token:
+            balance = Decimal(int(token["raw_balance"])).scaleb(-token["decimals"])
+        else:
+            balance = Decimal(str(token["balance"]))
+        values.append(balance * Decimal(str(prices.get(token["symbol"], 0.0) or 0.0)))
+    total = sum(values, Decimal(0))
+    return [float(value) for value in values], float(total)
+
+
+def value_holdings(
+    tokens: Sequence[Mapping],
+    prices: Mapping[str, float],
+    engine: Optional[ValuationEngine] = None
+) -> Dict:
+    """
+    Value one user's token listings.
+
+    Args:
+        tokens: Token listings with symbol, decimals and balance (or raw_balance)
+        prices: USD price per symbol
+        engine: Prebuilt engine for these listings, if the caller keeps one
+
+    Returns:
+        Dictionary with total_value and one holding per token (balance, price,
+        value and percentage of the total)
+    """
+    if not tokens:
+        return {"total_value": 0.0, "holdings": []}
+    try:
+        valuation = (engine if engine is not None else engine_for_tokens(tokens)).value(prices)
+        values = valuation["values"][0].tolist()
+        percentages = valuation["allocations"][0].tolist()
+        total = float(valuation["totals"][0])
+    except (BalanceOverflow, DuplicateColumns) as e:
+        print(f"Valuing holdings without the engine: {e}")
+        values, total = _value_decimal(tokens, prices)
+        percentages = [value * 100.0 / total if total > 0 else 0.0 for value in values]
+
+    holdings = [
+        {
+            "name": token["name"],
+            "symbol": token["symbol"],
+            "balance": token["balance"],
+            "price": prices.get(token["symbol"], 0.0),
+            "value": value,
+            "percentage": percentage
+        }
+        for token, value, percentage in zip(tokens, values, percentages)
+    ]
+    return {"total_value": total, "holdings": holdings}
@@ -0,0 +1,313 @@
+"""
+Write-behind buffer - batches audit inserts and profile updates off the request path
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from app.config import settings
+from app.db.supabase import get_supabase
+from app.services.profile_cache import profile_cache
+
+
+class WriteBehindBuffer:
+    """
+    Collects database writes in memory and applies them in bulk.
+
+    Inserts into the same table go out as one multi-row request; repeated
+    updates to the same row collapse into one. A flush runs every
+    flush_interval seconds, or sooner once max_batch writes are pending.
+
+    Every accepted write is first appended to a local spool file, so writes
+    survive a crash and are replayed on the next start. Inserted rows get a
+    client-side id and are written with ON CONFLICT (id) DO NOTHING, which
+    makes that replay safe if the crash happened after the database write.
+    Each process needs its own spool_path.
+
+    Appends are flushed to the OS right away, so a process crash loses
+    nothing. With fsync on, the spool is fsynced at most once per
+    fsync_interval, in a worker thread, so writes on the request path never
+    wait for the disk; a power loss can drop the last interval of writes.
+    """
+
+    def __init__(
+        self,
+        spool_path: str,
+        max_batch: int,
+        flush_interval: float,
+        fsync: bool = True,
+        fsync_interval: float = 0.2
+    ):
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._inserts: List[Tuple[str, dict]] = []
+        # (table, match) -> (match, values)
+        self._updates: "OrderedDict[Tuple[str, str], Tuple[dict, dict]]" = OrderedDict()
+        self._listeners: Dict[str, List[Callable[[dict], None]]] = {}
+
+        self._spool = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._fsync_task: Optional[asyncio.Task] = None
+
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_rows = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._inserts) + len(self._updates)
+
+    def on_applied(self, table: str, listener: Callable[[dict], None]):
+        """Call listener(match) after an update to table has been written."""
+        self._listeners.setdefault(table, []).append(listener)
+
+    def insert(self, table: str, row: dict) -> dict:
+        """
+        Queue a row for insertion.
+
+        Returns:
+            The row as it will be written, including its generated id
+        """
+        row = {"id": str(uuid.uuid4()), **row}
+        self._append({"op": "insert", "table": table, "row": row})
+        self._inserts.append((table, row))
+        self._maybe_flush_soon()
+        return row
+
+    def update(self, table: str, match: dict, values: dict):
+        """Queue an update of the rows matching all match columns."""
+        self._append({"op": "update", "table": table, "match": match, "values": values})
+        self._add_update(table, match, values)
+        self._maybe_flush_soon()
+
+    async def start(self):
+        os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+        recovered = self._recover()
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+        if recovered:
+            print(f"Write-behind: replaying {recovered} spooled writes")
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still pending. Called on shutdown."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._fsync_task is not None:
+            await self._fsync_task
+            self._fsync_task = None
+        if self._spool is not None:
+            await asyncio.to_thread(self._sync, self._spool)
+            self._spool.close()
+            self._spool = None
+
+    async def flush(self):
+        """Write all pending inserts and updates now."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = self._updates, OrderedDict()
+            supabase = await get_supabase()
+
+            try:
+                by_table: Dict[str, List[dict]] = {}
+                for table, row in inserts:
+                    by_table.setdefault(table, []).append(row)
+                for table, rows in by_table.items():
+                    for start in range(0, len(rows), self.max_batch):
+                        await self._write_rows(supabase, table, rows[start:start + self.max_batch])
+                inserts = []
+
+                while updates:
+                    (table, _), (match, values) = next(iter(updates.items()))
+                    query = supabase.table(table).update(values, returning=ReturnMethod.minimal)
+                    for column, value in match.items():
+                        query = query.eq(column, value)
+                    try:
+                        await query.execute()
+                        self.flushed_rows += 1
+                    except APIError as e:
+                        self._reject({"op": "update", "table": table, "match": match, "values": values}, e)
+                    updates.popitem(last=False)
+                    for listener in self._listeners.get(table, []):
+                        listener(match)
+            except Exception as e:
+                print(f"Write-behind flush failed, will retry: {e}")
+                # Put back what was not written, ahead of anything queued meanwhile
+                self._inserts = inserts + self._inserts
+                for key, (match, values) in self._updates.items():
+                    if key in updates:
+                        updates[key][1].update(values)
+                    else:
+                        updates[key] = (match, values)
+                self._updates = updates
+                raise
+            finally:
+                self._rewrite_spool()
+
+            self.flushes += 1
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                if self._stopping:
+                    # Still in the spool; replayed on the next start
+                    print(f"Write-behind: {self.pending} writes left in {self.spool_path}")
+                    return
+                await asyncio.sleep(self.flush_interval)
+
+            if self._stopping:
+                return
+
+    async def _write_rows(self, supabase, table: str, rows: List[dict]):
+        """Bulk insert, falling back to row by row so one bad row cannot block the rest."""
+        try:
+            await self._upsert(supabase, table, rows)
+            self.flushed_rows += len(rows)
+            return
+        except APIError as e:
+            # The database rejected the batch; find the offending rows
+            print(f"Write-behind batch insert into {table} failed, retrying rows one by one: {e}")
+
+        for row in rows:
+            try:
+                await self._upsert(supabase, table, [row])
+                self.flushed_rows += 1
+            except APIError as e:
+                self._reject({"op": "insert", "table": table, "row": row}, e)
+
+    @staticmethod
+    async def _upsert(supabase, table: str, rows: List[dict]):
+        # Columns a row leaves out get their defaults (e.g. timestamp), not NULL
+        await supabase.table(table).upsert(
+            rows,
+            on_conflict="id",
+            ignore_duplicates=True,
+            returning=ReturnMethod.minimal,
+            default_to_null=False
+        ).execute()
+
+    def _reject(self, entry: dict, error: Exception):
+        """
+        Set aside a write the database refused. Retrying cannot fix it, and
+        leaving it in the spool would block every later flush.
+        """
+        self.failed_rows += 1
+        print(f"Write-behind rejected {entry['op']} on {entry['table']}: {error}")
+        with open(f"{self.spool_path}.rejected", "a", encoding="utf-8") as f:
+            f.write(json.dumps({**entry, "error": str(error)}, default=str) + "\n")
+
+    def _add_update(self, table: str, match: dict, values: dict):
+        key = (table, json.dumps(match, sort_keys=True))
+        if key in self._updates:
+            self._updates[key][1].update(values)
+        else:
+            self._updates[key] = (match, dict(values))
+
+    def _maybe_flush_soon(self):
+        if self.pending >= self.max_batch:
+            self._wakeup.set()
+
+    def _append(self, entry: dict):
+        if self._spool is None:
+            raise RuntimeError("Write-behind buffer is not started")
+        self._spool.write(json.dumps(entry, default=str) + "\n")
+        self._spool.flush()
+        if self.fsync and (self._fsync_task is None or self._fsync_task.done()):
+            # One fsync covers every append made until it runs
+            self._fsync_task = asyncio.get_running_loop().create_task(self._fsync_soon())
+
+    async def _fsync_soon(self):
+        await asyncio.sleep(self.fsync_interval)
+        if self._spool is not None:
+            await asyncio.to_thread(self._sync, self._spool)
+
+    @staticmethod
+    def _sync(spool):
+        try:
+            os.fsync(spool.fileno())
+        except (OSError, ValueError):
+            # Closed by a spool rewrite meanwhile; the rewrite fsyncs its own file
+            pass
+
+    def _recover(self) -> int:
+        if not os.path.exists(self.spool_path):
+            return 0
+        count = 0
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                if entry["op"] == "insert":
+                    self._inserts.append((entry["table"], entry["row"]))
+                else:
+                    self._add_update(entry["table"], entry["match"], entry["values"])
+                count += 1
+        return count
+
+    def _rewrite_spool(self):
+        """Replace the spool with exactly what is still pending."""
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for table, row in self._inserts:
+                f.write(json.dumps({"op": "insert", "table": table, "row": row}, default=str) + "\n")
+            for (table, _), (match, values) in self._updates.items():
+                f.write(json.dumps(
+                    {"op": "update", "table": table, "match": match, "values": values}, default=str
+                ) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        if self._spool is not None:
+            self._spool.close()
+        os.replace(tmp_path, self.spool_path)
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+
+write_behind = WriteBehindBuffer(
+    spool_path=settings.WRITE_BEHIND_SPOOL_PATH,
+    max_batch=settings.WRITE_BEHIND_MAX_BATCH,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL_SECONDS,
+    fsync=settings.WRITE_BEHIND_FSYNC,
+    fsync_interval=settings.WRITE_BEHIND_FSYNC_INTERVAL_SECONDS
+)
+
+# Drop the cached profile again once a buffered update reaches the database
+write_behind.on_applied("user_profiles", lambda match: profile_cache.invalidate(match["user_id"]))
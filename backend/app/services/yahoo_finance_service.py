@@ -2,9 +2,12 @@
 Yahoo Finance service for fetching real-time cryptocurrency prices
 """
 import yfinance as yf
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import logging
+import time
+
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -27,17 +30,51 @@ class YahooFinanceService:
         'LINK': 'LINK-USD'
     }
     
+    # symbol -> (fetched at, price data); reused for PRICE_CACHE_TTL_SECONDS
+    _price_cache: Dict[str, Tuple[float, Dict]] = {}
+    # symbol -> version, bumped only when the quote actually changes
+    _price_versions: Dict[str, int] = {}
+    
     @staticmethod
     def get_crypto_price(symbol: str) -> Optional[Dict]:
         """
         Get current price and 24h change for a cryptocurrency
         
+        Quotes are cached for PRICE_CACHE_TTL_SECONDS. A refetched quote that
+        did not change keeps the cached snapshot (and its timestamp), so
+        responses built from it stay identical and its version stays put.
+        
         Args:
             symbol: Crypto symbol (e.g., 'ETH', 'BTC')
             
         Returns:
-            Dictionary with price data or None if failed
+            Dictionary with price data or None if failed (shared; do not modify)
         """
+        symbol = symbol.upper()
+        now = time.monotonic()
+        cached = YahooFinanceService._price_cache.get(symbol)
+        if cached and now - cached[0] < settings.PRICE_CACHE_TTL_SECONDS:
+            return cached[1]
+        
+        price_data = YahooFinanceService._fetch_price(symbol)
+        if price_data is None:
+            return None
+        
+        if cached and all(cached[1][k] == price_data[k] for k in ('price', 'change24h', 'previousClose')):
+            price_data = cached[1]
+        else:
+            YahooFinanceService._price_versions[symbol] = YahooFinanceService._price_versions.get(symbol, 0) + 1
+        YahooFinanceService._price_cache[symbol] = (now, price_data)
+        return price_data
+    
+    @staticmethod
+    def price_versions(symbols: List[str]) -> Tuple[int, ...]:
+        """Versions of the cached quotes for symbols, for building ETags."""
+        return tuple(YahooFinanceService._price_versions.get(s.upper(), 0) for s in symbols)
+    
+    @staticmethod
+    def _fetch_price(symbol: str) -> Optional[Dict]:
+        """Fetch a quote from Yahoo Finance."""
         try:
             ticker_symbol = YahooFinanceService.CRYPTO_TICKERS.get(symbol.upper())
             if not ticker_symbol:
@@ -5,15 +5,48 @@ import uvicorn
 
 from app.config import settings
 from app.api import voice, portfolio, transactions, session_keys, auth, market, tokens
+from app.db.supabase import init_supabase, close_supabase
+from app.services.write_behind import write_behind
+from app.services.session_key_registry import session_key_registry
+from app.services.intent_parser import refresh_intent_matcher
+from app.services.job_queue import get_job_queue
+from app.services.job_worker import JobWorker
+from app.services.token_ledger import token_ledger
+from services.token_service import token_service
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print(f"🚀 TrusTek Fusion Backend starting in {settings.ENVIRONMENT} mode...")
+    await init_supabase()
+    await write_behind.start()
+    await session_key_registry.start()
+    refresh_intent_matcher()
+    await token_service.start()
+    
+    worker = None
+    if settings.JOB_WORKERS_IN_PROCESS:
+        worker = JobWorker(get_job_queue(), settings.JOB_WORKER_CONCURRENCY)
+        try:
+            await worker.start()
+        except Exception as e:
+            # The API still serves everything else; strategy jobs wait for the queue
+            print(f"⚠️  Job worker not started, job queue unavailable: {e}")
+            worker = None
+    
     yield
     # Shutdown
     print("👋 TrusTek Fusion Backend shutting down...")
+    if worker is not None:
+        await worker.stop()
+    await get_job_queue().close()
+    await session_key_registry.stop()
+    # After the worker, so audit rows from its last jobs are included
+    await write_behind.stop()
+    await close_supabase()
+    await token_service.stop()
+    await token_ledger.close()
 
 
 app = FastAPI(
@@ -30,6 +63,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Include API routers
@@ -0,0 +1,52 @@
+"""
+Micro-benchmark for the compiled voice intent matcher.
+
+Compares IntentMatcher.parse with a naive scan that checks every alias with
+`in`, as the vocabulary grows from a handful of assets to thousands.
+
+Usage (from backend/):
+    python scripts/bench_intent_parser.py
+"""
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+# TokenService resolves deployed_tokens/ relative to the working directory
+os.chdir(BACKEND_DIR)
+
+from app.services.intent_parser import IntentMatcher, build_aliases  # noqa: E402
+
+TRANSCRIPT = "please execute a trade of 2.5 solana for tether between 95 and 110"
+VOCABULARY_SIZES = [10, 100, 1000, 5000]
+ITERATIONS = 2000
+
+
+def synthetic_tokens(count: int) -> list:
+    return [{"name": f"Asset Number {i}", "symbol": f"AS{i}"} for i in range(count)]
+
+
+def naive_parse(transcript: str, aliases: dict) -> list:
+    text = transcript.lower()
+    return [symbol for alias, symbol in aliases.items() if alias in text]
+
+
+def main():
+    print(f"{'assets':>8} {'aliases':>8} {'compiled (us)':>14} {'naive scan (us)':>16}")
+    for size in VOCABULARY_SIZES:
+        aliases = build_aliases(synthetic_tokens(size))
+        matcher = IntentMatcher()
+        matcher.refresh(aliases)
+
+        compiled = timeit.timeit(lambda: matcher.parse(TRANSCRIPT), number=ITERATIONS)
+        naive = timeit.timeit(lambda: naive_parse(TRANSCRIPT, aliases), number=ITERATIONS)
+        print(
+            f"{size:>8} {len(aliases):>8} "
+            f"{compiled / ITERATIONS * 1e6:>14.2f} {naive / ITERATIONS * 1e6:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark for the vectorized valuation engine.
+
+Values the holdings of 100k synthetic users across every token in the
+registry, with ValuationEngine.value, ValuationEngine.value_exact and a
+plain Python loop doing the same work per user.
+
+Usage (from backend/):
+    python scripts/bench_valuation.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+# TokenService resolves deployed_tokens/ relative to the working directory
+os.chdir(BACKEND_DIR)
+
+from app.services.valuation_engine import ValuationEngine  # noqa: E402
+from services.token_service import token_service  # noqa: E402
+
+USERS = 100_000
+EXACT_USERS = 10_000
+ROUNDS = 5
+
+
+def python_loop(symbols, balances, prices):
+    """What get_portfolio_value did, once per user."""
+    results = []
+    for row in balances:
+        total = 0.0
+        values = []
+        for symbol, balance in zip(symbols, row):
+            value = balance * prices.get(symbol, 0.0)
+            values.append(value)
+            total += value
+        results.append((total, [(v / total * 100) if total > 0 else 0.0 for v in values]))
+    return results
+
+
+def best_of(fn, rounds=ROUNDS):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    tokens = token_service.get_all_tokens()
+    symbols = [t["symbol"] for t in tokens]
+    engine = ValuationEngine(symbols, [t["decimals"] for t in tokens])
+
+    rng = np.random.default_rng(42)
+    units = rng.integers(0, 10 ** 12, size=(USERS, len(symbols)), dtype=np.int64)
+    engine.load([f"user-{i}" for i in range(USERS)], units)
+    prices = {symbol: float(p) for symbol, p in zip(symbols, rng.uniform(0.1, 70000, len(symbols)))}
+
+    float_balances = (units / np.power(10.0, engine.scales)).tolist()
+    exact = ValuationEngine(symbols, [t["decimals"] for t in tokens])
+    exact.load(engine.user_ids[:EXACT_USERS], units[:EXACT_USERS])
+
+    vectorized = best_of(lambda: engine.value(prices))
+    exact_time = best_of(lambda: exact.value_exact(prices), rounds=1)
+    loop = best_of(lambda: python_loop(symbols, float_balances, prices), rounds=1)
+
+    print(f"{USERS} users x {len(symbols)} tokens")
+    print(f"  ValuationEngine.value        {vectorized * 1e3:>9.1f} ms")
+    print(f"  Python loop                  {loop * 1e3:>9.1f} ms  ({loop / vectorized:.0f}x slower)")
+    print(f"  ValuationEngine.value_exact  {exact_time * 1e3 * USERS / EXACT_USERS:>9.1f} ms  "
+          f"(extrapolated from {EXACT_USERS} users)")
+
+
+if __name__ == "__main__":
+    main()
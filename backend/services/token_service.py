@@ -1,15 +1,272 @@
 """
 Token Service - Manages fake crypto tokens for development
 """
+import asyncio
 import json
+import os
+import shutil
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 from decimal import Decimal
 
+try:
+    import fcntl
+except ImportError:  # Windows: one writer per journal is documented, not enforced
+    fcntl = None
+
+from app.config import settings
+from app.services.valuation_engine import (
+    BalanceOverflow, DuplicateColumns, ValuationEngine, engine_for_tokens, value_holdings
+)
+
+
+def _to_json(value) -> bytes:
+    # Same encoding FastAPI's JSONResponse uses
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class _TokenIndex:
+    """Symbol index and encoded responses for one version of the registry."""
+    
+    def __init__(self, tokens_data: Dict):
+        self.by_symbol: Dict[str, Mapping] = {}
+        self.json_by_symbol: Dict[str, bytes] = {}
+        self.names_by_symbol: Dict[str, str] = {}
+        for name, data in tokens_data.get("tokens", {}).items():
+            self.set(name, data)
+        self.all_tokens: Optional[Tuple[Mapping, ...]] = None
+        self.all_tokens_json: Optional[bytes] = None
+        self.engine: Optional[ValuationEngine] = None
+    
+    def set(self, name: str, data: Dict):
+        key = data["symbol"].upper()
+        # First definition wins, as with the previous linear scan
+        if self.names_by_symbol.get(key, name) != name:
+            return
+        token = MappingProxyType({
+            "name": name,
+            "symbol": data["symbol"],
+            "address": data["address"],
+            "decimals": data["decimals"],
+            "balance": float(data.get("balance", 0)),
+            "total_supply": data.get("total_supply", "0")
+        })
+        self.by_symbol[key] = token
+        self.json_by_symbol[key] = _to_json(dict(token))
+        self.names_by_symbol[key] = name
+        # Token list is rebuilt on next read
+        self.all_tokens = None
+        self.all_tokens_json = None
+        self.engine = None
+    
+    def get_all_tokens(self) -> Tuple[Mapping, ...]:
+        tokens = self.all_tokens
+        if tokens is None:
+            tokens = self.all_tokens = tuple(self.by_symbol[key] for key in self.names_by_symbol)
+        return tokens
+    
+    def get_all_tokens_json(self) -> bytes:
+        body = self.all_tokens_json
+        if body is None:
+            body = self.all_tokens_json = _to_json([dict(token) for token in self.get_all_tokens()])
+        return body
+    
+    def get_engine(self) -> ValuationEngine:
+        engine = self.engine
+        if engine is None:
+            engine = self.engine = engine_for_tokens(self.get_all_tokens())
+        return engine
+
+
+class JournalBusy(RuntimeError):
+    """Another process holds the tokens journal."""
+
+
 class TokenService:
-    def __init__(self, tokens_file: str = "deployed_tokens/tokens.json"):
+    """
+    Token registry backed by a JSON file.
+
+    Reads are served from a prebuilt symbol index of read-only token views
+    and pre-encoded JSON responses. They are rebuilt only when the data
+    changes (update_token_balance), so lookups are O(1) and the API can
+    return the cached bytes as they are.
+
+    Balance updates are appended to a journal next to the tokens file
+    instead of rewriting it. The journal is fsynced every fsync_batch
+    entries or fsync_interval seconds, whichever comes first, and folded
+    back into the tokens file (written to a temp file and renamed over it)
+    once it holds compact_entries entries. Compaction moves the journal
+    aside and writes the tokens file in a worker thread, so the request that
+    crosses the threshold does not wait for it. On startup the journal (and
+    one left aside by an interrupted compaction) is replayed over the tokens
+    file; entries hold absolute balances, so replaying one that was already
+    compacted is harmless.
+
+    A journal has one writer: the first process to update a balance locks
+    it, and updates from any other process raise JournalBusy (the lock needs
+    fcntl, so on Windows run a single API worker). Other processes still
+    serve reads and pick up compacted balances through the file watcher.
+
+    While started, the tokens file is polled for changes made by someone
+    else (e.g. scripts/deploy_tokens.sh). A changed file is parsed and
+    validated off the event loop, then the registry and its index are
+    swapped in with one assignment, so readers never wait and never see a
+    partial registry. The new file replaces any journaled balances. A file
+    that does not parse or validate is ignored until it changes again.
+    """
+    
+    def __init__(
+        self,
+        tokens_file: str = "deployed_tokens/tokens.json",
+        fsync_batch: int = 16,
+        fsync_interval: float = 1.0,
+        compact_entries: int = 1000,
+        poll_interval: float = 2.0
+    ):
         self.tokens_file = Path(tokens_file)
+        self.journal_file = self.tokens_file.with_name(self.tokens_file.name + ".journal")
+        # The journal being folded into the tokens file by a compaction
+        self.compacting_file = self.journal_file.with_name(self.journal_file.name + ".compacting")
+        self.writer_lock_file = self.journal_file.with_name(self.journal_file.name + ".lock")
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_entries = compact_entries
+        self.poll_interval = poll_interval
+        
+        self._lock = threading.Lock()
+        # One compaction at a time (background vs. shutdown)
+        self._compact_lock = threading.Lock()
+        self._compaction: Optional[asyncio.Task] = None
+        self._writer_lock_fd: Optional[int] = None
+        self._journal = None
+        self._journal_entries = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._reload_listeners: List[Callable[[], None]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        
         self.tokens_data = self._load_tokens()
+        self._replay_journal()
+        self._file_signature = self._stat_tokens_file()
+        self._index = _TokenIndex(self.tokens_data)
+        # Bumped on every change to the registry, for ETags
+        self.version = 1
+    
+    def on_reload(self, listener: Callable[[], None]):
+        """Call listener() after a changed tokens file has been swapped in."""
+        self._reload_listeners.append(listener)
+    
+    async def start(self):
+        """Start watching the tokens file."""
+        self._watch_task = asyncio.create_task(self._watch())
+    
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        if self._compaction is not None:
+            await self._compaction
+        await asyncio.to_thread(self.close)
+    
+    async def reload_if_changed(self) -> bool:
+        """
+        Swap in the tokens file if it changed since it was last read or written.
+
+        Returns:
+            True if a new registry was swapped in
+        """
+        if self._compaction is not None and not self._compaction.done():
+            # Our own snapshot may be landing; look again on the next poll
+            return False
+        signature = self._stat_tokens_file()
+        if signature is None or signature == self._file_signature:
+            return False
+        
+        try:
+            tokens_data, index = await asyncio.to_thread(self._read_registry)
+        except Exception as e:
+            print(f"Ignoring invalid tokens file {self.tokens_file}: {e}")
+            self._file_signature = signature
+            return False
+        
+        if self._compaction is not None:
+            # Started while the file was read; it must not overwrite the new file
+            await self._compaction
+        
+        with self._lock:
+            self.tokens_data = tokens_data
+            self._index = index
+            self.version += 1
+            self._file_signature = signature
+            # Balances from the new file win over anything journaled against the old one
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            with open(self.journal_file, 'w') as f:
+                os.fsync(f.fileno())
+            self.compacting_file.unlink(missing_ok=True)
+            self._journal_entries = 0
+            self._unsynced = 0
+        
+        print(f"Reloaded {len(index.names_by_symbol)} tokens from {self.tokens_file}")
+        for listener in self._reload_listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Token reload listener failed: {e}")
+        return True
+    
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                print(f"Token registry reload failed: {e}")
+    
+    def _read_registry(self) -> Tuple[Dict, _TokenIndex]:
+        with open(self.tokens_file, 'r') as f:
+            tokens_data = json.load(f)
+        self._validate(tokens_data)
+        index = _TokenIndex(tokens_data)
+        # Built up front so the first requests after the swap hit warm caches
+        index.get_all_tokens_json()
+        return tokens_data, index
+    
+    @staticmethod
+    def _validate(tokens_data: Dict):
+        tokens = tokens_data.get("tokens") if isinstance(tokens_data, dict) else None
+        if not isinstance(tokens, dict) or not tokens:
+            raise ValueError("no tokens")
+        addresses = {}
+        for name, data in tokens.items():
+            if not isinstance(data, dict):
+                raise ValueError(f"{name}: not an object")
+            if not isinstance(data.get("symbol"), str) or not data["symbol"]:
+                raise ValueError(f"{name}: missing symbol")
+            if not isinstance(data.get("address"), str) or not data["address"].startswith("0x"):
+                raise ValueError(f"{name}: invalid address")
+            address = int(data["address"], 16)
+            if address in addresses:
+                raise ValueError(f"{name}: same address as {addresses[address]}")
+            addresses[address] = name
+            if not isinstance(data.get("decimals"), int):
+                raise ValueError(f"{name}: invalid decimals")
+            float(data.get("balance", 0))
+    
+    def _stat_tokens_file(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.tokens_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
     
     def _load_tokens(self) -> Dict:
         """Load token data from JSON file"""
@@ -79,87 +336,185 @@ class TokenService:
         self.tokens_file.parent.mkdir(parents=True, exist_ok=True)
         
         # Save default tokens
-        with open(self.tokens_file, 'w') as f:
-            json.dump(default_tokens, f, indent=2)
+        self._write_snapshot(default_tokens)
         
         return default_tokens
     
-    def get_all_tokens(self) -> List[Dict]:
-        """Get all tokens with their details"""
-        tokens = []
-        for name, data in self.tokens_data.get("tokens", {}).items():
-            tokens.append({
-                "name": name,
-                "symbol": data["symbol"],
-                "address": data["address"],
-                "decimals": data["decimals"],
-                "balance": float(data.get("balance", 0)),
-                "total_supply": data.get("total_supply", "0")
-            })
-        return tokens
+    def _replay_journal(self):
+        """Apply balance updates journaled since the tokens file was last written."""
+        tokens = self.tokens_data.get("tokens", {})
+        # Oldest first: a journal left aside by an interrupted compaction
+        for journal_file in (self.compacting_file, self.journal_file):
+            if not journal_file.exists():
+                continue
+            with open(journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        continue
+                    if entry.get("name") in tokens:
+                        tokens[entry["name"]]["balance"] = entry["balance"]
+                    self._journal_entries += 1
+    
+    def get_all_tokens(self) -> Sequence[Mapping]:
+        """Get all tokens with their details (shared, read-only views)"""
+        return self._index.get_all_tokens()
     
-    def get_token_by_symbol(self, symbol: str) -> Optional[Dict]:
+    def get_all_tokens_json(self) -> bytes:
+        """get_all_tokens() encoded as a JSON response body"""
+        return self._index.get_all_tokens_json()
+    
+    def get_token_by_symbol(self, symbol: str) -> Optional[Mapping]:
         """Get token details by symbol"""
-        for name, data in self.tokens_data.get("tokens", {}).items():
-            if data["symbol"].upper() == symbol.upper():
-                return {
-                    "name": name,
-                    "symbol": data["symbol"],
-                    "address": data["address"],
-                    "decimals": data["decimals"],
-                    "balance": float(data.get("balance", 0)),
-                    "total_supply": data.get("total_supply", "0")
-                }
-        return None
+        return self._index.by_symbol.get(symbol.upper())
+    
+    def get_token_json(self, symbol: str) -> Optional[bytes]:
+        """get_token_by_symbol() encoded as a JSON response body"""
+        return self._index.json_by_symbol.get(symbol.upper())
     
     def get_token_balance(self, symbol: str) -> float:
         """Get balance for a specific token"""
-        token = self.get_token_by_symbol(symbol)
+        token = self._index.by_symbol.get(symbol.upper())
         return token["balance"] if token else 0.0
     
     def get_portfolio_value(self, prices: Dict[str, float]) -> Dict:
         """Calculate total portfolio value based on current prices"""
-        total_value = 0.0
-        holdings = []
-        
-        for name, data in self.tokens_data.get("tokens", {}).items():
-            symbol = data["symbol"]
-            balance = float(data.get("balance", 0))
-            price = prices.get(symbol, 0.0)
-            value = balance * price
-            total_value += value
-            
-            holdings.append({
-                "name": name,
-                "symbol": symbol,
-                "balance": balance,
-                "price": price,
-                "value": value,
-                "percentage": 0.0  # Will calculate after total
-            })
-        
-        # Calculate percentages
-        for holding in holdings:
-            holding["percentage"] = (holding["value"] / total_value * 100) if total_value > 0 else 0.0
-        
-        return {
-            "total_value": total_value,
-            "holdings": holdings
-        }
+        try:
+            engine = self._index.get_engine()
+        except (BalanceOverflow, DuplicateColumns):
+            # value_holdings falls back to Decimal for these listings
+            engine = None
+        return value_holdings(self.get_all_tokens(), prices, engine)
     
     def update_token_balance(self, symbol: str, new_balance: float) -> bool:
         """Update token balance"""
-        for name, data in self.tokens_data.get("tokens", {}).items():
-            if data["symbol"].upper() == symbol.upper():
-                data["balance"] = str(new_balance)
-                self._save_tokens()
-                return True
-        return False
-    
-    def _save_tokens(self):
-        """Save tokens data to file"""
-        with open(self.tokens_file, 'w') as f:
-            json.dump(self.tokens_data, f, indent=2)
+        with self._lock:
+            name = self._index.names_by_symbol.get(symbol.upper())
+            if name is None:
+                return False
+            self._acquire_writer_lock()
+            data = self.tokens_data["tokens"][name]
+            data["balance"] = str(new_balance)
+            self._append_journal({"name": name, "balance": data["balance"]})
+            self._index.set(name, data)
+            self.version += 1
+            compact = self._journal_entries >= self.compact_entries
+        if compact:
+            self._schedule_compaction()
+        return True
+    
+    def sync(self):
+        """Force journaled updates to disk."""
+        with self._lock:
+            if self._journal is not None and self._unsynced:
+                os.fsync(self._journal.fileno())
+                self._unsynced = 0
+                self._last_fsync = time.monotonic()
+    
+    def close(self):
+        """Fold the journal into the tokens file. Called on shutdown."""
+        if self._journal_entries or self.compacting_file.exists():
+            self._compact()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._writer_lock_fd is not None:
+                os.close(self._writer_lock_fd)
+                self._writer_lock_fd = None
+    
+    def _acquire_writer_lock(self):
+        if fcntl is None or self._writer_lock_fd is not None:
+            return
+        fd = os.open(self.writer_lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise JournalBusy(
+                f"{self.journal_file} is written by another process; update balances through that one"
+            )
+        self._writer_lock_fd = fd
+    
+    def _schedule_compaction(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. a script): nothing to keep responsive
+            self._compact()
+            return
+        if self._compaction is None or self._compaction.done():
+            self._compaction = loop.create_task(self._compact_in_background())
+    
+    async def _compact_in_background(self):
+        try:
+            await asyncio.to_thread(self._compact)
+        except Exception as e:
+            # The journal stays in place and is compacted on the next attempt
+            print(f"Token journal compaction failed: {e}")
+    
+    def _append_journal(self, entry: Dict):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a')
+        self._journal.write(json.dumps(entry) + "\n")
+        # Flushed right away so a process crash loses nothing; fsync is batched
+        self._journal.flush()
+        self._journal_entries += 1
+        self._unsynced += 1
+        now = time.monotonic()
+        if self._unsynced >= self.fsync_batch or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
+            self._last_fsync = now
+    
+    def _compact(self):
+        """
+        Write the current balances to the tokens file and start a new journal.
+
+        Only moving the journal aside happens under the lock; updates made
+        while the snapshot is written go to the new journal.
+        """
+        with self._compact_lock:
+            with self._lock:
+                snapshot = json.loads(json.dumps(self.tokens_data))
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                if self.journal_file.exists():
+                    if self.compacting_file.exists():
+                        # Left by a failed compaction; keep its entries ahead of ours
+                        with open(self.journal_file, 'r') as src, open(self.compacting_file, 'a') as dst:
+                            shutil.copyfileobj(src, dst)
+                            dst.flush()
+                            os.fsync(dst.fileno())
+                        self.journal_file.unlink()
+                    else:
+                        os.replace(self.journal_file, self.compacting_file)
+                self._journal_entries = 0
+                self._unsynced = 0
+            
+            self._write_snapshot(snapshot)
+            # Only after the snapshot is in place; a crash before this replays the old journal
+            self.compacting_file.unlink(missing_ok=True)
+    
+    def _write_snapshot(self, tokens_data: Dict):
+        """Atomically replace the tokens file."""
+        tmp_file = self.tokens_file.with_name(self.tokens_file.name + ".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(tokens_data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.tokens_file)
+        # Our own write is not a reload
+        with self._lock:
+            self._file_signature = self._stat_tokens_file()
 
 # Global instance
-token_service = TokenService()
+token_service = TokenService(
+    fsync_batch=settings.TOKEN_JOURNAL_FSYNC_BATCH,
+    fsync_interval=settings.TOKEN_JOURNAL_FSYNC_INTERVAL_SECONDS,
+    compact_entries=settings.TOKEN_JOURNAL_COMPACT_ENTRIES,
+    poll_interval=settings.TOKEN_REGISTRY_POLL_INTERVAL_SECONDS
+)
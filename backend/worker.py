@@ -0,0 +1,50 @@
+"""
+Standalone job worker - run one or more of these next to the API to scale
+strategy execution horizontally:
+
+    python worker.py
+
+Set JOB_WORKERS_IN_PROCESS=false on the API servers to leave all jobs to
+dedicated workers. Requires JOB_QUEUE_BACKEND=redis. Give each worker
+process on a host its own WRITE_BEHIND_WORKER_SPOOL_PATH.
+"""
+import asyncio
+import signal
+
+from app.config import settings
+from app.db.supabase import init_supabase, close_supabase
+from app.services.write_behind import write_behind
+from app.services.session_key_registry import session_key_registry
+from app.services.job_queue import get_job_queue
+from app.services.job_worker import JobWorker
+# Importing the executor registers its job handler
+import app.services.strategy_executor  # noqa: F401
+
+
+async def main():
+    if settings.JOB_QUEUE_BACKEND == "memory":
+        print("⚠️  JOB_QUEUE_BACKEND=memory is process-local; this worker will never see API jobs.")
+    
+    await init_supabase()
+    write_behind.spool_path = settings.WRITE_BEHIND_WORKER_SPOOL_PATH
+    await write_behind.start()
+    await session_key_registry.start()
+    worker = JobWorker(get_job_queue(), settings.JOB_WORKER_CONCURRENCY)
+    await worker.start()
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    
+    print("👋 Job worker shutting down...")
+    await worker.stop()
+    await get_job_queue().close()
+    await session_key_registry.stop()
+    await write_behind.stop()
+    await close_supabase()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
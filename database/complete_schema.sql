@@ -31,6 +31,9 @@ CREATE TABLE IF NOT EXISTS user_profiles (
     
     -- Portfolio Data
     vault_balance_usd NUMERIC DEFAULT 0,
+    vault_balance TEXT DEFAULT '0',  -- wei, written by /api/transactions
+    last_balance_sync TIMESTAMP WITH TIME ZONE,
+    risk_tolerance INTEGER DEFAULT 5,
     
     -- UI Preferences
     theme TEXT DEFAULT 'dark' CHECK (theme IN ('dark', 'light')),
@@ -47,6 +50,11 @@ CREATE TABLE IF NOT EXISTS user_profiles (
     UNIQUE(ethereum_address)
 );
 
+-- Columns the backend writes, for databases created before they were added
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS vault_balance TEXT DEFAULT '0';
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS last_balance_sync TIMESTAMP WITH TIME ZONE;
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS risk_tolerance INTEGER DEFAULT 5;
+
 -- Enable Row Level Security
 ALTER TABLE user_profiles ENABLE ROW LEVEL SECURITY;
 
@@ -136,6 +144,9 @@ CREATE INDEX idx_session_keys_user_id ON session_keys(user_id);
 CREATE INDEX idx_session_keys_status ON session_keys(status);
 CREATE INDEX idx_session_keys_expiry ON session_keys(expiry_timestamp);
 CREATE INDEX idx_session_keys_public_key ON session_keys(public_key);
+-- Newest active key per user (session key registry misses)
+CREATE INDEX idx_session_keys_user_active
+    ON session_keys(user_id, created_at DESC) WHERE status = 'active';
 
 
 -- ================================================
@@ -187,12 +198,42 @@ CREATE POLICY "Service role can manage all transactions"
     USING (auth.role() = 'service_role');
 
 -- Indexes for performance
-CREATE INDEX idx_transaction_log_user_id ON transaction_log(user_id);
+-- Keyset pagination of a user's history: WHERE user_id = ? AND (timestamp, id) < cursor
+-- ORDER BY timestamp DESC, id DESC. Also serves plain user_id lookups.
+DROP INDEX IF EXISTS idx_transaction_log_user_id;
+CREATE INDEX idx_transaction_log_user_timestamp_id
+    ON transaction_log(user_id, timestamp DESC, id DESC) INCLUDE (action, status);
 CREATE INDEX idx_transaction_log_timestamp ON transaction_log(timestamp DESC);
 CREATE INDEX idx_transaction_log_tx_hash ON transaction_log(tx_hash);
 CREATE INDEX idx_transaction_log_status ON transaction_log(status);
 CREATE INDEX idx_transaction_log_session_key_id ON transaction_log(session_key_id);
 
+-- Per-user running totals, kept current by a trigger on transaction_log
+-- (see apply_transaction_stats below) so stats are one row read per user
+CREATE TABLE IF NOT EXISTS transaction_stats (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    total_transactions BIGINT NOT NULL DEFAULT 0,
+    total_deposits NUMERIC NOT NULL DEFAULT 0,
+    total_withdrawals NUMERIC NOT NULL DEFAULT 0,
+    total_trades BIGINT NOT NULL DEFAULT 0,
+    successful_trades BIGINT NOT NULL DEFAULT 0,
+    -- Bumped on every change to the user's transactions (API ETags)
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE transaction_stats ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+ALTER TABLE transaction_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own transaction stats"
+    ON transaction_stats FOR SELECT
+    USING (auth.uid() = user_id);
+
+CREATE POLICY "Service role can manage all transaction stats"
+    ON transaction_stats FOR ALL
+    USING (auth.role() = 'service_role');
+
 
 -- ================================================
 -- 4. MARKET DATA TABLE
@@ -275,6 +316,45 @@ CREATE INDEX idx_user_sessions_session_token ON user_sessions(session_token);
 CREATE INDEX idx_user_sessions_active ON user_sessions(active);
 
 
+-- ================================================
+-- 5b. PORTFOLIO VALUE HISTORY
+-- ================================================
+-- OHLC rollups of each user's portfolio value at 1 minute, 1 hour and 1 day
+-- resolution. Every snapshot updates all three buckets (see
+-- record_portfolio_snapshot), so charts read one resolution with a single
+-- primary key range scan and never replay raw history.
+
+CREATE TABLE IF NOT EXISTS portfolio_value_history (
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    resolution TEXT NOT NULL CHECK (resolution IN ('1m', '1h', '1d')),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    
+    -- Value in USD over the bucket
+    open_usd NUMERIC NOT NULL,
+    high_usd NUMERIC NOT NULL,
+    low_usd NUMERIC NOT NULL,
+    close_usd NUMERIC NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 1,
+    
+    -- Holdings at the last snapshot in the bucket ({symbol: balance})
+    holdings JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    
+    PRIMARY KEY (user_id, resolution, bucket_start)
+);
+
+-- Enable Row Level Security
+ALTER TABLE portfolio_value_history ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own portfolio history"
+    ON portfolio_value_history FOR SELECT
+    USING (auth.uid() = user_id);
+
+CREATE POLICY "Service role can manage all portfolio history"
+    ON portfolio_value_history FOR ALL
+    USING (auth.role() = 'service_role');
+
+
 -- ================================================
 -- 6. FUNCTIONS AND TRIGGERS
 -- ================================================
@@ -299,6 +379,127 @@ CREATE TRIGGER update_session_keys_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Add (p_sign = 1) or remove (p_sign = -1) one transaction from its user's totals
+CREATE OR REPLACE FUNCTION transaction_stats_delta(
+    p_user_id UUID,
+    p_action TEXT,
+    p_status TEXT,
+    p_amount NUMERIC,
+    p_sign INTEGER
+)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO transaction_stats AS s (
+        user_id, total_transactions, total_deposits, total_withdrawals,
+        total_trades, successful_trades, version, updated_at
+    )
+    VALUES (
+        p_user_id,
+        p_sign,
+        CASE WHEN p_action = 'deposit' THEN p_sign * COALESCE(p_amount, 0) ELSE 0 END,
+        CASE WHEN p_action = 'withdraw' THEN p_sign * COALESCE(p_amount, 0) ELSE 0 END,
+        CASE WHEN p_action = 'trade' THEN p_sign ELSE 0 END,
+        CASE WHEN p_action = 'trade' AND p_status = 'confirmed' THEN p_sign ELSE 0 END,
+        1,
+        NOW()
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_transactions = s.total_transactions + EXCLUDED.total_transactions,
+        total_deposits = s.total_deposits + EXCLUDED.total_deposits,
+        total_withdrawals = s.total_withdrawals + EXCLUDED.total_withdrawals,
+        total_trades = s.total_trades + EXCLUDED.total_trades,
+        successful_trades = s.successful_trades + EXCLUDED.successful_trades,
+        version = s.version + 1,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Keep transaction_stats in step with transaction_log
+CREATE OR REPLACE FUNCTION apply_transaction_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM transaction_stats_delta(OLD.user_id, OLD.action, OLD.status, OLD.amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM transaction_stats_delta(NEW.user_id, NEW.action, NEW.status, NEW.amount, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fires on every update, not only of the counted columns, so version also
+-- changes when e.g. tx_hash or confirmed_at is filled in
+DROP TRIGGER IF EXISTS update_transaction_stats ON transaction_log;
+CREATE TRIGGER update_transaction_stats
+    AFTER INSERT OR DELETE OR UPDATE ON transaction_log
+    FOR EACH ROW
+    EXECUTE FUNCTION apply_transaction_stats();
+
+-- Rebuild transaction_stats from scratch, e.g. after enabling the trigger on existing data
+CREATE OR REPLACE FUNCTION refresh_transaction_stats()
+RETURNS void AS $$
+BEGIN
+    DELETE FROM transaction_stats;
+    INSERT INTO transaction_stats (
+        user_id, total_transactions, total_deposits, total_withdrawals,
+        total_trades, successful_trades
+    )
+    SELECT
+        user_id,
+        COUNT(*),
+        COALESCE(SUM(amount) FILTER (WHERE action = 'deposit'), 0),
+        COALESCE(SUM(amount) FILTER (WHERE action = 'withdraw'), 0),
+        COUNT(*) FILTER (WHERE action = 'trade'),
+        COUNT(*) FILTER (WHERE action = 'trade' AND status = 'confirmed')
+    FROM transaction_log
+    GROUP BY user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_transaction_stats();
+
+-- Fold one portfolio value snapshot into its 1m, 1h and 1d buckets
+CREATE OR REPLACE FUNCTION record_portfolio_snapshot(
+    p_user_id UUID,
+    p_value_usd NUMERIC,
+    p_holdings JSONB DEFAULT NULL,
+    p_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO portfolio_value_history AS h (
+        user_id, resolution, bucket_start,
+        open_usd, high_usd, low_usd, close_usd, samples, holdings, updated_at
+    )
+    SELECT p_user_id, r.resolution, date_trunc(r.unit, p_at),
+           p_value_usd, p_value_usd, p_value_usd, p_value_usd, 1, p_holdings, NOW()
+    FROM (VALUES ('1m', 'minute'), ('1h', 'hour'), ('1d', 'day')) AS r(resolution, unit)
+    ON CONFLICT (user_id, resolution, bucket_start) DO UPDATE SET
+        high_usd = GREATEST(h.high_usd, EXCLUDED.high_usd),
+        low_usd = LEAST(h.low_usd, EXCLUDED.low_usd),
+        close_usd = EXCLUDED.close_usd,
+        samples = h.samples + 1,
+        holdings = COALESCE(EXCLUDED.holdings, h.holdings),
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop fine-grained history once coarser buckets cover it
+CREATE OR REPLACE FUNCTION prune_portfolio_value_history(
+    p_minute_retention INTERVAL DEFAULT INTERVAL '2 days',
+    p_hour_retention INTERVAL DEFAULT INTERVAL '90 days',
+    p_day_retention INTERVAL DEFAULT INTERVAL '5 years'
+)
+RETURNS void AS $$
+BEGIN
+    DELETE FROM portfolio_value_history
+    WHERE (resolution = '1m' AND bucket_start < NOW() - p_minute_retention)
+       OR (resolution = '1h' AND bucket_start < NOW() - p_hour_retention)
+       OR (resolution = '1d' AND bucket_start < NOW() - p_day_retention);
+END;
+$$ LANGUAGE plpgsql;
+
 -- Function to update last_login_at
 CREATE OR REPLACE FUNCTION update_last_login()
 RETURNS TRIGGER AS $$
@@ -415,6 +616,13 @@ GROUP BY p.user_id, p.starknet_address, p.vault_balance_usd, p.risk_profile, p.a
 --     $$ SELECT cleanup_inactive_sessions(); $$
 -- );
 
+-- Apply portfolio history retention hourly
+-- SELECT cron.schedule(
+--     'prune-portfolio-value-history',
+--     '15 * * * *',
+--     $$ SELECT prune_portfolio_value_history(); $$
+-- );
+
 
 -- ================================================
 -- 9. INITIAL DATA / SEED DATA
@@ -12,11 +12,19 @@ DROP VIEW IF EXISTS recent_transactions CASCADE;
 DROP VIEW IF EXISTS active_session_keys_count CASCADE;
 DROP TRIGGER IF EXISTS update_session_keys_updated_at ON session_keys CASCADE;
 DROP TRIGGER IF EXISTS update_user_profiles_updated_at ON user_profiles CASCADE;
+DROP TRIGGER IF EXISTS update_transaction_stats ON transaction_log CASCADE;
 DROP FUNCTION IF EXISTS update_updated_at_column() CASCADE;
 DROP FUNCTION IF EXISTS expire_session_keys() CASCADE;
 DROP FUNCTION IF EXISTS cleanup_inactive_sessions() CASCADE;
 DROP FUNCTION IF EXISTS logout_user(UUID) CASCADE;
+DROP FUNCTION IF EXISTS apply_transaction_stats() CASCADE;
+DROP FUNCTION IF EXISTS transaction_stats_delta(UUID, TEXT, TEXT, NUMERIC, INTEGER) CASCADE;
+DROP FUNCTION IF EXISTS refresh_transaction_stats() CASCADE;
+DROP FUNCTION IF EXISTS record_portfolio_snapshot(UUID, NUMERIC, JSONB, TIMESTAMP WITH TIME ZONE) CASCADE;
+DROP FUNCTION IF EXISTS prune_portfolio_value_history(INTERVAL, INTERVAL, INTERVAL) CASCADE;
 DROP TABLE IF EXISTS user_sessions CASCADE;
+DROP TABLE IF EXISTS transaction_stats CASCADE;
+DROP TABLE IF EXISTS portfolio_value_history CASCADE;
 DROP TABLE IF EXISTS transaction_log CASCADE;
 DROP TABLE IF EXISTS market_data CASCADE;
 DROP TABLE IF EXISTS session_keys CASCADE;
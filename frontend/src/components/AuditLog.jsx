@@ -1,16 +1,28 @@
-import { useQuery } from '@tanstack/react-query'
+import { useInfiniteQuery } from '@tanstack/react-query'
 import { Clock, CheckCircle, XCircle } from 'lucide-react'
 import api from '../lib/api'
+import { useAuth } from '../contexts/AuthContext'
+
+const PAGE_SIZE = 20
 
 export default function AuditLog() {
-  const { data: transactions, isLoading } = useQuery({
-    queryKey: ['transactions'],
-    queryFn: async () => {
-      const response = await api.get('/api/transactions')
+  const { user } = useAuth()
+
+  const { data, isLoading, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
+    queryKey: ['transactions', user?.id],
+    queryFn: async ({ pageParam }) => {
+      const response = await api.get('/api/transactions', {
+        params: { user_id: user.id, limit: PAGE_SIZE, cursor: pageParam || undefined },
+      })
       return response.data
     },
+    initialPageParam: null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor,
+    enabled: !!user?.id,
   })
 
+  const transactions = data?.pages.flatMap((page) => page.transactions)
+
   if (isLoading) {
     return (
       <div className="card">
@@ -64,6 +76,16 @@ export default function AuditLog() {
               </div>
             </div>
           ))}
+
+          {hasNextPage && (
+            <button
+              onClick={() => fetchNextPage()}
+              disabled={isFetchingNextPage}
+              className="w-full py-2 text-sm text-gray-400 hover:text-white transition-colors"
+            >
+              {isFetchingNextPage ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>